@@ -0,0 +1,445 @@
+import pandas as pd
+import numpy as np
+from cache import cached
+from db import get_collection
+from call_data import filter_query, call_conditions, trimmed_calls_stage, parse_age, LOCAL_TIMEZONE
+from histograms import DurationHistogram, BUCKET_MINUTES
+
+MILLISECONDS_PER_DAY = 24 * 60 * 60 * 1000
+
+# $dayOfWeek de MongoDB va de 1 (domingo) a 7 (sábado)
+mongo_day_translation = {
+    1: "Domingo",
+    2: "Lunes",
+    3: "Martes",
+    4: "Miércoles",
+    5: "Jueves",
+    6: "Viernes",
+    7: "Sábado"
+}
+days_of_week = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+
+
+# Únicos campos que usan las etapas después del $unwind
+PIPELINE_PROJECTION = {
+    "_id": 0,
+    "user_age": 1,
+    "user_gender": 1,
+    "calls.call_start_time": 1,
+    "calls.call_duration.original_total_time": 1,
+}
+
+
+def calls_pipeline(type_call, *stages, filters=None):
+    """
+    Inicio común de los pipelines: filtra los documentos (usando los índices),
+    deja en `calls` solo las llamadas del tipo indicado que cumplen los filtros,
+    con los campos que se usan, y las desenrolla antes de las etapas recibidas.
+    """
+    return [
+        {"$match": filter_query({"calls.type_call": type_call}, filters)},
+        trimmed_calls_stage(PIPELINE_PROJECTION, call_conditions(filters, type_call)),
+        {"$unwind": "$calls"},
+        *stages
+    ]
+
+
+def parsed_start_time(call_start_time):
+    # Fecha del texto UTC sin zona horaria, sin fracciones de segundo (null si no es válida)
+    return {
+        "$dateFromString": {
+            "dateString": {"$arrayElemAt": [{"$split": [call_start_time, "."]}, 0]},
+            "timezone": "UTC",
+            "onError": None,
+            "onNull": None
+        }
+    }
+
+
+def parsed_start_time_stages():
+    """
+    Etapas que convierten `calls.call_start_time` (texto UTC sin zona horaria) en
+    fecha, descartando las fracciones de segundo y las fechas mal formadas.
+    """
+    return [
+        {"$match": {"calls.call_start_time": {"$type": "string", "$ne": ""}}},
+        {"$project": {"call_start_time": parsed_start_time("$calls.call_start_time")}},
+        {"$match": {"call_start_time": {"$ne": None}}},
+    ]
+
+
+def count_by(expression):
+    return {"$group": {"_id": expression, "count": {"$sum": 1}}}
+
+
+@cached
+def aggregate_inbound_calls_by_day(filters=None):
+    buckets = get_collection().aggregate(calls_pipeline(
+        "inbound",
+        *parsed_start_time_stages(),
+        count_by({"$dayOfWeek": "$call_start_time"}),
+        filters=filters
+    ))
+
+    counts = {mongo_day_translation[bucket["_id"]]: bucket["count"] for bucket in buckets}
+    if not counts:
+        return pd.Series(dtype=int)
+
+    inbound_calls_by_day = pd.Series(counts, name="count").reindex(days_of_week, fill_value=0)
+    inbound_calls_by_day.index = pd.CategoricalIndex(
+        inbound_calls_by_day.index,
+        categories=days_of_week,
+        ordered=True,
+        name="day_of_week"
+    )
+
+    return inbound_calls_by_day.sort_index()
+
+
+@cached
+def aggregate_inbound_calls_by_hour(filters=None):
+    # La hora se calcula en la zona horaria de México Central
+    buckets = get_collection().aggregate(calls_pipeline(
+        "inbound",
+        *parsed_start_time_stages(),
+        count_by({"$hour": {"date": "$call_start_time", "timezone": LOCAL_TIMEZONE}}),
+        filters=filters
+    ))
+
+    counts = {bucket["_id"]: bucket["count"] for bucket in buckets}
+    if not counts:
+        return pd.Series(dtype=int)
+
+    return (
+        pd.Series(counts, name="count")
+        .reindex(range(24), fill_value=0)
+        .rename_axis("hour_of_day")
+    )
+
+
+def inbound_by_gender_pipeline(filters=None):
+    return [
+        {"$match": {"user_gender": {"$nin": [None, ""]}}},
+        *calls_pipeline("inbound", count_by("$user_gender"), filters=filters)
+    ]
+
+
+@cached
+def aggregate_inbound_calls_by_gender(filters=None):
+    buckets = get_collection().aggregate(inbound_by_gender_pipeline(filters))
+
+    counts = {bucket["_id"]: bucket["count"] for bucket in buckets}
+    if not counts:
+        return pd.Series(dtype=int)
+
+    return (
+        pd.Series(counts, name="count")
+        .rename_axis("gender")
+        .sort_values(ascending=False, kind="stable")
+    )
+
+
+def aggregate_calls_by_duration(type_call, filters=None):
+    """
+    Histograma de duración en rangos de 5 minutos. MongoDB regresa el conteo por
+    rango y la duración máxima; los intervalos se arman igual que en pandas.
+    """
+    buckets = get_collection().aggregate(calls_pipeline(
+        type_call,
+        {"$match": {"calls.call_duration.original_total_time": {"$type": "number"}}},
+        {"$project": {"call_duration": {"$divide": ["$calls.call_duration.original_total_time", 60]}}},
+        {"$group": {
+            "_id": {"$floor": {"$divide": ["$call_duration", BUCKET_MINUTES]}},
+            "count": {"$sum": 1},
+            "max_duration": {"$max": "$call_duration"}
+        }},
+        filters=filters
+    ))
+
+    histogram = DurationHistogram()
+    for bucket in buckets:
+        histogram.add_bucket(int(bucket["_id"]), bucket["count"], bucket["max_duration"])
+    return histogram.to_series()
+
+
+@cached
+def aggregate_inbound_calls_by_duration(filters=None):
+    return aggregate_calls_by_duration("inbound", filters)
+
+
+@cached
+def aggregate_outbound_calls_by_duration(filters=None):
+    return aggregate_calls_by_duration("outbound", filters)
+
+
+@cached
+def aggregate_outbound_calls_by_week(filters=None):
+    # Lunes de la semana de cada llamada: $dayOfWeek va de domingo (1) a sábado (7)
+    days_since_monday = {"$mod": [{"$add": [{"$dayOfWeek": "$call_start_time"}, 5]}, 7]}
+    week_start = {"$subtract": ["$call_start_time", {"$multiply": [days_since_monday, MILLISECONDS_PER_DAY]}]}
+    week_end = {"$subtract": ["$call_start_time", {"$multiply": [{"$subtract": [days_since_monday, 6]}, MILLISECONDS_PER_DAY]}]}
+
+    buckets = get_collection().aggregate(calls_pipeline(
+        "outbound",
+        *parsed_start_time_stages(),
+        count_by({"$concat": [
+            {"$dateToString": {"date": week_start, "format": "%d/%m/%y"}},
+            " - ",
+            {"$dateToString": {"date": week_end, "format": "%d/%m/%y"}}
+        ]}),
+        filters=filters
+    ))
+
+    counts = {bucket["_id"]: bucket["count"] for bucket in buckets}
+    if not counts:
+        return pd.Series(dtype=int)
+
+    weekly_calls = pd.Series(counts, name="count").rename_axis("week_interval")
+
+    # Ordena las semanas por fecha
+    return weekly_calls.sort_index(key=lambda x: pd.to_datetime([interval.split(" - ")[0] for interval in x]))
+
+
+@cached
+def aggregate_inbound_calls_by_age(filters=None):
+    # MongoDB cuenta las llamadas por edad (guardada como texto); los rangos se arman aquí
+    buckets = get_collection().aggregate(calls_pipeline("inbound", count_by("$user_age"), filters=filters))
+
+    counts = pd.Series({
+        bucket["_id"]: bucket["count"] for bucket in buckets if (parse_age(bucket["_id"]) or 0) >= 60
+    }, dtype=int)
+    if counts.empty:
+        return pd.Series(dtype=int)
+
+    # Edades escritas distinto ("60" y "060") caen en el mismo rango
+    ages = counts.index.map(parse_age)
+    bins = np.arange(60, ages.max() + 5, 5)
+    labels = [str(interval) for interval in pd.IntervalIndex.from_breaks(bins)]
+    age_range = pd.cut(ages, bins=bins, labels=labels)
+    return counts.groupby(pd.Series(age_range, index=counts.index, name="age_range_str"), observed=False).sum()
+
+
+def outbound_users_pipeline(*stages, filters=None):
+    """
+    Un documento por usuario con al menos una llamada outbound que cumple los
+    filtros, con su edad y género, antes de las etapas recibidas.
+    """
+    return [
+        {"$match": filter_query({"calls.type_call": "outbound"}, filters)},
+        trimmed_calls_stage(
+            {"_id": 0, "user_id": 1, "user_age": 1, "user_gender": 1, "calls.type_call": 1},
+            call_conditions(filters, "outbound")
+        ),
+        {"$match": {"calls.0": {"$exists": True}}},
+        # Un usuario con varios documentos cuenta una sola vez
+        {"$group": {"_id": "$user_id", "user_age": {"$first": "$user_age"}, "user_gender": {"$first": "$user_gender"}}},
+        *stages
+    ]
+
+
+@cached
+def aggregate_outbound_users_by_age(filters=None):
+    buckets = get_collection().aggregate(outbound_users_pipeline(count_by("$user_age"), filters=filters))
+
+    counts = pd.Series({
+        bucket["_id"]: bucket["count"] for bucket in buckets if (parse_age(bucket["_id"]) or 0) >= 60
+    }, dtype=int)
+    if counts.empty:
+        return pd.Series(dtype=int)
+
+    ages = counts.index.map(parse_age)
+    bins = np.arange(60, ages.max() + 5, 5)
+    labels = [str(interval) for interval in pd.IntervalIndex.from_breaks(bins)]
+    age_range = pd.Series(pd.cut(ages, bins=bins, labels=labels), index=counts.index, name="age_range_str")
+    return counts.groupby(age_range, observed=True).sum().rename("user_id").sort_index()
+
+
+@cached
+def aggregate_outbound_users_by_gender(filters=None):
+    buckets = get_collection().aggregate(outbound_users_pipeline(
+        {"$match": {"user_gender": {"$nin": [None, ""]}}},
+        count_by("$user_gender"),
+        filters=filters
+    ))
+
+    counts = {bucket["_id"]: bucket["count"] for bucket in buckets}
+    if not counts:
+        return pd.Series(dtype=int)
+
+    return pd.Series(counts, name="user_id").rename_axis("gender").sort_index()
+
+
+def calls_distribution_pipeline(filters=None):
+    # Llamadas inbound por usuario, agrupadas por (llamadas, edad, género)
+    return [
+        {"$match": filter_query({"calls.type_call": "inbound"}, filters)},
+        trimmed_calls_stage(
+            {"_id": 0, "user_id": 1, "user_age": 1, "user_gender": 1, "calls.type_call": 1},
+            call_conditions(filters, "inbound")
+        ),
+        {"$group": {
+            "_id": "$user_id",
+            "user_age": {"$first": "$user_age"},
+            "user_gender": {"$first": "$user_gender"},
+            "num_calls": {"$sum": {"$size": "$calls"}},
+        }},
+        {"$match": {"num_calls": {"$gt": 0}}},
+        {"$group": {
+            "_id": {"num_calls": "$num_calls", "user_age": "$user_age", "user_gender": "$user_gender"},
+            "users": {"$sum": 1},
+        }},
+    ]
+
+
+@cached
+def aggregate_calls_distribution_counts(filters=None):
+    """
+    Versión en MongoDB de `inbound.get_calls_distribution_counts`: se cuentan las
+    llamadas inbound de cada usuario y se agrupan por (llamadas, género, edad),
+    así que solo se reciben esos grupos y no una fila por usuario.
+    """
+    from inbound import count_calls_distribution
+
+    buckets = get_collection().aggregate(calls_distribution_pipeline(filters))
+
+    users = pd.DataFrame([
+        {
+            "gender": bucket["_id"].get("user_gender"),
+            "age": parse_age(bucket["_id"].get("user_age")),
+            "num_calls": bucket["_id"]["num_calls"],
+            "users": bucket["users"],
+        }
+        for bucket in buckets
+    ], columns=["gender", "age", "num_calls", "users"])
+    if users.empty:
+        return pd.DataFrame()
+    # Edades no válidas como NaN, igual que en `calls_df`
+    users["age"] = users["age"].astype(float)
+    return count_calls_distribution(users)
+
+
+def topic_cube_pipeline(filters=None):
+    """
+    Pipeline del cubo de temas: cada tema de `times_by_subject` se desenrolla y
+    se suma por (tema, edad, género, mes).
+    """
+    # topics (y Altair) solo se importan cuando se usa la página de temas
+    from topics import TOPICS_QUERY, TOPICS_PROJECTION
+
+    # $split solo acepta textos: cualquier otro tipo de fecha queda sin mes
+    call_start_time = {"$cond": [
+        {"$eq": [{"$type": "$calls.call_start_time"}, "string"]}, "$calls.call_start_time", None
+    ]}
+    stages = [{"$match": filter_query(TOPICS_QUERY, filters)}]
+    if call_conditions(filters):
+        stages.append(trimmed_calls_stage(TOPICS_PROJECTION, call_conditions(filters)))
+    stages += [
+        {"$unwind": "$calls"},
+        {"$project": {
+            "user_age": 1,
+            "user_gender": 1,
+            "month": {"$dateToString": {"date": parsed_start_time(call_start_time), "format": "%Y-%m", "onNull": None}},
+            "subject": {"$objectToArray": {"$ifNull": ["$calls.analysis.times_by_subject", {}]}},
+        }},
+        {"$unwind": "$subject"},
+        {"$project": {
+            "user_age": 1,
+            "user_gender": 1,
+            "month": 1,
+            "topic": "$subject.k",
+            "bot_time": {"$ifNull": ["$subject.v.bot", 0]},
+            "persona_time": {"$ifNull": ["$subject.v.persona", 0]},
+        }},
+        {"$match": {"$expr": {"$gt": [{"$add": ["$bot_time", "$persona_time"]}, 0]}}},
+        {"$group": {
+            "_id": {"topic": "$topic", "user_age": "$user_age", "user_gender": "$user_gender", "month": "$month"},
+            "bot_time": {"$sum": "$bot_time"},
+            "persona_time": {"$sum": "$persona_time"},
+            "calls": {"$sum": 1},
+        }},
+    ]
+    return stages
+
+
+@cached
+def aggregate_topic_cube(filters=None):
+    """
+    Cubo de tiempos por (tema, edad, género, mes) calculado en MongoDB (ver
+    `topic_cube_pipeline`): solo se reciben los grupos y no una fila por
+    (llamada, tema).
+    """
+    # topics (y Altair) solo se importan cuando se usa la página de temas
+    from topics import older_user_age, sum_topic_cube, CUBE_KEYS, CUBE_MEASURES
+
+    rows = []
+    for bucket in get_collection().aggregate(topic_cube_pipeline(filters)):
+        # La edad se agrupa como texto; aquí se descartan las no válidas y las menores de 60
+        user_age = older_user_age(bucket["_id"])
+        if user_age is None:
+            continue
+        rows.append({
+            "topic": bucket["_id"].get("topic"),
+            "user_age": user_age,
+            "user_gender": bucket["_id"].get("user_gender"),
+            "month": bucket["_id"].get("month"),
+            "bot_time": bucket["bot_time"],
+            "persona_time": bucket["persona_time"],
+            "total_time": bucket["bot_time"] + bucket["persona_time"],
+            "calls": bucket["calls"],
+        })
+    # Edades escritas distinto ("60" y "060") caen en el mismo grupo
+    return sum_topic_cube(pd.DataFrame(rows, columns=CUBE_KEYS + CUBE_MEASURES))
+
+
+def check_aggregation_parity(calls_df, filters=None):
+    """
+    Compara cada histograma calculado en MongoDB contra su versión en pandas
+    (`calls_df` debe haberse extraído con los mismos filtros).
+    Regresa un diccionario {métrica: True/False}.
+    """
+    from inbound import (
+        get_inbound_calls_by_day,
+        get_inbound_calls_by_hour,
+        get_inbound_calls_by_gender,
+        get_inbound_calls_by_duration,
+        get_inbound_calls_by_age,
+        get_calls_distribution_counts,
+    )
+    from outbound import (
+        get_outbound_calls_by_week,
+        get_outbound_calls_by_duration,
+        get_outbound_calls_by_age,
+        get_outbound_calls_by_gender,
+    )
+
+    pairs = {
+        "inbound_calls_by_day": (aggregate_inbound_calls_by_day, get_inbound_calls_by_day),
+        "inbound_calls_by_hour": (aggregate_inbound_calls_by_hour, get_inbound_calls_by_hour),
+        "inbound_calls_by_gender": (aggregate_inbound_calls_by_gender, get_inbound_calls_by_gender),
+        "inbound_calls_by_duration": (aggregate_inbound_calls_by_duration, get_inbound_calls_by_duration),
+        "outbound_calls_by_week": (aggregate_outbound_calls_by_week, get_outbound_calls_by_week),
+        "outbound_calls_by_duration": (aggregate_outbound_calls_by_duration, get_outbound_calls_by_duration),
+        "inbound_calls_by_age": (aggregate_inbound_calls_by_age, get_inbound_calls_by_age),
+        "outbound_users_by_age": (aggregate_outbound_users_by_age, get_outbound_calls_by_age),
+        "outbound_users_by_gender": (aggregate_outbound_users_by_gender, get_outbound_calls_by_gender),
+    }
+
+    parity = {}
+    for name, (aggregated, computed) in pairs.items():
+        expected = computed(calls_df)
+        result = aggregated(filters)
+        parity[name] = (
+            list(result.index.astype(str)) == list(expected.index.astype(str))
+            and list(result.values) == list(expected.values)
+        )
+    parity["calls_distribution_counts"] = aggregate_calls_distribution_counts(filters).equals(
+        get_calls_distribution_counts(calls_df)
+    )
+    return parity
+
+
+if __name__ == "__main__":
+    from call_data import get_calls_data
+
+    for name, same in check_aggregation_parity(get_calls_data()).items():
+        print(f"{name}: {'OK' if same else 'DIFERENTE'}")
@@ -0,0 +1,302 @@
+import argparse
+import ast
+import json
+import subprocess
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+import pandas as pd
+import db
+import inbound
+import outbound
+import duration_calls
+import topics
+from call_data import build_calls_frame, build_calls_frame_from_columns, find_calls, find_call_columns
+from call_data import CALLS_QUERY, CALLS_PROJECTION, CALL_FIELDS
+from topics import build_topic_frame, build_topic_frame_from_columns, TOPICS_QUERY, TOPICS_PROJECTION, TOPIC_FIELDS
+from synthetic_data import generate_documents, load_documents, get_benchmark_collection, BENCHMARK_DATABASE
+from page_registry import PAGES
+
+# Número aproximado de llamadas de cada escala
+SCALES = [10_000, 100_000, 1_000_000]
+CALLS_PER_USER = 10
+
+# Un paso es regresión si tarda o usa más memoria que esta proporción de la línea base
+REGRESSION_TOLERANCE = 1.25
+# Por debajo de estos valores las diferencias son ruido de medición
+MIN_WALL_TIME = 0.005
+MIN_PEAK_MEMORY = 1024 * 1024
+
+# Funciones que extraen o preparan datos; no son métricas
+LOADERS = {"get_data_by_topic", "get_topic_cube"}
+# Funciones que reciben el resultado de otra función de métricas y no el DataFrame
+DERIVED = {
+    "inbound.get_calls_distribution": "inbound.get_calls_distribution_counts",
+    "inbound.get_calls_distribution_styler": "inbound.get_calls_distribution",
+}
+
+# Importa los módulos de argv[1] en un intérprete nuevo e imprime el tiempo y la
+# memoria máxima asignada (con tracemalloc solo si argv[2] es "memory")
+STARTUP_SCRIPT = """
+import importlib, json, sys, time, tracemalloc
+if sys.argv[2] == "memory":
+    tracemalloc.start()
+start = time.perf_counter()
+for name in sys.argv[1].split(","):
+    importlib.import_module(name)
+wall_time = time.perf_counter() - start
+peak_memory = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+print(json.dumps({"wall_time": wall_time, "peak_memory": peak_memory}))
+"""
+
+
+def metric_getters():
+    """
+    Todas las funciones de métricas de inbound, outbound, duration_calls y topics,
+    sin el caché (`__wrapped__`) para medir el cálculo y no la consulta al caché.
+    Regresa (nombre, función, usa el cubo de temas).
+    """
+    getters = []
+    for module in [inbound, outbound, duration_calls, topics]:
+        for name in sorted(dir(module)):
+            func = getattr(module, name)
+            if name.startswith("get_") and name not in LOADERS and getattr(func, "__module__", None) == module.__name__:
+                getters.append((f"{module.__name__}.{name}", getattr(func, "__wrapped__", func), module is topics))
+    return getters
+
+
+def measure(func, *args, repeat=1):
+    """
+    Tiempo de pared (el mejor de `repeat` ejecuciones) y memoria máxima asignada
+    durante una ejecución aparte, para que tracemalloc no afecte el tiempo.
+    """
+    wall_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        wall_times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return result, {"wall_time": min(wall_times), "peak_memory": peak_memory}
+
+
+def docs_examined(collection, query, projection):
+    from indexes import summarize_explain
+
+    return summarize_explain(collection.find(query, projection).explain())["docs_examined"]
+
+
+def benchmark_collection(use_mongo):
+    """
+    Colección vacía para los datos sintéticos: la de BENCHMARK_DATABASE en
+    MongoDB, o una de mongomock en el mismo proceso. En los dos casos las
+    funciones de datos (`find_calls`, `find_call_columns`) la usan a través de
+    `db.get_collection`, así que se mide la misma ruta que en el dashboard.
+    """
+    if use_mongo:
+        collection = get_benchmark_collection()
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("Sin --mongo el benchmark requiere mongomock (pip install -r requirements-dev.txt)")
+        collection = mongomock.MongoClient()[BENCHMARK_DATABASE]["call_information"]
+    collection.drop()
+    db.get_database = lambda: collection.database
+    return collection
+
+
+def run_scale(total_calls, use_mongo=False, repeat=3):
+    """
+    Carga ~`total_calls` llamadas y mide la extracción de los DataFrames (con
+    documentos por llamada y con columnas armadas en la base, ver COLUMNAR_FETCH)
+    y cada función de métricas sobre ellos.
+    """
+    users = max(1, total_calls // CALLS_PER_USER)
+
+    steps = {}
+    collection = benchmark_collection(use_mongo)
+    load_documents(collection, generate_documents(users, CALLS_PER_USER))
+    calls_df, steps["load_calls"] = measure(
+        lambda: build_calls_frame(find_calls(CALLS_QUERY, CALLS_PROJECTION))
+    )
+    topic_df, steps["load_topics"] = measure(
+        lambda: build_topic_frame(find_calls(TOPICS_QUERY, TOPICS_PROJECTION))
+    )
+    calls_columns_df, steps["load_calls_columns"] = measure(
+        lambda: build_calls_frame_from_columns(find_call_columns(CALLS_QUERY, CALLS_PROJECTION, CALL_FIELDS))
+    )
+    topic_columns_df, steps["load_topics_columns"] = measure(
+        lambda: build_topic_frame_from_columns(find_call_columns(TOPICS_QUERY, TOPICS_PROJECTION, TOPIC_FIELDS))
+    )
+    if use_mongo:
+        steps["load_calls"]["docs_scanned"] = docs_examined(collection, CALLS_QUERY, CALLS_PROJECTION)
+        steps["load_topics"]["docs_scanned"] = docs_examined(collection, TOPICS_QUERY, TOPICS_PROJECTION)
+    else:
+        # mongomock no tiene explain: recorre todos los documentos
+        steps["load_calls"]["docs_scanned"] = users
+        steps["load_topics"]["docs_scanned"] = users
+    steps["load_calls_columns"]["docs_scanned"] = steps["load_calls"]["docs_scanned"]
+    steps["load_topics_columns"]["docs_scanned"] = steps["load_topics"]["docs_scanned"]
+    steps["load_calls_columns"]["rows"] = len(calls_columns_df)
+    steps["load_topics_columns"]["rows"] = len(topic_columns_df)
+    steps["load_calls"]["rows"] = len(calls_df)
+    steps["load_topics"]["rows"] = len(topic_df)
+
+    topic_cube, steps["topic_cube"] = measure(topics.get_topic_cube.__wrapped__, topic_df, repeat=repeat)
+    steps["topic_cube"]["rows"] = len(topic_df)
+
+    outputs = {}
+    getters = metric_getters()
+    # Primero las que reciben el DataFrame, luego las que reciben su resultado
+    for name, func, uses_topics in sorted(getters, key=lambda getter: getter[0] in DERIVED):
+        df = topic_cube if uses_topics else calls_df
+        argument = outputs[DERIVED[name]] if name in DERIVED else df
+        outputs[name], steps[name] = measure(func, argument, repeat=repeat)
+        steps[name]["rows"] = len(df)
+
+    return {"users": users, "calls": len(calls_df), "steps": steps}
+
+
+def app_startup_modules(path="streamlit_app.py"):
+    """
+    Módulos que streamlit_app.py importa al inicio, en cualquier página.
+    """
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules.append(node.module)
+    return modules
+
+
+def run_startup(repeat=3):
+    """
+    Arranque en frío de cada página: importar en un proceso nuevo los módulos
+    iniciales de la app más el módulo de datos de la página.
+    """
+    def run(modules, mode):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, ",".join(modules), mode],
+            capture_output=True, text=True, check=True
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    steps = {}
+    for module_name in PAGES.values():
+        modules = app_startup_modules() + [module_name]
+        wall_time = min(run(modules, "time")["wall_time"] for _ in range(repeat))
+        steps[f"startup.{module_name}"] = {"wall_time": wall_time, "peak_memory": run(modules, "memory")["peak_memory"]}
+    return {"steps": steps}
+
+
+def run_benchmark(scales=SCALES, use_mongo=False):
+    results = {
+        "generated_at": datetime.utcnow().isoformat(),
+        "source": "mongo" if use_mongo else "mongomock",
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "scales": {},
+    }
+    for total_calls in scales:
+        print(f"Escala {total_calls} llamadas...")
+        results["scales"][str(total_calls)] = run_scale(total_calls, use_mongo)
+    print("Arranque de la app...")
+    results["startup"] = run_startup()
+    return results
+
+
+def incompatibilities(results, baseline):
+    """
+    Diferencias que impiden comparar contra una línea base: otra fuente de datos,
+    escalas que no tiene, o pasos que se agregaron o ya no existen. Con ellas la
+    comparación mediría contra otro benchmark, así que hay que regenerar la línea base.
+    """
+    problems = []
+    if baseline.get("source") != results["source"]:
+        problems.append(f"fuente {baseline.get('source')} en la línea base y {results['source']} ahora")
+    sections = [(scale, current, baseline.get("scales", {}).get(scale)) for scale, current in results["scales"].items()]
+    if "startup" in results:
+        sections.append(("startup", results["startup"], baseline.get("startup")))
+    for scale, current, base in sections:
+        if base is None:
+            problems.append(f"{scale}: no está en la línea base")
+            continue
+        for step in sorted(set(current["steps"]) - set(base["steps"])):
+            problems.append(f"{scale}: paso nuevo {step}")
+        for step in sorted(set(base["steps"]) - set(current["steps"])):
+            problems.append(f"{scale}: ya no se mide {step}")
+    return problems
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compara contra una línea base compatible (ver `incompatibilities`). Regresa
+    las regresiones como (escala, paso, medida, valor base, valor actual).
+    """
+    regressions = []
+    sections = [(scale, current, baseline["scales"][scale]) for scale, current in results["scales"].items()]
+    if "startup" in results:
+        sections.append(("startup", results["startup"], baseline["startup"]))
+    for scale, current, base_section in sections:
+        for step, measures in current["steps"].items():
+            base = base_section["steps"][step]
+            for measure_name, minimum in [("wall_time", MIN_WALL_TIME), ("peak_memory", MIN_PEAK_MEMORY)]:
+                if measures[measure_name] > max(base[measure_name] * tolerance, minimum):
+                    regressions.append((scale, step, measure_name, base[measure_name], measures[measure_name]))
+    return regressions
+
+
+def print_results(results):
+    for scale, current in results["scales"].items():
+        print(f"\n{scale} llamadas ({current['users']} usuarios, {current['calls']} filas)")
+        for step, measures in current["steps"].items():
+            print(
+                f"  {step}: {measures['wall_time'] * 1000:.1f} ms, "
+                f"{measures['peak_memory'] / 1024 / 1024:.1f} MB"
+            )
+    if "startup" in results:
+        print("\nArranque en frío por página")
+        for step, measures in results["startup"]["steps"].items():
+            print(f"  {step}: {measures['wall_time'] * 1000:.1f} ms, {measures['peak_memory'] / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide el tiempo y la memoria de las métricas del dashboard.")
+    parser.add_argument("--scales", default=",".join(str(scale) for scale in SCALES),
+                        help="Llamadas por escala, separadas por comas")
+    parser.add_argument("--mongo", action="store_true",
+                        help="Cargar los datos en MongoDB (BENCHMARK_DATABASE) en lugar de mongomock")
+    parser.add_argument("--output", default="benchmarks/results.json")
+    parser.add_argument("--compare", help="Línea base JSON contra la que se buscan regresiones")
+    args = parser.parse_args()
+
+    results = run_benchmark([int(scale) for scale in args.scales.split(",")], args.mongo)
+    print_results(results)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        problems = incompatibilities(results, baseline)
+        for problem in problems:
+            print(f"LÍNEA BASE INCOMPATIBLE: {problem}")
+        if problems:
+            sys.exit(f"Regenere {args.compare} con el benchmark actual")
+        regressions = compare(results, baseline)
+        for scale, step, measure_name, base, current in regressions:
+            print(f"REGRESIÓN {scale} {step} {measure_name}: {base:.4g} -> {current:.4g}")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,373 @@
+import streamlit as st
+import pandas as pd
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from functools import wraps
+from instrumentation import track_operation, record_cache_hit
+import disk_cache
+
+# Configuración del caché de resultados
+CACHE_TTL = st.secrets.get("CACHE_TTL", 600)  # Segundos que un resultado se considera vigente
+CACHE_MAX_ENTRIES = st.secrets.get("CACHE_MAX_ENTRIES", 256)
+CACHE_MAX_BYTES = st.secrets.get("CACHE_MAX_BYTES", 512 * 1024 * 1024)  # Memoria aproximada de los resultados guardados
+SIZE_SAMPLE_ROWS = 1000  # Filas que se miden para estimar la memoria de un DataFrame grande
+
+# Caché compartido por todas las sesiones del proceso: clave -> (expira_en, valor, bytes)
+_entries = OrderedDict()
+# Cálculos en curso: clave -> _Flight
+_in_flight = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "disk_hits": 0, "warmed": 0}
+_total_bytes = 0
+_version_counter = 0
+# Versión de los DataFrames marcados: id -> (referencia débil, versión, huella). La
+# referencia confirma que el id sigue siendo del mismo objeto y no de uno nuevo que
+# lo reutilizó, y al liberarse el DataFrame su entrada se borra
+_data_versions = {}
+_warm_thread = None
+
+
+class _Flight:
+    """
+    Cálculo en curso de una clave. Las sesiones que piden la misma clave mientras
+    tanto esperan su resultado (o su error) en lugar de repetir la consulta.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def _forget_data_version(key, reference):
+    # Se llama al liberar el DataFrame, antes de que otro objeto pueda tener su id
+    entry = _data_versions.get(key)
+    if entry is not None and entry[0] is reference:
+        del _data_versions[key]
+
+
+def set_data_version(df, version, fingerprint=None):
+    """
+    Marca un DataFrame con una versión de datos y, si viene de un resultado que se
+    guarda en disco, con su huella (ver `data_fingerprint`). La marca se guarda en
+    este módulo y no en `attrs`, así que las copias y filtros del DataFrame no la
+    heredan.
+    """
+    key = id(df)
+    _data_versions[key] = (weakref.ref(df, lambda reference: _forget_data_version(key, reference)), version, fingerprint)
+    return df
+
+
+def _marked_version(df):
+    entry = _data_versions.get(id(df))
+    if entry is not None and entry[0]() is df:
+        return entry
+    return None
+
+
+def data_version(df):
+    """
+    Versión de los datos de un DataFrame o Series, usada como parte de la clave
+    del caché. Si el objeto no fue marcado, se calcula un hash de su contenido.
+    """
+    entry = _marked_version(df)
+    if entry is not None:
+        return entry[1]
+    return int(pd.util.hash_pandas_object(df, index=True).sum())
+
+
+def data_fingerprint(df):
+    """
+    Identificador de los datos de un DataFrame o Series que se mantiene entre
+    reinicios, usado en la clave del caché en disco: la huella del resultado
+    guardado del que viene, o el hash de su contenido si no fue marcado. None si
+    viene de una función que no se guarda en disco.
+    """
+    entry = _marked_version(df)
+    if entry is not None:
+        return entry[2]
+    return str(data_version(df))
+
+
+def _key_part(value):
+    """
+    Parte de la clave para un argumento. Los diccionarios y conjuntos se ordenan
+    para que el orden de inserción no cambie la clave, y las listas y tuplas se
+    recorren para normalizar lo que contienen. Un argumento que no se puede
+    identificar por su contenido es un error: con su repr dos llamadas iguales
+    podrían no coincidir, o dos distintas compartir resultado.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return ("data", data_version(value))
+    if isinstance(value, dict):
+        items = ((_key_part(name), _key_part(item)) for name, item in value.items())
+        return ("dict", tuple(sorted(items, key=repr)))
+    if isinstance(value, (set, frozenset)):
+        return ("set", tuple(sorted((_key_part(item) for item in value), key=repr)))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(_key_part(item) for item in value))
+    try:
+        hash(value)
+    except TypeError:
+        raise TypeError(f"El argumento {type(value).__name__} no se puede usar en la clave del caché") from None
+    return value
+
+
+def _deep_bytes(value):
+    usage = value.memory_usage(index=True, deep=True)
+    return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+
+
+def estimate_bytes(value):
+    """
+    Memoria aproximada de un resultado. En DataFrames y Series grandes se mide una
+    muestra de filas: medir todas las columnas de texto tarda casi tanto como
+    construirlas.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        rows = len(value)
+        if rows <= SIZE_SAMPLE_ROWS:
+            return _deep_bytes(value)
+        sample = value.iloc[::rows // SIZE_SAMPLE_ROWS]
+        return int(_deep_bytes(sample) * rows / len(sample))
+    return sys.getsizeof(value)
+
+
+def _shared(value):
+    """
+    Vista de un resultado guardado para quien lo pidió. Los DataFrames y Series se
+    entregan como copias superficiales: no copian los datos, pero con copy-on-write
+    cualquier cambio de una sesión queda en su copia y no en el caché compartido.
+    """
+    if isinstance(value, pd.DataFrame):
+        copy = value.copy(deep=False)
+        return set_data_version(copy, data_version(value), data_fingerprint(value))
+    if isinstance(value, pd.Series):
+        return value.copy(deep=False)
+    return value
+
+
+def _evict():
+    # Descarta los resultados menos usados recientemente hasta cumplir los límites
+    global _total_bytes
+    while len(_entries) > 1 and (len(_entries) > CACHE_MAX_ENTRIES or _total_bytes > CACHE_MAX_BYTES):
+        _, (_, _, size) = _entries.popitem(last=False)
+        _total_bytes -= size
+        _stats["evictions"] += 1
+
+
+def make_key(func, args, kwargs):
+    return (
+        func.__module__,
+        func.__qualname__,
+        tuple(_key_part(arg) for arg in args),
+        tuple(sorted((name, _key_part(value)) for name, value in kwargs.items())),
+    )
+
+
+def disk_key(func, args, kwargs):
+    """
+    Clave de una llamada que se mantiene entre reinicios, para el caché en disco:
+    los DataFrames se identifican por su huella en lugar de su versión, que solo
+    vale en este proceso. None si alguno no tiene huella.
+    """
+    parts = []
+    for name, value in [(None, arg) for arg in args] + sorted(kwargs.items()):
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            fingerprint = data_fingerprint(value)
+            if fingerprint is None:
+                return None
+            parts.append((name, ("data", fingerprint)))
+        else:
+            parts.append((name, _key_part(value)))
+    return repr((func.__module__, func.__qualname__, tuple(parts)))
+
+
+def _stamp(value, fingerprint):
+    # Se llama con `_lock` tomado
+    global _version_counter
+    if isinstance(value, pd.DataFrame):
+        # Versión nueva para que los cálculos derivados no reutilicen datos viejos
+        _version_counter += 1
+        set_data_version(value, _version_counter, fingerprint)
+
+
+def _store(key, value, size, expires_at):
+    # Guarda un resultado en memoria; se llama con `_lock` tomado
+    global _total_bytes
+    previous = _entries.pop(key, None)
+    if previous is not None:
+        _total_bytes -= previous[2]
+    _entries[key] = (expires_at, value, size)
+    _total_bytes += size
+    _evict()
+
+
+def cached(func=None, persist=True):
+    """
+    Memoriza el resultado de una función de métricas según sus parámetros, con
+    vigencia CACHE_TTL y a lo más CACHE_MAX_ENTRIES resultados y CACHE_MAX_BYTES de
+    memoria (se descarta el menos usado recientemente). El caché es del proceso: si
+    varias sesiones piden el mismo resultado a la vez, solo una lo calcula y las
+    demás esperan. Cada llamada queda registrada en `instrumentation`.
+
+    Con USE_DISK_CACHE, lo que no está en memoria se busca antes en el caché en
+    disco (ver `disk_cache`), y lo calculado se guarda ahí para los siguientes
+    arranques del proceso. `@cached(persist=False)` lo desactiva para funciones
+    cuyos parámetros no identifican los datos entre procesos.
+    """
+    if func is None:
+        return lambda func: cached(func, persist=persist)
+
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        key = make_key(func, args, kwargs)
+        now = time.monotonic()
+
+        with _lock:
+            entry = _entries.get(key)
+            flight = None
+            leader = False
+            if entry is not None and entry[0] > now:
+                _entries.move_to_end(key)
+                _stats["hits"] += 1
+            else:
+                flight = _in_flight.get(key)
+                if flight is None:
+                    flight = _in_flight[key] = _Flight()
+                    leader = True
+                    _stats["misses"] += 1
+                else:
+                    _stats["coalesced"] += 1
+        if flight is None:
+            record_cache_hit(name)
+            return _shared(entry[1])
+        if not leader:
+            # Otra sesión ya está calculando este resultado: se espera el suyo
+            flight.done.wait()
+            record_cache_hit(name)
+            if flight.error is not None:
+                raise flight.error
+            return _shared(flight.value)
+
+        try:
+            with track_operation(name) as operation:
+                fingerprint = watermark = stored = None
+                if persist and disk_cache.USE_DISK_CACHE:
+                    stable_key = disk_key(func, args, kwargs)
+                    watermark = disk_cache.current_watermark() if stable_key is not None else None
+                    if watermark is not None:
+                        fingerprint = disk_cache.entry_fingerprint(stable_key, watermark)
+                        stored = disk_cache.read_entry(fingerprint)
+                value = stored[1] if stored is not None else func(*args, **kwargs)
+                if isinstance(value, (pd.DataFrame, pd.Series)):
+                    operation["rows"] = len(value)
+        except BaseException as e:
+            flight.error = e
+            with _lock:
+                if _in_flight.get(key) is flight:
+                    del _in_flight[key]
+            flight.done.set()
+            raise
+
+        size = estimate_bytes(value)
+        with _lock:
+            if stored is not None:
+                _stats["disk_hits"] += 1
+            _stamp(value, fingerprint)
+            # Si `clear_cache` descartó el cálculo mientras corría, el resultado no se guarda
+            if _in_flight.get(key) is flight:
+                del _in_flight[key]
+                _store(key, value, size, now + CACHE_TTL)
+        flight.value = value
+        flight.done.set()
+
+        if fingerprint is not None and stored is None:
+            uses_data = any(isinstance(arg, (pd.DataFrame, pd.Series)) for arg in list(args) + list(kwargs.values()))
+            disk_cache.write_entry(fingerprint, value, {
+                "name": name,
+                "fingerprint": fingerprint,
+                "watermark": watermark,
+                "created_at": time.time(),
+                # Solo las consultas que no dependen de otros DataFrames se cargan al arrancar
+                "memory_key": None if uses_data else key,
+            })
+
+        return _shared(value)
+
+    return wrapper
+
+
+def _warm_from_disk():
+    watermark = disk_cache.current_watermark()
+    if watermark is None:
+        return
+    with track_operation("cache.warm_from_disk") as operation:
+        operation["rows"] = 0
+        for metadata, value in disk_cache.warm_entries(watermark):
+            size = estimate_bytes(value)
+            with _lock:
+                key = metadata["memory_key"]
+                if key in _entries or key in _in_flight:
+                    # Una sesión ya lo pidió mientras se cargaba
+                    continue
+                _stamp(value, metadata["fingerprint"])
+                _store(key, value, size, time.monotonic() + CACHE_TTL)
+                _stats["warmed"] += 1
+            operation["rows"] += 1
+
+
+def start_warm_start():
+    """
+    Inicia (una sola vez por proceso y solo con USE_DISK_CACHE) la carga a memoria
+    de las consultas guardadas en disco con la marca de agua vigente, para que
+    las primeras páginas después de un reinicio no consulten MongoDB.
+    """
+    global _warm_thread
+    if not disk_cache.USE_DISK_CACHE:
+        return
+    with _lock:
+        if _warm_thread is None:
+            _warm_thread = threading.Thread(target=_warm_from_disk, name="disk-cache-warm", daemon=True)
+            _warm_thread.start()
+
+
+def clear_cache(func=None):
+    """
+    Invalida todos los resultados guardados (botón "Actualizar datos"), o solo
+    los de la función indicada; en ambos casos también los del caché en disco
+    (los de una función se reconocen por el nombre en sus metadatos). Los cálculos en
+    curso terminan, pero su resultado ya no se guarda. En ambos casos se vuelve a
+    leer la marca de agua de los datos antes de usar el disco.
+    """
+    global _total_bytes
+    if func is not None:
+        func = getattr(func, "__wrapped__", func)
+    if disk_cache.USE_DISK_CACHE:
+        if func is None:
+            disk_cache.clear()
+        else:
+            disk_cache.remove_entries(f"{func.__module__}.{func.__qualname__}")
+    with _lock:
+        if func is None:
+            _entries.clear()
+            _in_flight.clear()
+            _total_bytes = 0
+            return
+        prefix = (func.__module__, func.__qualname__)
+        for key in [key for key in _entries if key[:2] == prefix]:
+            _total_bytes -= _entries.pop(key)[2]
+        for key in [key for key in _in_flight if key[:2] == prefix]:
+            del _in_flight[key]
+
+
+def get_cache_stats():
+    with _lock:
+        stats = {**_stats, "entries": len(_entries), "bytes": _total_bytes}
+    stats["disk"] = disk_cache.get_disk_cache_stats() if disk_cache.USE_DISK_CACHE else None
+    return stats
@@ -0,0 +1,459 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+from datetime import datetime
+from cache import cached
+from db import get_collection
+from columnar import ColumnBuilder
+
+# Zona horaria local para las métricas por hora del día
+LOCAL_TIMEZONE = "America/Mexico_City"
+
+# Si está activo, MongoDB entrega las llamadas de cada usuario como una lista por
+# columna y no se recorre un diccionario por llamada. Desactivado por omisión: las
+# listas se siguen decodificando con el BSON normal y con mongomock el camino por
+# documentos es más rápido; activarlo solo si `benchmark.py --mongo` lo muestra
+# más rápido (load_calls_columns contra load_calls)
+COLUMNAR_FETCH = st.secrets.get("COLUMNAR_FETCH", False)
+
+# Columnas del DataFrame de llamadas (una fila por llamada)
+CALL_COLUMNS = [
+    "user_id",
+    "user_age",
+    "user_gender",
+    "call_id",
+    "type_call",
+    "call_start_time",
+    "duration",
+    "bot_time",
+    "human_time",
+]
+
+
+def parse_age(age):
+    """
+    Convierte `user_age` (guardado como texto) a entero, o None si no es válido.
+    """
+    if age and isinstance(age, str) and age.isdigit():
+        return int(age)
+    return None
+
+
+def parse_call_start_time(call_start_time):
+    """
+    Convierte un `call_start_time` a datetime (UTC sin zona horaria), descartando
+    las fracciones de segundo. Regresa None si el valor no es válido.
+    """
+    if not call_start_time:
+        return None
+    try:
+        return datetime.fromisoformat(call_start_time.split(".")[0])
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def parse_call_start_times(call_start_times):
+    """
+    Versión por columna de `parse_call_start_time`: convierte toda la columna de
+    una vez a fechas UTC (con zona horaria). Regresa las fechas y el número de
+    valores mal formados (los vacíos no cuentan como mal formados).
+    """
+    raw = pd.Series(call_start_times, dtype=object)
+    # Se quitan las fracciones de segundo con el tipo "str" de pandas (respaldado por
+    # pyarrow), sin crear una lista de Python por fila como `str.split`
+    parsed = pd.to_datetime(
+        raw.astype("str").str.replace(r"\..*$", "", regex=True),
+        utc=True,
+        format="ISO8601",
+        errors="coerce"
+    )
+    malformed = int((parsed.isna() & has_value(raw)).sum())
+    return parsed, malformed
+
+
+def has_value(series):
+    """
+    Equivalente vectorizado de `if value:` para columnas de texto (descarta None y "").
+    """
+    return series.notna() & (series != "")
+
+
+# Consulta y proyección de la extracción de llamadas. "calls.0" solo existe si
+# `calls` es una lista con al menos una llamada (descarta null y listas vacías)
+CALLS_QUERY = {"calls.0": {"$exists": True}}
+CALLS_PROJECTION = {
+    "_id": 0,
+    "user_id": 1,
+    "user_age": 1,
+    "user_gender": 1,
+    "calls.call_id": 1,
+    "calls.type_call": 1,
+    "calls.call_start_time": 1,
+    "calls.call_duration.original_total_time": 1,
+    "calls.call_duration.bot": 1,
+    "calls.call_duration.human": 1,
+}
+
+
+def call_field(path, default=None):
+    """
+    Expresión de agregación con el campo `path` de cada llamada (`$$call`). Los
+    valores que faltan (o son null) se reemplazan por `default` para que todas
+    las columnas conserven la posición de cada llamada.
+    """
+    return {"$ifNull": [f"$$call.{path}", default]}
+
+
+# Columnas de llamadas que MongoDB entrega por usuario con COLUMNAR_FETCH. Las
+# duraciones faltantes llegan como NaN para guardarlas en un buffer tipado.
+CALL_FIELDS = {
+    "call_id": call_field("call_id"),
+    "type_call": call_field("type_call"),
+    "call_start_time": call_field("call_start_time"),
+    "duration": call_field("call_duration.original_total_time", float("nan")),
+    "bot_time": call_field("call_duration.bot", 0),
+    "human_time": call_field("call_duration.human", 0),
+}
+
+
+def assemble_calls_frame(users, user_index, calls):
+    """
+    Arma el DataFrame de llamadas a partir de las columnas por usuario (un
+    ColumnBuilder), la posición del usuario de cada llamada y las columnas de
+    llamadas como arreglos de numpy.
+    """
+    call_start_time, malformed = parse_call_start_times(calls["call_start_time"])
+
+    # Tipos explícitos para que el DataFrame vacío tenga las mismas columnas
+    calls_df = pd.DataFrame({
+        "user_id": pd.Series(users.column("user_id")[user_index], dtype=object),
+        "user_age": users.column("user_age")[user_index],
+        "user_gender": pd.Series(users.column("user_gender")[user_index], dtype=object),
+        "call_id": pd.Series(calls["call_id"], dtype=object),
+        "type_call": pd.Series(calls["type_call"], dtype=object),
+        "call_start_time": call_start_time,
+        "duration": calls["duration"],
+        "bot_time": calls["bot_time"],
+        "human_time": calls["human_time"],
+    }, copy=False)
+    # Llamadas con fecha inválida: se omiten en las métricas por fecha/hora
+    calls_df.attrs["malformed_call_start_time"] = malformed
+    return calls_df
+
+
+def user_columns():
+    return ColumnBuilder({"user_id": "object", "user_age": "float", "user_gender": "object"})
+
+
+def build_calls_frame(records):
+    """
+    Aplana los documentos de `call_information` en un DataFrame con una fila por
+    llamada. Todas las métricas de inbound, outbound y duración se calculan a
+    partir de este DataFrame.
+    """
+    # Los datos del usuario se guardan una vez por usuario; cada llamada guarda su posición
+    users = user_columns()
+    calls = ColumnBuilder({
+        "user": "index",
+        "call_id": "object",
+        "type_call": "code",
+        "call_start_time": "object",
+        "duration": "float",
+        "bot_time": "float",
+        "human_time": "float",
+    })
+    add_user_id = users.appender("user_id")
+    add_user_age = users.appender("user_age")
+    add_user_gender = users.appender("user_gender")
+    add_user = calls.appender("user")
+    add_call_id = calls.appender("call_id")
+    add_type_call = calls.appender("type_call")
+    add_call_start_time = calls.appender("call_start_time")
+    add_duration = calls.appender("duration")
+    add_bot_time = calls.appender("bot_time")
+    add_human_time = calls.appender("human_time")
+
+    for user, record in enumerate(records):
+        add_user_id(record.get("user_id"))
+        add_user_age(parse_age(record.get("user_age")))
+        add_user_gender(record.get("user_gender"))
+        for call in record.get("calls", []):
+            call_duration = call.get("call_duration") or {}
+            add_user(user)
+            add_call_id(call.get("call_id"))
+            add_type_call(call.get("type_call"))
+            add_call_start_time(call.get("call_start_time"))
+            add_duration(call_duration.get("original_total_time"))
+            add_bot_time(call_duration.get("bot", 0))
+            add_human_time(call_duration.get("human", 0))
+
+    return assemble_calls_frame(users, calls.column("user"), {
+        column: calls.column(column) for column in CALL_FIELDS
+    })
+
+
+def build_calls_frame_from_columns(records):
+    """
+    Igual que `build_calls_frame`, pero con documentos que ya traen una lista por
+    columna (ver `column_calls_stage`): las listas se concatenan sin recorrer cada
+    llamada en Python.
+    """
+    users = user_columns()
+    add_user_id = users.appender("user_id")
+    add_user_age = users.appender("user_age")
+    add_user_gender = users.appender("user_gender")
+    calls = ColumnBuilder({
+        "call_id": "object",
+        "type_call": "code",
+        "call_start_time": "object",
+        "duration": "float",
+        "bot_time": "float",
+        "human_time": "float",
+    })
+    extenders = [(column, calls.extender(column)) for column in CALL_FIELDS]
+    calls_per_user = ColumnBuilder({"calls": "int"})
+    add_calls = calls_per_user.appender("calls")
+
+    for record in records:
+        add_user_id(record.get("user_id"))
+        add_user_age(parse_age(record.get("user_age")))
+        add_user_gender(record.get("user_gender"))
+        add_calls(len(record["call_id"]))
+        for column, extend in extenders:
+            extend(record[column])
+
+    user_index = np.repeat(np.arange(len(users)), calls_per_user.column("calls"))
+    return assemble_calls_frame(users, user_index, {
+        column: calls.column(column) for column in CALL_FIELDS
+    })
+
+
+def build_filters(date_range=None, type_call=None, user_gender=None, age_range=None):
+    """
+    Filtros de las métricas elegidos en el menú lateral:
+    - date_range: (fecha_inicio, fecha_fin) en fechas locales, ambas incluidas
+    - type_call: "inbound" u "outbound"
+    - user_gender: valor de `user_gender`
+    - age_range: (edad_mínima, edad_máxima), ambas incluidas
+    Regresa None si no hay ningún filtro activo.
+    """
+    filters = {
+        "date_range": date_range,
+        "type_call": type_call,
+        "user_gender": user_gender,
+        "age_range": age_range,
+    }
+    filters = {name: value for name, value in filters.items() if value}
+    return filters or None
+
+
+def date_bounds(filters):
+    """
+    Inicio y fin (exclusivo) del rango de fechas locales como texto ISO en UTC,
+    el mismo formato de `call_start_time`, para poder compararlo en MongoDB.
+    """
+    if not filters or not filters.get("date_range"):
+        return None
+    start_date, end_date = filters["date_range"]
+    start = pd.Timestamp(start_date).tz_localize(LOCAL_TIMEZONE).tz_convert("UTC")
+    end = (pd.Timestamp(end_date) + pd.Timedelta(days=1)).tz_localize(LOCAL_TIMEZONE).tz_convert("UTC")
+    return start.strftime("%Y-%m-%dT%H:%M:%S"), end.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def user_match(filters):
+    # Condiciones sobre el documento del usuario
+    conditions = {}
+    if filters and filters.get("user_gender"):
+        conditions["user_gender"] = filters["user_gender"]
+    if filters and filters.get("age_range"):
+        # `user_age` se guarda como texto: se buscan las edades exactas para poder usar el índice
+        min_age, max_age = filters["age_range"]
+        conditions["user_age"] = {"$in": [str(age) for age in range(min_age, max_age + 1)]}
+    return conditions
+
+
+def call_match(filters, prefix=""):
+    # Condiciones sobre cada llamada (`prefix` es "calls." después de un $unwind)
+    conditions = {}
+    bounds = date_bounds(filters)
+    if bounds:
+        conditions[f"{prefix}call_start_time"] = {"$gte": bounds[0], "$lt": bounds[1]}
+    if filters and filters.get("type_call"):
+        conditions[f"{prefix}type_call"] = filters["type_call"]
+    return conditions
+
+
+def filter_query(query, filters):
+    """
+    Agrega los filtros a una consulta de `call_information`. Las condiciones de
+    llamada van en un $elemMatch para que se cumplan en la misma llamada.
+    """
+    conditions = [query]
+    if user_match(filters):
+        conditions.append(user_match(filters))
+    if call_match(filters):
+        conditions.append({"calls": {"$elemMatch": call_match(filters)}})
+    if len(conditions) == 1:
+        return query
+    return {"$and": conditions}
+
+
+def filter_calls(df, filters):
+    """
+    Aplica los filtros a un DataFrame con una fila por llamada (o por bucket de
+    rollups). MongoDB regresa los documentos completos de los usuarios, así que
+    aquí se descartan las llamadas que no cumplen los filtros.
+    """
+    if not filters or df.empty:
+        return df
+
+    mask = pd.Series(True, index=df.index)
+    bounds = date_bounds(filters)
+    if bounds:
+        start, end = (pd.Timestamp(bound, tz="UTC") for bound in bounds)
+        if df["call_start_time"].dt.tz is None:
+            start, end = start.tz_localize(None), end.tz_localize(None)
+        mask &= (df["call_start_time"] >= start) & (df["call_start_time"] < end)
+    if filters.get("type_call"):
+        mask &= df["type_call"] == filters["type_call"]
+    if filters.get("user_gender"):
+        mask &= df["user_gender"] == filters["user_gender"]
+    if filters.get("age_range"):
+        mask &= df["user_age"].between(*filters["age_range"])
+
+    filtered = df[mask].reset_index(drop=True)
+    filtered.attrs = dict(df.attrs)
+    return filtered
+
+
+def call_conditions(filters, type_call=None):
+    """
+    Condiciones de `call_match` como expresiones de agregación sobre cada llamada
+    (`$$call`), para descartar en MongoDB las llamadas que no cumplen los filtros.
+    """
+    conditions = []
+    bounds = date_bounds(filters)
+    if bounds:
+        # Con ambos límites de texto solo pasan textos: en el orden de tipos de BSON
+        # los números y null quedan antes y las fechas y documentos después
+        conditions.append({"$gte": ["$$call.call_start_time", bounds[0]]})
+        conditions.append({"$lt": ["$$call.call_start_time", bounds[1]]})
+    if type_call:
+        conditions.append({"$eq": ["$$call.type_call", type_call]})
+    if filters and filters.get("type_call"):
+        conditions.append({"$eq": ["$$call.type_call", filters["type_call"]]})
+    return conditions
+
+
+def trimmed_calls_stage(projection, conditions):
+    """
+    Etapa $project equivalente a la proyección con campos `calls.*` de un find,
+    pero que además deja en `calls` solo las llamadas que cumplen las condiciones.
+    """
+    fields = {}
+    for path in projection:
+        if path.startswith("calls."):
+            parts = path.split(".")[1:]
+            target = fields
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = "$$call." + ".".join(parts)
+
+    calls = "$calls"
+    if conditions:
+        calls = {"$filter": {"input": "$calls", "as": "call", "cond": {"$and": conditions}}}
+    return {"$project": {
+        **{field: value for field, value in projection.items() if not field.startswith("calls.")},
+        "calls": {"$map": {"input": calls, "as": "call", "in": fields}},
+    }}
+
+
+def calls_request(query, projection, filters=None, fields=None):
+    """
+    Consulta con la que se leen las llamadas de `call_information` que cumplen la
+    consulta y los filtros: {"kind": "find", "query", "projection"} o
+    {"kind": "aggregate", "pipeline"}. Si hay filtros por llamada (fecha o tipo),
+    MongoDB quita las demás llamadas de cada usuario en lugar de enviarlas para
+    descartarlas en pandas. Con `fields` las llamadas llegan por columna (ver
+    `call_columns_pipeline`). `indexes.query_shapes` explica estas mismas consultas.
+    """
+    if fields is not None:
+        return {"kind": "aggregate", "pipeline": call_columns_pipeline(query, projection, fields, filters)}
+    conditions = call_conditions(filters)
+    if not conditions:
+        return {"kind": "find", "query": filter_query(query, filters), "projection": projection}
+    return {"kind": "aggregate", "pipeline": [
+        {"$match": filter_query(query, filters)},
+        trimmed_calls_stage(projection, conditions),
+    ]}
+
+
+def run_request(request, collection=None):
+    # Ejecuta una consulta de `calls_request` en `call_information` (o en la colección indicada)
+    collection = get_collection() if collection is None else collection
+    if request["kind"] == "find":
+        return collection.find(request["query"], request["projection"])
+    return collection.aggregate(request["pipeline"])
+
+
+def find_calls(query, projection, filters=None):
+    """
+    Documentos de `call_information` que cumplen la consulta y los filtros, con
+    solo las llamadas que cumplen los filtros por llamada.
+    """
+    return run_request(calls_request(query, projection, filters))
+
+
+def column_calls_stage(projection, fields):
+    """
+    Etapa $project que entrega los campos del usuario de la proyección y, por cada
+    columna de `fields` (nombre: expresión sobre `$$call`), una lista con un valor
+    por llamada.
+    """
+    return {"$project": {
+        **{field: value for field, value in projection.items() if not field.startswith("calls.")},
+        **{
+            column: {"$map": {"input": "$calls", "as": "call", "in": expression}}
+            for column, expression in fields.items()
+        },
+    }}
+
+
+def call_columns_pipeline(query, projection, fields, filters=None):
+    """
+    Pipeline equivalente a `find_calls`, pero cada documento trae las llamadas
+    como listas por columna en lugar de una lista de diccionarios.
+    """
+    stages = [{"$match": filter_query(query, filters)}]
+    conditions = call_conditions(filters)
+    if conditions:
+        stages.append(trimmed_calls_stage(projection, conditions))
+    stages.append(column_calls_stage(projection, fields))
+    return stages
+
+
+def find_call_columns(query, projection, fields, filters=None):
+    return run_request(calls_request(query, projection, filters, fields))
+
+
+def calls_data_request(filters=None):
+    # Consulta de `get_calls_data`
+    return calls_request(CALLS_QUERY, CALLS_PROJECTION, filters, CALL_FIELDS if COLUMNAR_FETCH else None)
+
+
+@cached
+def get_calls_data(filters=None):
+    """
+    Extrae en una sola pasada por el cursor las llamadas de `call_information`
+    que cumplen los filtros.
+    """
+    records = run_request(calls_data_request(filters))
+    if COLUMNAR_FETCH:
+        return filter_calls(build_calls_frame_from_columns(records), filters)
+    return filter_calls(build_calls_frame(records), filters)
+
+
+@cached
+def get_gender_options():
+    values = get_collection().distinct("user_gender")
+    return sorted(value for value in values if value)
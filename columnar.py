@@ -0,0 +1,84 @@
+import numpy as np
+from array import array
+
+# Tipo de buffer de cada clase de columna
+TYPECODES = {"float": "d", "int": "q", "index": "i", "code": "i"}
+DTYPES = {"float": np.float64, "int": np.int64, "index": np.int32, "code": np.int32}
+
+
+class ColumnBuilder:
+    """
+    Construye columnas fila por fila en buffers tipados en lugar de listas de
+    diccionarios u objetos de Python:
+    - "float": números (None se guarda como NaN), 8 bytes por fila
+    - "int": enteros de 64 bits
+    - "index": enteros de 32 bits, p. ej. la posición de la fila del usuario
+    - "code": valores repetidos (tipo de llamada, tema); se guarda un código de 4
+      bytes por fila y cada valor distinto una sola vez
+    - "object": cualquier otro valor (identificadores, textos sin procesar)
+    Las columnas numéricas se entregan a numpy sin copiar el buffer.
+    """
+
+    def __init__(self, kinds):
+        self.kinds = kinds
+        self.buffers = {
+            name: [] if kind == "object" else array(TYPECODES[kind])
+            for name, kind in kinds.items()
+        }
+        self.categories = {name: {} for name, kind in kinds.items() if kind == "code"}
+
+    def appender(self, name):
+        """
+        Función que agrega un valor a la columna. Se obtiene una vez antes del
+        ciclo para no buscar la columna en cada fila.
+        """
+        buffer = self.buffers[name]
+        kind = self.kinds[name]
+        if kind == "float":
+            def append_float(value):
+                buffer.append(np.nan if value is None else value)
+            return append_float
+        if kind == "code":
+            codes = self.categories[name]
+
+            def append_code(value):
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(codes)
+                buffer.append(code)
+            return append_code
+        return buffer.append
+
+    def extender(self, name):
+        """
+        Función que agrega una lista de valores a la columna de una vez. A
+        diferencia de `appender`, las columnas numéricas no aceptan None.
+        """
+        buffer = self.buffers[name]
+        if self.kinds[name] == "code":
+            codes = self.categories[name]
+
+            def extend_code(values):
+                buffer.extend([codes.setdefault(value, len(codes)) for value in values])
+            return extend_code
+        return buffer.extend
+
+    def __len__(self):
+        return len(next(iter(self.buffers.values()))) if self.buffers else 0
+
+    def column(self, name):
+        """
+        Columna como arreglo de numpy. Las columnas "code" se decodifican a un
+        arreglo de objetos que apunta a los valores distintos (no a copias).
+        """
+        kind = self.kinds[name]
+        if kind == "object":
+            values = np.empty(len(self.buffers[name]), dtype=object)
+            values[:] = self.buffers[name]
+            return values
+        values = np.frombuffer(self.buffers[name], dtype=DTYPES[kind])
+        if kind == "code":
+            categories = np.empty(len(self.categories[name]), dtype=object)
+            categories[:] = list(self.categories[name])
+            return categories[values]
+        return values
@@ -0,0 +1,126 @@
+import streamlit as st
+import threading
+from pymongo import MongoClient, monitoring
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+from instrumentation import command_metrics
+
+# Un solo MongoClient por proceso, creado en el primer uso (no al importar los módulos)
+_client = None
+_client_lock = threading.Lock()
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Cuenta los eventos del pool de conexiones para mostrar su utilización.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checked_out": 0,
+            "checked_in": 0,
+            "checkout_failures": 0,
+            "pool_clears": 0,
+        }
+
+    def _increment(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._increment("pool_clears")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._increment("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._increment("connections_closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._increment("checkout_failures")
+
+    def connection_checked_out(self, event):
+        self._increment("checked_out")
+
+    def connection_checked_in(self, event):
+        self._increment("checked_in")
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self.counters)
+        counters["open_connections"] = counters["connections_created"] - counters["connections_closed"]
+        counters["in_use"] = counters["checked_out"] - counters["checked_in"]
+        return counters
+
+
+pool_metrics = PoolMetrics()
+
+
+def client_options():
+    """
+    Opciones del pool y de tiempos de espera, configurables desde los secrets.
+    """
+    return {
+        "maxPoolSize": st.secrets.get("MONGODB_MAX_POOL_SIZE", 20),
+        "minPoolSize": st.secrets.get("MONGODB_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": st.secrets.get("MONGODB_MAX_IDLE_TIME_MS", 300000),
+        "serverSelectionTimeoutMS": st.secrets.get("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 10000),
+        "connectTimeoutMS": st.secrets.get("MONGODB_CONNECT_TIMEOUT_MS", 10000),
+        "socketTimeoutMS": st.secrets.get("MONGODB_SOCKET_TIMEOUT_MS", 120000),
+        # Las lecturas del dashboard pueden ir a un secundario (p. ej. "secondaryPreferred")
+        "readPreference": st.secrets.get("MONGODB_READ_PREFERENCE", "primary"),
+        "appname": "kuidalos-dashboard",
+    }
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(
+                    st.secrets["MONGODB_URI"],
+                    event_listeners=[pool_metrics, command_metrics],
+                    **client_options()
+                )
+    return _client
+
+
+def get_database():
+    return get_client()[st.secrets["MONGODB_DATABASE"]]
+
+
+def get_collection(name="call_information", read_preference=None):
+    """
+    Colección de la base del dashboard. `read_preference` permite dirigir una
+    consulta a otro nodo (p. ej. "secondary") sin cambiar la configuración global.
+    """
+    collection = get_database()[name]
+    if read_preference is not None:
+        mode = read_pref_mode_from_name(read_preference)
+        collection = collection.with_options(read_preference=make_read_preference(mode, None))
+    return collection
+
+
+def get_pool_stats():
+    stats = pool_metrics.snapshot()
+    stats["max_pool_size"] = client_options()["maxPoolSize"]
+    stats["connected"] = _client is not None
+    return stats
@@ -0,0 +1,334 @@
+import streamlit as st
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pymongo.errors import PyMongoError
+from db import get_collection
+from instrumentation import record_error
+
+# Segundo nivel del caché (ver `cache.cached`): los resultados se guardan en disco
+# y sobreviven a los reinicios del proceso
+USE_DISK_CACHE = st.secrets.get("USE_DISK_CACHE", False)
+DISK_CACHE_DIR = st.secrets.get("DISK_CACHE_DIR", "disk_cache")
+DISK_CACHE_MAX_BYTES = st.secrets.get("DISK_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024)
+# Vigencia de un resultado en disco: acota lo que tarda en verse un cambio que no mueve la marca de agua
+DISK_CACHE_TTL = st.secrets.get("DISK_CACHE_TTL", 24 * 60 * 60)
+# Resultados que se cargan a memoria al arrancar el proceso
+DISK_CACHE_WARM_BYTES = st.secrets.get("DISK_CACHE_WARM_BYTES", 256 * 1024 * 1024)
+WATERMARK_INTERVAL = 60  # Segundos que se reutiliza la marca de agua antes de consultarla de nuevo
+TEMP_FILE_MAX_AGE = 60 * 60  # Archivos temporales de escrituras interrumpidas que se borran al arrancar
+
+ENTRY_SUFFIX = ".pkl"
+TEMP_SUFFIX = ".tmp"
+# Permisos del directorio: los resultados se leen con pickle, que puede ejecutar
+# código, así que solo el usuario del proceso puede escribir en él
+DIRECTORY_MODE = 0o700
+
+# Documento con la llamada más reciente, para la marca de agua (usa el índice de `calls.call_start_time`)
+LATEST_CALL_QUERY = {"calls.call_start_time": {"$exists": True}}
+LATEST_CALL_PROJECTION = {"calls.call_start_time": 1}
+LATEST_CALL_SORT = [("calls.call_start_time", -1)]
+
+_lock = threading.Lock()
+_watermark = {"value": None, "read_at": None}
+_stats = {"entries": 0, "bytes": 0, "writes": 0, "evictions": 0}
+_generation = 0  # Aumenta con `clear`: las escrituras pendientes de antes ya no se guardan
+_name_generations = {}  # Lo mismo por función, con `remove_entries`
+# Las escrituras se hacen en segundo plano, de una en una, para no demorar la página
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="disk-cache")
+
+
+def data_watermark():
+    """
+    Marca de agua de los datos: la llamada más reciente de `call_information`,
+    el número de documentos y la marca de agua de los rollups. Si cambia, los
+    resultados guardados con la anterior ya no se usan.
+    """
+    from rollups import STATE_COLLECTION, ROLLUP_STATE_ID
+
+    collection = get_collection()
+    latest = collection.find_one(LATEST_CALL_QUERY, LATEST_CALL_PROJECTION, sort=LATEST_CALL_SORT)
+    latest_start_time = max(
+        (
+            call.get("call_start_time") for call in (latest or {}).get("calls") or []
+            if isinstance(call.get("call_start_time"), str)
+        ),
+        default="",
+    )
+    state = get_collection(STATE_COLLECTION).find_one({"_id": ROLLUP_STATE_ID}, {"watermark": 1}) or {}
+    return f"{latest_start_time}|{collection.estimated_document_count()}|{state.get('watermark', '')}"
+
+
+def current_watermark():
+    """
+    Marca de agua vigente, consultada a lo más cada WATERMARK_INTERVAL segundos.
+    Regresa None si MongoDB no responde: en ese caso no se usa el disco.
+    """
+    with _lock:
+        if _watermark["read_at"] is not None and time.monotonic() - _watermark["read_at"] < WATERMARK_INTERVAL:
+            return _watermark["value"]
+    try:
+        value = data_watermark()
+    except PyMongoError as e:
+        record_error("disk_cache.current_watermark", e)
+        return None
+    with _lock:
+        _watermark["value"] = value
+        _watermark["read_at"] = time.monotonic()
+    return value
+
+
+def reset_watermark():
+    # La siguiente consulta al caché vuelve a leer la marca de agua
+    with _lock:
+        _watermark["read_at"] = None
+
+
+def entry_fingerprint(key, watermark):
+    """
+    Nombre del archivo de un resultado: hash de la clave estable de la llamada
+    (ver `cache.disk_key`) y de la marca de agua de los datos.
+    """
+    return hashlib.blake2b(f"{key}|{watermark}".encode(), digest_size=16).hexdigest()
+
+
+def entry_path(fingerprint):
+    return os.path.join(DISK_CACHE_DIR, f"{fingerprint}{ENTRY_SUFFIX}")
+
+
+def _owned(stat):
+    # Del usuario del proceso y sin permiso de escritura para nadie más
+    return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+
+
+def prepare_directory():
+    """
+    Crea el directorio del caché solo para el usuario del proceso, y le quita
+    los permisos de los demás si ya existía. Falla con PermissionError si el
+    directorio es de otro usuario: en ese caso no se lee ni se escribe nada.
+    """
+    os.makedirs(DISK_CACHE_DIR, mode=DIRECTORY_MODE, exist_ok=True)
+    stat = os.stat(DISK_CACHE_DIR)
+    if stat.st_uid != os.getuid():
+        raise PermissionError(f"{DISK_CACHE_DIR} no es del usuario del proceso")
+    if stat.st_mode & 0o777 != DIRECTORY_MODE:
+        os.chmod(DISK_CACHE_DIR, DIRECTORY_MODE)
+
+
+def _load(f, path):
+    """
+    Lee los metadatos de un resultado; el valor sigue en el archivo. Solo se
+    deserializan los archivos del usuario del proceso que nadie más pudo modificar.
+    """
+    if not _owned(os.fstat(f.fileno())):
+        raise PermissionError(f"{path} no es del usuario del proceso o otros pueden escribirlo")
+    return pickle.load(f)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        # Otro proceso que comparte el directorio ya lo borró
+        pass
+
+
+def _expired(metadata):
+    return metadata["created_at"] + DISK_CACHE_TTL < time.time()
+
+
+def read_entry(fingerprint):
+    """
+    Regresa (metadatos, valor) del resultado guardado, o None si no existe, ya
+    venció o no se puede leer (el archivo se descarta).
+    """
+    path = entry_path(fingerprint)
+    try:
+        prepare_directory()
+    except OSError as e:
+        record_error("disk_cache.read_entry", e)
+        return None
+    try:
+        with open(path, "rb") as f:
+            metadata = _load(f, path)
+            if _expired(metadata):
+                _remove(path)
+                return None
+            value = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        record_error("disk_cache.read_entry", e)
+        _remove(path)
+        return None
+    try:
+        # La fecha de modificación es la del último uso: el desalojo descarta los menos usados
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return metadata, value
+
+
+def _current_generation(name):
+    # Se llama con `_lock` tomado
+    return _generation, _name_generations.get(name, 0)
+
+
+def _write_entry(fingerprint, value, metadata, generation):
+    """
+    Escribe a un archivo temporal en el mismo directorio y luego lo reemplaza: un
+    lector nunca ve un archivo a medias, aunque el proceso se detenga a la mitad.
+    """
+    try:
+        prepare_directory()
+        # mkstemp crea el archivo con permisos 0600
+        fd, temp_path = tempfile.mkstemp(dir=DISK_CACHE_DIR, suffix=TEMP_SUFFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(metadata, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            with _lock:
+                if generation != _current_generation(metadata["name"]):
+                    _remove(temp_path)
+                    return
+                os.replace(temp_path, entry_path(fingerprint))
+        except BaseException:
+            _remove(temp_path)
+            raise
+        with _lock:
+            _stats["writes"] += 1
+        evict()
+    except Exception as e:
+        record_error("disk_cache.write_entry", e)
+
+
+def write_entry(fingerprint, value, metadata):
+    """
+    Guarda un resultado en segundo plano. `metadata` incluye el nombre de la
+    función, la marca de agua, la fecha y la clave en memoria para la carga al
+    arrancar (None si la llamada depende de otros DataFrames).
+    """
+    with _lock:
+        generation = _current_generation(metadata["name"])
+    _writer.submit(_write_entry, fingerprint, value, metadata, generation)
+
+
+def _list_entries():
+    # (ruta, fecha de último uso, bytes) de los resultados guardados
+    entries = []
+    try:
+        scanned = list(os.scandir(DISK_CACHE_DIR))
+    except FileNotFoundError:
+        return entries
+    for entry in scanned:
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        if entry.name.endswith(ENTRY_SUFFIX):
+            entries.append((entry.path, stat.st_mtime, stat.st_size))
+        elif entry.name.endswith(TEMP_SUFFIX) and stat.st_mtime + TEMP_FILE_MAX_AGE < time.time():
+            _remove(entry.path)
+    return entries
+
+
+def evict():
+    """
+    Descarta los resultados menos usados recientemente hasta que el directorio
+    ocupe a lo más DISK_CACHE_MAX_BYTES. Se lee el directorio completo porque
+    otros procesos pueden estar escribiendo en él.
+    """
+    entries = sorted(_list_entries(), key=lambda entry: entry[1])
+    total_bytes = sum(size for _, _, size in entries)
+    evicted = 0
+    while len(entries) > 1 and total_bytes > DISK_CACHE_MAX_BYTES:
+        path, _, size = entries.pop(0)
+        _remove(path)
+        total_bytes -= size
+        evicted += 1
+    with _lock:
+        _stats["entries"] = len(entries)
+        _stats["bytes"] = total_bytes
+        _stats["evictions"] += evicted
+
+
+def warm_entries(watermark):
+    """
+    Genera (metadatos, valor) de los resultados guardados con la marca de agua
+    vigente que no dependen de otros DataFrames, del más al menos usado y hasta
+    DISK_CACHE_WARM_BYTES. Los vencidos y los de otra marca de agua se borran.
+    """
+    try:
+        prepare_directory()
+    except OSError as e:
+        record_error("disk_cache.warm_entries", e)
+        return
+    warm_bytes = 0
+    for path, _, size in sorted(_list_entries(), key=lambda entry: entry[1], reverse=True):
+        try:
+            with open(path, "rb") as f:
+                metadata = _load(f, path)
+                if _expired(metadata) or metadata["watermark"] != watermark:
+                    _remove(path)
+                    continue
+                if metadata["memory_key"] is None or warm_bytes + size > DISK_CACHE_WARM_BYTES:
+                    continue
+                value = pickle.load(f)
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            record_error("disk_cache.warm_entries", e)
+            _remove(path)
+            continue
+        warm_bytes += size
+        yield metadata, value
+    evict()
+
+
+def clear():
+    # Borra todos los resultados guardados en disco
+    global _generation
+    with _lock:
+        _generation += 1
+    for path, _, _ in _list_entries():
+        _remove(path)
+    reset_watermark()
+    with _lock:
+        _stats["entries"] = 0
+        _stats["bytes"] = 0
+
+
+def remove_entries(name):
+    """
+    Borra los resultados guardados en disco de la función `name` (el nombre que
+    guarda `cache.cached` en los metadatos). Los archivos que no se pueden leer
+    también se borran, como en `warm_entries`.
+    """
+    with _lock:
+        _name_generations[name] = _name_generations.get(name, 0) + 1
+    try:
+        prepare_directory()
+    except OSError as e:
+        record_error("disk_cache.remove_entries", e)
+        return
+    for path, _, _ in _list_entries():
+        try:
+            with open(path, "rb") as f:
+                if _load(f, path)["name"] != name:
+                    continue
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            record_error("disk_cache.remove_entries", e)
+        _remove(path)
+    reset_watermark()
+    evict()
+
+
+def get_disk_cache_stats():
+    with _lock:
+        return dict(_stats)
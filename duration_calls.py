@@ -1,114 +1,63 @@
-import streamlit as st
 import pandas as pd
 import numpy as np
-from pymongo import MongoClient
-from datetime import datetime
-import calendar
-from datetime import datetime
-import pytz
-
-# Configuración de MongoDB
-MONGODB_URI = st.secrets["MONGODB_URI"]
-DATABASE_NAME = st.secrets["MONGODB_DATABASE"]
-client = MongoClient(MONGODB_URI)
-db = client[DATABASE_NAME]
-collection = db["call_information"]
+from call_data import has_value, LOCAL_TIMEZONE
+from cache import cached
+from quantiles import QUANTILES
 
-# Función para obtener la duración promedio total
-def get_average_call_duration():
-    calls = collection.find(
-        {"calls.call_duration.original_total_time": {"$exists": True}},
-        {"calls.call_duration.original_total_time": 1}
-    )
+# Rangos de edad de las métricas por edad. Etiquetas explícitas: `astype(str)` de los
+# intervalos cambia a "(60.0, 65.0]" si alguna edad queda fuera de los rangos
+AGE_BINS = np.arange(60, 95, 5)
+AGE_LABELS = [str(interval) for interval in pd.IntervalIndex.from_breaks(AGE_BINS)]
 
-    durations = []
-    for record in calls:
-        for call in record.get("calls", []):
-            duration = call.get("call_duration", {}).get("original_total_time")
-            if duration is not None:
-                durations.append(duration)
+# Función para obtener la duración promedio total
+@cached
+def get_average_call_duration(calls_df):
+    durations = calls_df["duration"].dropna()
 
-    if not durations:
+    if durations.empty:
         return 0
 
     return round(np.mean(durations) / 60, 2)  # Convertir a minutos
 
 # Función para obtener la duración promedio por género
-def get_average_call_duration_by_gender():
-    calls = collection.find(
-        {"calls.call_duration.original_total_time": {"$exists": True}},
-        {"user_gender": 1, "calls.call_duration.original_total_time": 1}
-    )
+@cached
+def get_average_call_duration_by_gender(calls_df):
+    calls = calls_df[calls_df["duration"].notna() & has_value(calls_df["user_gender"])]
 
-    data = []
-    for record in calls:
-        gender = record.get("user_gender")
-        for call in record.get("calls", []):
-            duration = call.get("call_duration", {}).get("original_total_time")
-            if duration is not None and gender:
-                data.append({"gender": gender, "duration": duration / 60})  # Convertir a minutos
-
-    if not data:
+    if calls.empty:
         return pd.Series(dtype=float)
 
-    df = pd.DataFrame(data)
+    df = pd.DataFrame({"gender": calls["user_gender"], "duration": calls["duration"] / 60})  # Convertir a minutos
     return df.groupby("gender")["duration"].mean()
 
 # Función para duración promedio por edad
-def get_average_call_duration_by_age():
-    calls = collection.find(
-        {"calls.call_duration.original_total_time": {"$exists": True}},
-        {"user_age": 1, "calls.call_duration.original_total_time": 1}
-    )
+@cached
+def get_average_call_duration_by_age(calls_df):
+    calls = calls_df[calls_df["duration"].notna() & (calls_df["user_age"] >= 60)]
 
-    data = []
-    for record in calls:
-        age = record.get("user_age")
-        for call in record.get("calls", []):
-            duration = call.get("call_duration", {}).get("original_total_time")
-            if duration is not None and age and age.isdigit() and int(age) >= 60:
-                data.append({"age": int(age), "duration": duration / 60})  # Convertir a minutos
-
-    if not data:
+    if calls.empty:
         return pd.Series(dtype=float)
 
-    df = pd.DataFrame(data)
-    bins = np.arange(60, 95, 5)  # Rangos de edad
-    df["age_range"] = pd.cut(df["age"], bins=bins)
-
-    # Convierte los intervalos a cadenas para visualización
-    df["age_range_str"] = df["age_range"].astype(str)
-    grouped_data = df.groupby("age_range_str")["duration"].mean()
+    df = pd.DataFrame({"age": calls["user_age"].astype(int), "duration": calls["duration"] / 60})  # Convertir a minutos
+    # Las edades fuera de los rangos (60 o más de 90) quedan sin rango y no se agrupan
+    df["age_range_str"] = pd.cut(df["age"], bins=AGE_BINS, labels=AGE_LABELS)
+    grouped_data = df.groupby("age_range_str", observed=True)["duration"].mean()
 
     return grouped_data
 
 # Función para duración promedio por día de la semana
-def get_average_call_duration_by_day_of_week():
-    calls = collection.find(
-        {"calls.call_duration.original_total_time": {"$exists": True}},
-        {"calls.call_duration.original_total_time": 1, "calls.call_start_time": 1}
-    )
+@cached
+def get_average_call_duration_by_day_of_week(calls_df):
+    calls = calls_df[calls_df["duration"].notna() & calls_df["call_start_time"].notna()]
 
-    data = []
-    for record in calls:
-        for call in record.get("calls", []):
-            duration = call.get("call_duration", {}).get("original_total_time")
-            call_start_time = call.get("call_start_time")
-            if duration is not None and call_start_time:
-                try:
-                    # Intentar procesar call_start_time
-                    call_start_time = datetime.fromisoformat(call_start_time.split(".")[0])
-                    day_of_week = calendar.day_name[call_start_time.weekday()]
-                    data.append({"day_of_week": day_of_week, "duration": duration / 60})  # Convertir a minutos
-                except Exception as e:
-                    st.warning(f"Error procesando call_start_time '{call_start_time}': {e}")
-                    continue
-
-    if not data:
+    if calls.empty:
         return pd.Series(dtype=float)
 
     # Crear DataFrame
-    df = pd.DataFrame(data)
+    df = pd.DataFrame({
+        "day_of_week": calls["call_start_time"].dt.day_name(),
+        "duration": calls["duration"] / 60  # Convertir a minutos
+    })
     
     # Ordenar los días de la semana
     df["day_of_week"] = pd.Categorical(
@@ -123,37 +72,18 @@ def get_average_call_duration_by_day_of_week():
     return average_duration
 
 # Función para duración promedio por hora del día
-def get_average_call_duration_by_hour_of_day():
-    # Zona horaria de México Central
-    mexico_city_tz = pytz.timezone("America/Mexico_City")
-    utc_tz = pytz.utc
-
-    calls = collection.find(
-        {"calls.call_duration.original_total_time": {"$exists": True}},
-        {"calls.call_duration.original_total_time": 1, "calls.call_start_time": 1}
-    )
+@cached
+def get_average_call_duration_by_hour_of_day(calls_df):
+    calls = calls_df[calls_df["duration"].notna() & calls_df["call_start_time"].notna()]
 
-    data = []
-    for record in calls:
-        for call in record.get("calls", []):
-            duration = call.get("call_duration", {}).get("original_total_time")
-            call_start_time = call.get("call_start_time")
-            if duration is not None and call_start_time:
-                try:
-                    # Convertir call_start_time a UTC y luego a la hora local de México
-                    utc_time = datetime.fromisoformat(call_start_time.split(".")[0]).replace(tzinfo=utc_tz)
-                    local_time = utc_time.astimezone(mexico_city_tz)
-                    hour_of_day = local_time.hour
-                    data.append({"hour_of_day": hour_of_day, "duration": duration / 60})  # Convertir duración a minutos
-                except Exception as e:
-                    st.warning(f"Error procesando call_start_time '{call_start_time}': {e}")
-                    continue
-
-    if not data:
+    if calls.empty:
         return pd.Series(dtype=float)
 
-    # Crear DataFrame
-    df = pd.DataFrame(data)
+    # Convertir call_start_time (UTC) a la hora local de México
+    df = pd.DataFrame({
+        "hour_of_day": calls["call_start_time"].dt.tz_convert(LOCAL_TIMEZONE).dt.hour,
+        "duration": calls["duration"] / 60  # Convertir duración a minutos
+    })
 
     # Calcular la duración promedio por hora del día
     average_duration_by_hour = (
@@ -165,63 +95,99 @@ def get_average_call_duration_by_hour_of_day():
     return average_duration_by_hour
 
 # Función para porcentaje de conversación por género
-def get_chatbot_vs_human_percentage_by_gender():
-    calls = collection.find(
-        {"calls.call_duration": {"$exists": True}},
-        {"user_gender": 1, "calls.call_duration.human": 1, "calls.call_duration.bot": 1}
-    )
+@cached
+def get_chatbot_vs_human_percentage_by_gender(calls_df):
+    total_time = calls_df["human_time"] + calls_df["bot_time"]
+    calls = calls_df[(total_time > 0) & has_value(calls_df["user_gender"])]
 
-    data = []
-    for record in calls:
-        gender = record.get("user_gender")
-        for call in record.get("calls", []):
-            human_time = call.get("call_duration", {}).get("human", 0)
-            bot_time = call.get("call_duration", {}).get("bot", 0)
-            total_time = human_time + bot_time
-            if total_time > 0 and gender:
-                human_percentage = (human_time / total_time) * 100
-                bot_percentage = (bot_time / total_time) * 100
-                data.append({"gender": gender, "human_percentage": human_percentage, "bot_percentage": bot_percentage})
-
-    if not data:
+    if calls.empty:
         return pd.DataFrame(columns=["gender", "human_percentage", "bot_percentage"])
 
-    df = pd.DataFrame(data)
+    total_time = total_time[calls.index]
+    df = pd.DataFrame({
+        "gender": calls["user_gender"],
+        "human_percentage": (calls["human_time"] / total_time) * 100,
+        "bot_percentage": (calls["bot_time"] / total_time) * 100
+    })
     return df.groupby("gender")[["human_percentage", "bot_percentage"]].mean()
 
 # Función para porcentaje de conversación por edad
-def get_chatbot_vs_human_percentage_by_age():
-    calls = collection.find(
-        {"calls.call_duration": {"$exists": True}},
-        {"user_age": 1, "calls.call_duration.human": 1, "calls.call_duration.bot": 1}
-    )
+@cached
+def get_chatbot_vs_human_percentage_by_age(calls_df):
+    total_time = calls_df["human_time"] + calls_df["bot_time"]
+    calls = calls_df[(total_time > 0) & (calls_df["user_age"] >= 60)]
 
-    data = []
-    for record in calls:
-        age = record.get("user_age")
-        for call in record.get("calls", []):
-            human_time = call.get("call_duration", {}).get("human", 0)
-            bot_time = call.get("call_duration", {}).get("bot", 0)
-            total_time = human_time + bot_time
-            if total_time > 0 and age and age.isdigit() and int(age) >= 60:
-                human_percentage = (human_time / total_time) * 100
-                bot_percentage = (bot_time / total_time) * 100
-                data.append({"age": int(age), "human_percentage": human_percentage, "bot_percentage": bot_percentage})
-
-    if not data:
+    if calls.empty:
         return pd.DataFrame(columns=["age_range", "human_percentage", "bot_percentage"])
 
-    df = pd.DataFrame(data)
-    bins = np.arange(60, 95, 5)  # Rangos de edad
-    df["age_range"] = pd.cut(df["age"], bins=bins)
-
-    # Convertir los intervalos a cadenas
-    df["age_range_str"] = df["age_range"].astype(str)
+    total_time = total_time[calls.index]
+    df = pd.DataFrame({
+        "age": calls["user_age"].astype(int),
+        "human_percentage": (calls["human_time"] / total_time) * 100,
+        "bot_percentage": (calls["bot_time"] / total_time) * 100
+    })
+    df["age_range_str"] = pd.cut(df["age"], bins=AGE_BINS, labels=AGE_LABELS)
 
     grouped_data = (
-        df.groupby("age_range_str")[["human_percentage", "bot_percentage"]]
+        df.groupby("age_range_str", observed=True)[["human_percentage", "bot_percentage"]]
         .mean()
         .sort_index()
     )
 
-    return grouped_data
\ No newline at end of file
+    return grouped_data
+
+# Cuantiles exactos de duración (en minutos) por grupo. Se usa el valor de la
+# posición del cuantil sin interpolar, la misma definición que `quantiles.DurationSketch`
+def duration_quantiles(durations, by):
+    grouped = durations.groupby(by, observed=True).quantile(list(QUANTILES.values()), interpolation="lower").unstack()
+    grouped.columns = list(QUANTILES)
+    return grouped
+
+# Función para percentiles de duración por género
+@cached
+def get_call_duration_quantiles_by_gender(calls_df):
+    calls = calls_df[calls_df["duration"].notna() & has_value(calls_df["user_gender"])]
+
+    if calls.empty:
+        return pd.DataFrame(columns=list(QUANTILES))
+
+    return duration_quantiles(calls["duration"] / 60, calls["user_gender"].rename("gender"))  # Convertir a minutos
+
+# Función para percentiles de duración por edad
+@cached
+def get_call_duration_quantiles_by_age(calls_df):
+    calls = calls_df[calls_df["duration"].notna() & (calls_df["user_age"] >= 60)]
+
+    if calls.empty:
+        return pd.DataFrame(columns=list(QUANTILES))
+
+    age_range = pd.cut(calls["user_age"].astype(int), bins=AGE_BINS, labels=AGE_LABELS)
+    return duration_quantiles(calls["duration"] / 60, age_range.rename("age_range_str"))
+
+# Función para percentiles de duración por día de la semana
+@cached
+def get_call_duration_quantiles_by_day_of_week(calls_df):
+    calls = calls_df[calls_df["duration"].notna() & calls_df["call_start_time"].notna()]
+
+    if calls.empty:
+        return pd.DataFrame(columns=list(QUANTILES))
+
+    day_of_week = pd.Categorical(
+        calls["call_start_time"].dt.day_name(),
+        categories=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"],
+        ordered=True
+    )
+    return duration_quantiles(calls["duration"] / 60, pd.Series(day_of_week, index=calls.index, name="day_of_week"))
+
+# Función para percentiles de duración por hora del día
+@cached
+def get_call_duration_quantiles_by_hour_of_day(calls_df):
+    calls = calls_df[calls_df["duration"].notna() & calls_df["call_start_time"].notna()]
+
+    if calls.empty:
+        return pd.DataFrame(columns=list(QUANTILES))
+
+    # Hora local de México
+    hour_of_day = calls["call_start_time"].dt.tz_convert(LOCAL_TIMEZONE).dt.hour.rename("hour_of_day")
+    # Las horas sin llamadas quedan sin cuantiles (NaN), no en 0 minutos
+    return duration_quantiles(calls["duration"] / 60, hour_of_day).reindex(range(24)).rename_axis("hour_of_day")
@@ -0,0 +1,118 @@
+import pandas as pd
+import numpy as np
+
+# Tamaño de los rangos de duración, en minutos
+BUCKET_MINUTES = 5
+
+# Valores que se procesan por lote al recorrer una columna completa
+BATCH_SIZE = 100_000
+
+
+def duration_bucket(minutes):
+    # Rango de una duración en minutos, con la misma corrección de redondeo que `DurationHistogram.add`
+    bucket = int(np.floor(minutes / BUCKET_MINUTES))
+    if minutes < bucket * BUCKET_MINUTES:
+        bucket -= 1
+    elif minutes >= (bucket + 1) * BUCKET_MINUTES:
+        bucket += 1
+    return bucket
+
+
+class DurationHistogram:
+    """
+    Histograma de duraciones (en minutos) en rangos fijos de 5 minutos que se
+    agregan conforme aparecen duraciones mayores. Solo guarda un conteo por rango
+    y la duración máxima, así que la memoria no depende del número de llamadas.
+    """
+
+    def __init__(self):
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.max_duration = None
+
+    def _grow(self, size):
+        if size > len(self.counts):
+            self.counts = np.concatenate([self.counts, np.zeros(size - len(self.counts), dtype=np.int64)])
+
+    def _update_max(self, value):
+        if self.max_duration is None or value > self.max_duration:
+            self.max_duration = value
+
+    def add(self, durations):
+        """
+        Agrega un lote de duraciones en minutos (se ignoran los valores vacíos).
+        """
+        values = np.asarray(durations, dtype=float)
+        values = values[~np.isnan(values)]
+        if not values.size:
+            return
+        self._update_max(values.max())
+
+        values = values[values >= 0]
+        buckets = np.floor(values / BUCKET_MINUTES).astype(np.int64)
+        # Corrige el redondeo de la división en los límites exactos de los rangos
+        buckets -= values < buckets * BUCKET_MINUTES
+        buckets += values >= (buckets + 1) * BUCKET_MINUTES
+
+        batch_counts = np.bincount(buckets)
+        self._grow(len(batch_counts))
+        self.counts[:len(batch_counts)] += batch_counts
+
+    def add_series(self, durations, batch_size=BATCH_SIZE):
+        # Procesa una columna por lotes para no crear arreglos temporales del tamaño completo
+        for start in range(0, len(durations), batch_size):
+            self.add(durations.iloc[start:start + batch_size].to_numpy(dtype=float))
+
+    def add_bucket(self, bucket, count, max_duration):
+        """
+        Agrega un rango ya contado (por ejemplo, el resultado de un $group en MongoDB).
+        """
+        self._update_max(max_duration)
+        if bucket < 0:
+            # Igual que en `add`, las duraciones negativas no caen en ningún rango
+            return
+        self._grow(bucket + 1)
+        self.counts[bucket] += count
+
+    def add_bins(self, counts, edges):
+        """
+        Agrega conteos por rango sumados en otro lado (por ejemplo, en los rollups):
+        `counts` es {rango: duraciones} y `edges` {rango: duraciones exactamente en
+        el límite inferior}. El máximo solo define los intervalos de `to_series`,
+        así que basta saber en qué rango cae y si está en su límite inferior.
+        """
+        counts = {bucket: count for bucket, count in counts.items() if count}
+        if not counts:
+            return
+        last = max(counts)
+        if edges.get(last, 0) == counts[last]:
+            max_duration = float(last * BUCKET_MINUTES)
+        else:
+            max_duration = (last + 0.5) * BUCKET_MINUTES
+        for bucket, count in counts.items():
+            self.add_bucket(bucket, count, max_duration)
+
+    def to_series(self):
+        """
+        Conteo por rango con los mismos intervalos que `pd.cut`: de 0 al máximo en
+        pasos de 5 minutos, con el último límite incrementado para incluir el máximo.
+        """
+        if self.max_duration is None:
+            return pd.Series(dtype=int)
+
+        bins = np.arange(0, self.max_duration + BUCKET_MINUTES, BUCKET_MINUTES)
+        if len(bins) < 2:
+            return pd.Series(dtype=int)
+        bins[-1] += 0.1
+        labels = [str(pd.Interval(bins[i], bins[i + 1], closed='left')) for i in range(len(bins) - 1)]
+
+        counts = np.zeros(len(labels), dtype=np.int64)
+        kept = min(len(labels), len(self.counts))
+        counts[:kept] = self.counts[:kept]
+        # Un valor exactamente en el máximo cae en el último rango (límite inclusivo)
+        counts[-1] += self.counts[kept:].sum()
+
+        return pd.Series(
+            counts,
+            index=pd.CategoricalIndex(labels, categories=labels, ordered=True, name="duration_range_str"),
+            name="count"
+        )
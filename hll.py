@@ -0,0 +1,66 @@
+import streamlit as st
+import numpy as np
+import hashlib
+
+# Precisión de los sketches: 2^p registros y error estándar de 1.04 / sqrt(2^p)
+# (12 -> 1.6 %). Los rollups guardan los registros con esta precisión: si se
+# cambia hay que reconstruirlos con `rollups.rebuild_rollups`.
+HLL_PRECISION = st.secrets.get("HLL_PRECISION", 12)
+
+
+def relative_error(precision=HLL_PRECISION):
+    # Error estándar relativo del conteo aproximado
+    return 1.04 / np.sqrt(2 ** precision)
+
+
+def user_register(user_id, precision=HLL_PRECISION):
+    """
+    Registro y rango que ocupa un usuario en el sketch: los primeros `precision`
+    bits de un hash estable (el mismo en todos los procesos) eligen el registro y
+    el rango es la posición del primer 1 en los bits restantes.
+    """
+    digest = hashlib.blake2b(str(user_id).encode(), digest_size=8).digest()
+    value = int.from_bytes(digest, "big")
+    rest_bits = 64 - precision
+    rest = value & ((1 << rest_bits) - 1)
+    return value >> rest_bits, rest_bits - rest.bit_length() + 1
+
+
+class HyperLogLog:
+    """
+    Conteo aproximado de usuarios distintos. Dos sketches se mezclan tomando el
+    máximo de cada registro, así que los de varios buckets se combinan sin volver
+    a leer los usuarios. En `call_rollups` se guardan dispersos, solo los
+    registros ocupados ({"índice": rango}).
+    """
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(2 ** precision, dtype=np.uint8)
+
+    def add(self, user_id):
+        index, rank = user_register(user_id, self.precision)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add_registers(self, registers):
+        """
+        Mezcla registros dispersos: pares (índice, rango).
+        """
+        if not registers:
+            return
+        indexes, ranks = zip(*registers)
+        np.maximum.at(self.registers, np.array(indexes, dtype=np.int64), np.array(ranks, dtype=np.uint8))
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        empty = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * size and empty:
+            # Con pocos usuarios es más preciso contar los registros vacíos
+            estimate = size * np.log(size / empty)
+        return float(estimate)
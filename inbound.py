@@ -1,18 +1,8 @@
-import streamlit as st
 import pandas as pd
-from pymongo import MongoClient
-from datetime import datetime
-import calendar
 import numpy as np
-from datetime import datetime
-import pytz
-
-# Conectar a MongoDB
-MONGODB_URI = st.secrets["MONGODB_URI"]
-DATABASE_NAME = st.secrets["MONGODB_DATABASE"]
-client = MongoClient(MONGODB_URI)
-db = client[DATABASE_NAME]
-collection = db["call_information"]
+from call_data import has_value, LOCAL_TIMEZONE
+from cache import cached
+from histograms import DurationHistogram
 
 day_translation = {
     "Monday": "Lunes",
@@ -24,35 +14,20 @@ day_translation = {
     "Sunday": "Domingo"
 }
 
-def get_inbound_calls_by_day():
-    inbound_calls = collection.find(
-        {"calls": {"$elemMatch": {"type_call": "inbound"}}}, 
-        {"calls": 1}  # Solo necesitas el campo `calls`
-    )
+@cached
+def get_inbound_calls_by_day(calls_df):
+    inbound_calls = calls_df[
+        (calls_df["type_call"] == "inbound") & calls_df["call_start_time"].notna()
+    ]
 
-    data = []
-    for record in inbound_calls:
-        for call in record.get("calls", []):
-            if call.get("type_call") == "inbound":
-                call_start_time = call.get("call_start_time")
-                if call_start_time:
-                    try:
-                        # Convertir el tiempo de inicio de la llamada al formato datetime
-                        call_start_time = datetime.fromisoformat(call_start_time.split(".")[0])
-                        day_of_week = calendar.day_name[call_start_time.weekday()]
-                        day_of_week_spanish = day_translation[day_of_week]
-                        data.append({"day_of_week": day_of_week_spanish})
-                    except Exception as e:
-                        # Manejar errores de conversión de fecha
-                        print(f"Error procesando la llamada: {e}")
-                        continue
-
-    if not data:
+    if inbound_calls.empty:
         # Si no hay datos, retornar una serie vacía
         return pd.Series(dtype=int)
 
-    # Convertir la lista de datos a un DataFrame
-    df = pd.DataFrame(data)
+    # Día de la semana de cada llamada, traducido al español
+    df = pd.DataFrame({
+        "day_of_week": inbound_calls["call_start_time"].dt.day_name().map(day_translation)
+    })
 
     # Contar llamadas por día de la semana
     inbound_calls_by_day = (
@@ -70,39 +45,20 @@ def get_inbound_calls_by_day():
 
     return inbound_calls_by_day.sort_index()
 
-def get_inbound_calls_by_hour():
-    # Zona horaria de México Central
-    mexico_city_tz = pytz.timezone("America/Mexico_City")
-    utc_tz = pytz.utc
-
-    inbound_calls = collection.find(
-        {"calls": {"$elemMatch": {"type_call": "inbound"}}}, 
-        {"calls": 1}  # Solo necesitas el campo `calls`
-    )
+@cached
+def get_inbound_calls_by_hour(calls_df):
+    inbound_calls = calls_df[
+        (calls_df["type_call"] == "inbound") & calls_df["call_start_time"].notna()
+    ]
 
-    data = []
-    for record in inbound_calls:
-        for call in record.get("calls", []):
-            if call.get("type_call") == "inbound":
-                call_start_time = call.get("call_start_time")
-                if call_start_time:
-                    try:
-                        # Convertir la hora en formato naive a UTC y luego a la hora local de México
-                        utc_time = datetime.fromisoformat(call_start_time.split(".")[0]).replace(tzinfo=utc_tz)
-                        local_time = utc_time.astimezone(mexico_city_tz)
-                        hour_of_day = local_time.hour
-                        data.append({"hour_of_day": hour_of_day})
-                    except Exception as e:
-                        # Manejar errores de conversión de fecha
-                        print(f"Error procesando la llamada: {e}")
-                        continue
-
-    if not data:
+    if inbound_calls.empty:
         # Si no hay datos, retornar una serie vacía
         return pd.Series(dtype=int)
 
-    # Convertir la lista de datos a un DataFrame
-    df = pd.DataFrame(data)
+    # Convertir la hora UTC a la hora local de México
+    df = pd.DataFrame({
+        "hour_of_day": inbound_calls["call_start_time"].dt.tz_convert(LOCAL_TIMEZONE).dt.hour
+    })
 
     # Contar llamadas por hora
     inbound_calls_by_hour = (
@@ -114,168 +70,130 @@ def get_inbound_calls_by_hour():
 
     return inbound_calls_by_hour
 
-def get_inbound_calls_by_gender():
-    inbound_calls = collection.find(
-        {"calls.type_call": "inbound"}, 
-        {"calls": 1, "user_gender": 1}  # Incluye solo los campos necesarios
-    )
+@cached
+def get_inbound_calls_by_gender(calls_df):
+    # Una fila por llamada inbound de usuarios con género registrado
+    inbound_calls = calls_df[
+        (calls_df["type_call"] == "inbound") & has_value(calls_df["user_gender"])
+    ]
 
-    data = []
-    for record in inbound_calls:
-        gender = record.get("user_gender")
-        calls = record.get("calls", [])
-        if gender and calls:
-            # Itera a través de las llamadas para agregar una entrada por llamada
-            for call in calls:
-                if call.get("type_call") == "inbound":
-                    data.append({"gender": gender})
-
-    if not data:
+    if inbound_calls.empty:
         # Si no hay datos, retorna una serie vacía
         return pd.Series(dtype=int)
 
-    # Convierte los datos en un DataFrame
-    df = pd.DataFrame(data)
+    df = pd.DataFrame({"gender": inbound_calls["user_gender"]})
 
     # Cuenta las llamadas por género
     inbound_calls_by_gender = df["gender"].value_counts()
 
     return inbound_calls_by_gender
 
-def get_inbound_calls_by_duration():
-    inbound_calls = collection.find(
-        {"calls.type_call": "inbound"}, 
-        {"calls": 1}  # Incluye solo los campos necesarios
-    )
+@cached
+def get_inbound_calls_by_duration(calls_df):
+    # Solo la columna de duración, sin copiar el resto del DataFrame
+    durations = calls_df.loc[
+        (calls_df["type_call"] == "inbound") & calls_df["duration"].notna(), "duration"
+    ]
 
-    data = []
-    for record in inbound_calls:
-        for call in record.get("calls", []):
-            if call.get("type_call") == "inbound":
-                duration_seconds = call.get("call_duration", {}).get("original_total_time")  # Duración en segundos
-                if duration_seconds is not None:
-                    # Convierte la duración a minutos
-                    duration_minutes = duration_seconds / 60
-                    data.append({"call_duration": duration_minutes})
-
-    if not data:
+    if durations.empty:
         # Si no hay datos, retorna una serie vacía
         return pd.Series(dtype=int)
-    #st.write(f"Tamaño de los datos procesados: {len(data)}")
-
-    # Convierte los datos a un DataFrame
-    df = pd.DataFrame(data)
-
-    # Define los intervalos en minutos (rango de 5 minutos)
-    max_duration = df["call_duration"].max()
-    bins = np.arange(0, max_duration + 5, 5)
-    # Incrementar el último límite para incluir valores exactos al máximo
-    bins[-1] += 0.1  # Asegura que el límite superior sea inclusivo
-    df["duration_range"] = pd.cut(df["call_duration"], bins=bins, right=False, include_lowest=True)
-
-
-    # Asegura el orden correcto de los intervalos y convierte a strings para el eje X
-    ordered_intervals = pd.IntervalIndex([pd.Interval(bins[i], bins[i + 1], closed='left') for i in range(len(bins) - 1)])
-
-    # Asegura que los datos respeten este orden
-    df["duration_range_str"] = pd.Categorical(
-        df["duration_range"].astype(str),
-        categories=[str(interval) for interval in ordered_intervals],
-        ordered=True
-    )
-
-    # Cuenta las llamadas por rango de duración
-    grouped_data = df["duration_range_str"].value_counts().sort_index()
-
-    # Reordena los resultados basados en los intervalos ordenados
-    #grouped_data = grouped_data.sort_index()
-
-    return grouped_data
 
-def get_inbound_calls_by_age():
-    inbound_calls = collection.find({"calls.type_call": "inbound"}, {"calls": 1, "user_age": 1})
+    # Cuenta por rangos de 5 minutos sin crear una etiqueta por llamada
+    histogram = DurationHistogram()
+    histogram.add_series(durations / 60)  # Convierte la duración (en segundos) a minutos
+    return histogram.to_series()
 
-    data = []
-    for record in inbound_calls:
-        age = record.get("user_age")
-        calls = record.get("calls", [])
-        if age and age.isdigit() and int(age) >= 60:
-            for call in calls:
-                if call.get("type_call") == "inbound":
-                    data.append({"call_id": call.get("call_id"), "age": int(age)})
+@cached
+def get_inbound_calls_by_age(calls_df):
+    inbound_calls = calls_df[
+        (calls_df["type_call"] == "inbound") & (calls_df["user_age"] >= 60)
+    ]
 
-    if not data:
+    if inbound_calls.empty:
         return pd.Series(dtype=int)
 
-    df = pd.DataFrame(data)
+    df = pd.DataFrame({
+        "call_id": inbound_calls["call_id"],
+        "age": inbound_calls["user_age"].astype(int)
+    })
     bins = np.arange(60, df["age"].max() + 5, 5)
-    df["age_range"] = pd.cut(df["age"], bins=bins)
-    df["age_range_str"] = pd.Categorical(
-        df["age_range"].astype(str),
-        categories=[str(interval) for interval in pd.IntervalIndex.from_breaks(bins)],
-        ordered=True
-    )
+    # Etiquetas explícitas: `astype(str)` de los intervalos cambia a "(60.0, 65.0]" si alguna edad queda fuera
+    labels = [str(interval) for interval in pd.IntervalIndex.from_breaks(bins)]
+    df["age_range_str"] = pd.cut(df["age"], bins=bins, labels=labels)
 
-    grouped_data = df.groupby("age_range_str")["call_id"].count()
+    grouped_data = df.groupby("age_range_str", observed=False)["call_id"].count()
     return grouped_data
 
-def get_calls_distribution():
-    inbound_calls = collection.find(
-        {"calls": {"$elemMatch": {"type_call": "inbound"}}},
-        {"calls": 1, "user_id": 1, "user_gender": 1, "user_age": 1}
+# Rangos de la tabla de distribución por número de llamadas, edad y género
+CALL_BINS = [0, 3, 4, 6, 8, float("inf")]
+CALL_LABELS = ["0-3", "4", "5-6", "7-8", "9 o más"]
+DISTRIBUTION_AGE_BINS = [60, 65, 70, 75, 80, 85, 90, float("inf")]
+DISTRIBUTION_AGE_LABELS = ["60-65", "66-70", "71-75", "76-80", "81-85", "86-90", "90 o más"]
+DISTRIBUTION_GENDERS = {"Female": "Mujer", "Male": "Hombre"}
+
+
+def count_calls_distribution(users):
+    """
+    Tabla numérica de la distribución a partir de un DataFrame con `gender`,
+    `age`, `num_calls` y `users` (número de usuarios de cada fila). Regresa el
+    número de usuarios por rango de llamadas, con una columna por género y rango de edad.
+    """
+    users = users[users["gender"].isin(list(DISTRIBUTION_GENDERS))]
+    call_range = pd.cut(users["num_calls"], bins=CALL_BINS, labels=CALL_LABELS, right=True)
+    age_range = pd.cut(users["age"], bins=DISTRIBUTION_AGE_BINS, labels=DISTRIBUTION_AGE_LABELS, right=True)
+
+    counts = (
+        users.groupby([call_range.rename("# de llamadas"), users["gender"], age_range.rename("age_range")], observed=True)["users"]
+        .sum()
+        .unstack(["gender", "age_range"], fill_value=0)
+        .sort_index(axis=1)
     )
-
-    data = []
-    for record in inbound_calls:
-        user_id = record.get("user_id")
-        user_gender = record.get("user_gender")
-        user_age = int(record.get("user_age", 0)) if record.get("user_age") and record.get("user_age").isdigit() else None
-        num_calls = len([call for call in record.get("calls", []) if call.get("type_call") == "inbound"])
-        data.append({"user_id": user_id, "gender": user_gender, "age": user_age, "num_calls": num_calls})
-
-    df = pd.DataFrame(data)
-    call_bins = [0, 3, 4, 6, 8, float("inf")]
-    call_labels = ["0-3", "4", "5-6", "7-8", "9 o más"]
-    df["call_range"] = pd.cut(df["num_calls"], bins=call_bins, labels=call_labels, right=True)
-    
-    age_bins = [60, 65, 70, 75, 80, 85, 90, float("inf")]
-    age_labels = ["60-65", "66-70", "71-75", "76-80", "81-85", "86-90", "90 o más"]
-    df["age_range"] = pd.cut(df["age"], bins=age_bins, labels=age_labels, right=True)
-
-    summary_table = pd.pivot_table(
-        df,
-        values="user_id",
-        index="call_range",
-        columns=["gender", "age_range"],
-        aggfunc="nunique",
-        fill_value=0
-    )
-    summary_table = summary_table.apply(
-        lambda x: x.astype(str) + "/" + x.groupby(level=0).sum().astype(str), axis=0
+    if counts.empty:
+        return pd.DataFrame()
+    counts.columns = pd.MultiIndex.from_tuples(
+        [(DISTRIBUTION_GENDERS[gender], age_range) for gender, age_range in counts.columns]
     )
-
-    # Convertir el índice `call_range` en una columna
-    summary_table.reset_index(inplace=True)
-
-    # Renombrar la columna `call_range` como "# de llamadas"
-    summary_table.rename(columns={"call_range": "# de llamadas"}, inplace=True)
-    
-    #Ajustar encabezados para agregar el título de la columna "# de llamadas"
-    columns = [("# de llamadas", "")] + [(gender, age_range) for gender, age_range in summary_table.columns[1:]]
-
-    # Filtrar las columnas para eliminar las no deseadas
-    columns_to_keep = [("# de llamadas", "")] + [
-        col for col in columns if col[0] in ["Female", "Male"]
-    ]
-
-    # Actualizar los encabezados con las columnas a mantener
-    summary_table = summary_table[[col for col in summary_table.columns if col in columns_to_keep]]
-    summary_table.columns = pd.MultiIndex.from_tuples(columns_to_keep)
-    
-    # Renombrar los géneros a español
-    summary_table.columns = pd.MultiIndex.from_tuples(
-        [("# de llamadas", "# de llamadas")] + 
-        [("Mujer" if gender == "Female" else "Hombre", age_range) for gender, age_range in summary_table.columns[1:]]
+    return counts.astype(np.int64)
+
+@cached
+def get_calls_distribution_counts(calls_df):
+    """
+    Número de usuarios (enteros) por rango de llamadas inbound, con una columna
+    por género y rango de edad. Es la versión numérica de la tabla para descargas.
+    """
+    inbound_calls = calls_df[calls_df["type_call"] == "inbound"]
+
+    if inbound_calls.empty:
+        return pd.DataFrame()
+
+    # Una fila por usuario con su número de llamadas inbound
+    df = (
+        inbound_calls.groupby("user_id", sort=False)
+        .agg(
+            gender=("user_gender", "first"),
+            age=("user_age", "first"),
+            num_calls=("type_call", "size")
+        )
     )
-
-    return summary_table
+    df["users"] = 1
+    return count_calls_distribution(df)
+
+@cached
+def get_calls_distribution(calls_distribution_counts):
+    """
+    Tabla para mostrar a partir de `get_calls_distribution_counts`: cada celda
+    como "n/total", donde total es el número de usuarios de ese género y rango de edad.
+    """
+    if calls_distribution_counts.empty:
+        return pd.DataFrame()
+
+    counts = calls_distribution_counts
+    summary_table = counts.astype(str) + "/" + counts.sum().astype(str)
+    summary_table.insert(0, ("# de llamadas", "# de llamadas"), counts.index)
+    return summary_table.reset_index(drop=True)
+
+def get_calls_distribution_styler(calls_distribution_table):
+    # El Styler es mutable: se arma en cada render a partir de la tabla en caché,
+    # así ninguna sesión modifica el objeto que ve otra
+    return calls_distribution_table.style.set_caption("Distribución por género y rangos de edad")
@@ -0,0 +1,205 @@
+import sys
+from datetime import datetime, timedelta
+from db import get_collection, get_database
+from call_data import build_filters, calls_data_request
+from topics import topic_data_request
+from aggregations import (
+    calls_pipeline, count_by, inbound_by_gender_pipeline, outbound_users_pipeline,
+    calls_distribution_pipeline, topic_cube_pipeline,
+)
+from rollups import rollup_query, refresh_pipeline, window_bucket_query, lookback_start, ROLLUP_COLLECTION
+from disk_cache import LATEST_CALL_QUERY, LATEST_CALL_PROJECTION, LATEST_CALL_SORT
+from live_metrics import window_pipeline, window_start
+
+# Índices recomendados por colección: (campos, nombre)
+RECOMMENDED_INDEXES = {
+    "call_information": [
+        # Histogramas por tipo de llamada, con o sin rango de fechas (igualdad antes que rango)
+        ([("calls.type_call", 1), ("calls.call_start_time", 1)], "calls_type_call_start_time"),
+        # Rango de fechas sin tipo de llamada y actualización incremental de los rollups
+        ([("calls.call_start_time", 1)], "calls_start_time"),
+        # Filtros de segmento y opciones del filtro de género
+        ([("user_gender", 1), ("user_age", 1)], "user_gender_age"),
+        ([("user_age", 1)], "user_age"),
+    ],
+    ROLLUP_COLLECTION: [
+        ([("_id.day", 1)], "rollup_day"),
+    ],
+}
+
+
+def sample_filters():
+    """
+    Filtros representativos de lo que se consulta desde el menú lateral.
+    """
+    today = datetime.utcnow().date()
+    last_week = (today - timedelta(days=6), today)
+    return {
+        "sin filtros": None,
+        "últimos 7 días": build_filters(date_range=last_week),
+        "inbound últimos 7 días": build_filters(date_range=last_week, type_call="inbound"),
+        "Female 70-74": build_filters(user_gender="Female", age_range=(70, 74)),
+    }
+
+
+def query_shape(name, request, expect_index, collection="call_information"):
+    # `request` es la consulta tal como la arma el código que la ejecuta (ver `call_data.calls_request`)
+    return {"name": name, "collection": collection, **request, "expect_index": expect_index}
+
+
+def aggregate_request(pipeline):
+    return {"kind": "aggregate", "pipeline": pipeline}
+
+
+def find_request(query, projection=None, **options):
+    return {"kind": "find", "query": query, "projection": projection, **options}
+
+
+def query_shapes():
+    """
+    Todas las formas de consulta que hace el dashboard, armadas con las mismas
+    funciones que usan las páginas y los procesos en segundo plano. Cada forma es
+    un diccionario con nombre, colección, tipo (find, aggregate o distinct), la
+    consulta y si debe usar un índice (las consultas sin filtros recorren toda la
+    historia de todos modos).
+    """
+    shapes = []
+    for label, filters in sample_filters().items():
+        shapes.append(query_shape(f"llamadas ({label})", calls_data_request(filters), filters is not None))
+        shapes.append(query_shape(f"temas ({label})", topic_data_request(filters), filters is not None))
+        for type_call in ["inbound", "outbound"]:
+            # El inicio del pipeline es el que decide el plan; las demás etapas trabajan en memoria
+            pipeline = calls_pipeline(type_call, filters=filters)
+            shapes.append(query_shape(f"aggregate {type_call} ({label})", aggregate_request(pipeline), True))
+        pipelines = {
+            "inbound por género": inbound_by_gender_pipeline(filters),
+            "usuarios outbound": outbound_users_pipeline(count_by("$user_age"), filters=filters),
+            "distribución de llamadas": calls_distribution_pipeline(filters),
+        }
+        for name, pipeline in pipelines.items():
+            shapes.append(query_shape(f"aggregate {name} ({label})", aggregate_request(pipeline), True))
+        # Sin filtros el cubo recorre todas las llamadas con temas
+        pipeline = topic_cube_pipeline(filters)
+        shapes.append(query_shape(f"aggregate cubo de temas ({label})", aggregate_request(pipeline), filters is not None))
+        shapes.append(query_shape(
+            f"rollups ({label})",
+            find_request(rollup_query(filters)),
+            filters is not None and "date_range" in filters,
+            collection=ROLLUP_COLLECTION
+        ))
+
+    start_day = lookback_start((datetime.utcnow() - timedelta(days=1)).isoformat())
+    shapes.append(query_shape("actualización de rollups (ventana)", aggregate_request(refresh_pipeline(start_day)), True))
+    shapes.append(query_shape(
+        "rollups guardados de la ventana",
+        find_request(window_bucket_query(start_day)),
+        True,
+        collection=ROLLUP_COLLECTION
+    ))
+    shapes.append(query_shape(
+        "marca de agua del caché en disco",
+        find_request(LATEST_CALL_QUERY, LATEST_CALL_PROJECTION, sort=LATEST_CALL_SORT, limit=1),
+        True
+    ))
+    shapes.append(query_shape("carga inicial de métricas en vivo", aggregate_request(window_pipeline(window_start())), True))
+    shapes.append(query_shape("opciones de género", {"kind": "distinct", "key": "user_gender"}, True))
+    return shapes
+
+
+def explain_shape(shape):
+    collection = get_collection(shape["collection"])
+    if shape["kind"] == "find":
+        cursor = collection.find(shape["query"], shape["projection"])
+        if shape.get("sort"):
+            cursor = cursor.sort(shape["sort"])
+        if shape.get("limit"):
+            cursor = cursor.limit(shape["limit"])
+        return cursor.explain()
+    if shape["kind"] == "aggregate":
+        command = {"aggregate": shape["collection"], "pipeline": shape["pipeline"], "cursor": {}}
+    else:
+        command = {"distinct": shape["collection"], "key": shape["key"], "query": {}}
+    return get_database().command("explain", command, verbosity="executionStats")
+
+
+def find_values(document, key):
+    """
+    Busca recursivamente los valores de `key` en la salida de explain, que cambia
+    de estructura según el tipo de consulta y la versión del servidor.
+    """
+    if isinstance(document, dict):
+        for name, value in document.items():
+            if name == key:
+                yield value
+            yield from find_values(value, key)
+    elif isinstance(document, list):
+        for item in document:
+            yield from find_values(item, key)
+
+
+def summarize_explain(explain):
+    """
+    Resume el plan ganador: etapas, índices usados y documentos examinados
+    contra documentos regresados.
+    """
+    stages = []
+    indexes = []
+    for plan in find_values(explain, "winningPlan"):
+        stages += list(find_values(plan, "stage"))
+        indexes += list(find_values(plan, "indexName"))
+
+    stats = next(find_values(explain, "executionStats"), {})
+    docs_examined = stats.get("totalDocsExamined", 0)
+    returned = stats.get("nReturned", 0)
+    return {
+        "collscan": "COLLSCAN" in stages,
+        "stages": stages,
+        "indexes": sorted(set(indexes)),
+        "keys_examined": stats.get("totalKeysExamined", 0),
+        "docs_examined": docs_examined,
+        "returned": returned,
+        "ratio": docs_examined / returned if returned else None,
+    }
+
+
+def create_recommended_indexes():
+    # create_index no hace nada si el índice ya existe con las mismas opciones
+    created = []
+    for collection_name, indexes in RECOMMENDED_INDEXES.items():
+        for keys, name in indexes:
+            created.append(get_collection(collection_name).create_index(keys, name=name))
+    return created
+
+
+def report():
+    """
+    Ejecuta explain sobre cada forma de consulta e imprime el plan. Regresa las
+    formas que deberían usar un índice pero hacen COLLSCAN.
+    """
+    problems = []
+    for shape in query_shapes():
+        summary = summarize_explain(explain_shape(shape))
+        ratio = f"{summary['ratio']:.1f}" if summary["ratio"] is not None else "-"
+        plan = "COLLSCAN" if summary["collscan"] else ", ".join(summary["indexes"]) or "/".join(summary["stages"])
+        print(
+            f"{shape['name']}: {plan} | claves {summary['keys_examined']} | "
+            f"documentos {summary['docs_examined']} | regresados {summary['returned']} | "
+            f"examinados/regresados {ratio}"
+        )
+        if summary["collscan"] and shape["expect_index"]:
+            problems.append(shape["name"])
+    return problems
+
+
+if __name__ == "__main__":
+    # Uso: python indexes.py [--create]  (usa la conexión de .streamlit/secrets.toml)
+    if "--create" in sys.argv:
+        for name in create_recommended_indexes():
+            print(f"Índice listo: {name}")
+
+    problems = report()
+    if problems:
+        print(f"\n{len(problems)} consultas sin índice:")
+        for name in problems:
+            print(f"  - {name}")
+        sys.exit(1)
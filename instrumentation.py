@@ -0,0 +1,268 @@
+import streamlit as st
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import bson
+from pymongo import monitoring
+
+# Escribe cada operación como una línea JSON en el logger "kuidalos.metrics"
+INSTRUMENTATION_LOG = st.secrets.get("INSTRUMENTATION_LOG", False)
+# Medir el tamaño de las respuestas de MongoDB implica volver a codificarlas en BSON
+MEASURE_RESPONSE_BYTES = st.secrets.get("MEASURE_RESPONSE_BYTES", True)
+# Puerto del endpoint con las métricas en formato de texto de Prometheus (desactivado si no se configura)
+METRICS_PORT = st.secrets.get("METRICS_PORT", None)
+# Interfaz del endpoint de métricas; no tiene autenticación, así que por omisión solo escucha en local
+METRICS_HOST = st.secrets.get("METRICS_HOST", "127.0.0.1")
+# Operaciones recientes que se guardan para el panel de diagnóstico
+RECENT_OPERATIONS = 500
+
+logger = logging.getLogger("kuidalos.metrics")
+# Errores de los procesos en segundo plano y de las consultas, con su traceback
+error_logger = logging.getLogger("kuidalos.errors")
+
+_lock = threading.Lock()
+_local = threading.local()
+_recent = deque(maxlen=RECENT_OPERATIONS)
+_sequence = 0
+# Acumulados desde que inició el proceso, por operación y por comando de MongoDB
+_operation_totals = {}
+_command_totals = {}
+_error_totals = {}
+_server = None
+
+
+def _stack():
+    # Operaciones en curso en este hilo; los comandos se asignan a la más interna
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def _add_totals(totals, name, values):
+    entry = totals.setdefault(name, {})
+    for key, value in values.items():
+        entry[key] = entry.get(key, 0) + value
+
+
+def record_operation(operation):
+    global _sequence
+    with _lock:
+        _sequence += 1
+        operation["sequence"] = _sequence
+        _recent.append(operation)
+        _add_totals(_operation_totals, operation["name"], {
+            "count": 1,
+            "cache_hits": int(operation["cached"]),
+            "duration": operation["duration"],
+            "mongo_time": operation["mongo_time"],
+            "python_time": operation["python_time"],
+            "documents_returned": operation["documents_returned"],
+            "response_bytes": operation["response_bytes"],
+            "rows": operation["rows"] or 0,
+        })
+    if INSTRUMENTATION_LOG:
+        logger.info(json.dumps(operation, default=str))
+
+
+@contextmanager
+def track_operation(name):
+    """
+    Mide una función de datos: duración total, tiempo en comandos de MongoDB,
+    documentos y bytes recibidos, y el resto como tiempo de Python (construcción
+    de DataFrames y cálculo). Quien la usa puede llenar `rows` con el resultado.
+    """
+    operation = {
+        "name": name,
+        "cached": False,
+        "started_at": time.time(),
+        "commands": 0,
+        "mongo_time": 0.0,
+        "documents_returned": 0,
+        "response_bytes": 0,
+        "rows": None,
+    }
+    stack = _stack()
+    stack.append(operation)
+    start = time.perf_counter()
+    try:
+        yield operation
+    finally:
+        stack.pop()
+        operation["duration"] = time.perf_counter() - start
+        operation["python_time"] = max(0.0, operation["duration"] - operation["mongo_time"])
+        if stack:
+            # La operación externa incluye el tiempo de MongoDB de las internas
+            for key in ["commands", "mongo_time", "documents_returned", "response_bytes"]:
+                stack[-1][key] += operation[key]
+        record_operation(operation)
+
+
+def record_error(name, error):
+    """
+    Registra un error que no interrumpe la página (un hilo en segundo plano que
+    reintenta, una lectura opcional que falla): se escribe en el logger
+    "kuidalos.errors" y se cuenta en las métricas de Prometheus.
+    """
+    with _lock:
+        _add_totals(_error_totals, name, {"count": 1})
+    error_logger.warning("%s: %s", name, error, exc_info=(type(error), error, error.__traceback__))
+
+
+def record_cache_hit(name):
+    record_operation({
+        "name": name,
+        "cached": True,
+        "started_at": time.time(),
+        "commands": 0,
+        "duration": 0.0,
+        "mongo_time": 0.0,
+        "python_time": 0.0,
+        "documents_returned": 0,
+        "response_bytes": 0,
+        "rows": None,
+    })
+
+
+def documents_returned(reply):
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if "values" in reply:
+        return len(reply["values"])
+    return reply.get("n", 0)
+
+
+def record_command(command_name, duration, documents, response_bytes, failed=False):
+    with _lock:
+        _add_totals(_command_totals, command_name, {
+            "count": 1,
+            "failures": int(failed),
+            "duration": duration,
+            "documents_returned": documents,
+            "response_bytes": response_bytes,
+        })
+    stack = _stack()
+    if stack:
+        operation = stack[-1]
+        operation["commands"] += 1
+        operation["mongo_time"] += duration
+        operation["documents_returned"] += documents
+        operation["response_bytes"] += response_bytes
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Registra cada comando de MongoDB. pymongo publica los eventos en el mismo
+    hilo que ejecuta el comando, así que se asignan a la operación en curso.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        response_bytes = len(bson.encode(event.reply)) if MEASURE_RESPONSE_BYTES else 0
+        record_command(
+            event.command_name,
+            event.duration_micros / 1e6,
+            documents_returned(event.reply),
+            response_bytes
+        )
+
+    def failed(self, event):
+        record_command(event.command_name, event.duration_micros / 1e6, 0, 0, failed=True)
+
+
+command_metrics = CommandMetrics()
+
+
+def current_sequence():
+    with _lock:
+        return _sequence
+
+
+def get_recent_operations(since=0):
+    with _lock:
+        return [dict(operation) for operation in _recent if operation["sequence"] > since]
+
+
+def get_command_totals():
+    with _lock:
+        return {name: dict(totals) for name, totals in _command_totals.items()}
+
+
+def prometheus_metrics():
+    """
+    Acumulados del proceso en el formato de texto de Prometheus.
+    """
+    with _lock:
+        operations = {name: dict(totals) for name, totals in _operation_totals.items()}
+        commands = {name: dict(totals) for name, totals in _command_totals.items()}
+        errors = {name: totals["count"] for name, totals in _error_totals.items()}
+
+    lines = []
+
+    def metric(name, kind, help_text, label, values):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for label_value, value in sorted(values.items()):
+            lines.append(f'{name}{{{label}="{label_value}"}} {value}')
+
+    metric("kuidalos_operation_calls_total", "counter", "Llamadas a funciones de datos.",
+           "operation", {name: totals["count"] for name, totals in operations.items()})
+    metric("kuidalos_operation_cache_hits_total", "counter", "Resultados servidos desde el caché.",
+           "operation", {name: totals["cache_hits"] for name, totals in operations.items()})
+    metric("kuidalos_operation_duration_seconds_total", "counter", "Tiempo total de las funciones de datos.",
+           "operation", {name: totals["duration"] for name, totals in operations.items()})
+    metric("kuidalos_operation_python_seconds_total", "counter", "Tiempo de Python fuera de MongoDB.",
+           "operation", {name: totals["python_time"] for name, totals in operations.items()})
+    metric("kuidalos_operation_rows_total", "counter", "Filas de los resultados construidos.",
+           "operation", {name: totals["rows"] for name, totals in operations.items()})
+    metric("kuidalos_mongo_commands_total", "counter", "Comandos enviados a MongoDB.",
+           "command", {name: totals["count"] for name, totals in commands.items()})
+    metric("kuidalos_mongo_command_failures_total", "counter", "Comandos de MongoDB con error.",
+           "command", {name: totals["failures"] for name, totals in commands.items()})
+    metric("kuidalos_mongo_command_seconds_total", "counter", "Tiempo total de los comandos de MongoDB.",
+           "command", {name: totals["duration"] for name, totals in commands.items()})
+    metric("kuidalos_mongo_documents_returned_total", "counter", "Documentos recibidos de MongoDB.",
+           "command", {name: totals["documents_returned"] for name, totals in commands.items()})
+    metric("kuidalos_mongo_response_bytes_total", "counter", "Bytes BSON recibidos de MongoDB.",
+           "command", {name: totals["response_bytes"] for name, totals in commands.items()})
+    metric("kuidalos_errors_total", "counter", "Errores registrados fuera de las páginas.", "source", errors)
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = prometheus_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """
+    Inicia (una sola vez por proceso) el endpoint HTTP con las métricas de
+    Prometheus, si METRICS_PORT está configurado. Escucha en `host`
+    (METRICS_HOST); para exponerlo fuera del equipo hay que configurarlo.
+    """
+    global _server
+    with _lock:
+        if _server is not None or not port:
+            return
+        try:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            # No se reintenta en cada recarga de la página
+            _server = False
+            error_logger.error("No se pudo iniciar el endpoint de métricas en %s:%s: %s", host, port, e)
+            return
+    threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
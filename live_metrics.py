@@ -0,0 +1,280 @@
+import streamlit as st
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import OperationFailure
+from call_data import parse_age, parse_call_start_time, trimmed_calls_stage
+from cache import make_key
+from db import get_collection
+from instrumentation import track_operation, record_error
+from rollups import add_call_buckets, rollup_frame, CALL_MEASURES, TOPIC_MEASURES, BIN_MEASURES
+
+LIVE_WINDOW_HOURS = st.secrets.get("LIVE_WINDOW_HOURS", 24)  # Horas que cubren los contadores en vivo
+LIVE_RETRY_SECONDS = 30  # Espera antes de reconectar si el change stream falla
+LIVE_PRUNE_SECONDS = 300  # Cada cuánto se descartan los buckets fuera de la ventana
+LIVE_FRAME_SLOTS = 16  # Combinaciones de filtros con un DataFrame en vivo guardado
+
+# Códigos de error de MongoDB: servidor sin replica set, y punto de reanudación ya no disponible
+CHANGE_STREAM_UNSUPPORTED = 40573
+CHANGE_STREAM_HISTORY_LOST = 286
+
+# Campos de la llamada que usan los buckets (ver `rollups.add_call_buckets`)
+LIVE_PROJECTION = {
+    "user_age": 1,
+    "user_gender": 1,
+    "calls.type_call": 1,
+    "calls.call_start_time": 1,
+    "calls.call_duration.original_total_time": 1,
+    "calls.call_duration.bot": 1,
+    "calls.call_duration.human": 1,
+    "calls.analysis.times_by_subject": 1,
+}
+
+_watch_thread = None
+_watch_lock = threading.Lock()
+# {filtros: (versión de los contadores, DataFrame)}, ver `get_live_data`
+_frames = OrderedDict()
+_frames_lock = threading.Lock()
+
+
+def window_start(now=None):
+    # Inicio de la ventana en vivo, como texto ISO en UTC (el formato de `call_start_time`);
+    # `now` lleva zona horaria
+    now = (now or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    return (now - timedelta(hours=LIVE_WINDOW_HOURS)).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def document_buckets(document, since):
+    """
+    Buckets (mismo formato que `call_rollups`) de las llamadas de un documento
+    de usuario con `call_start_time` dentro de la ventana.
+    """
+    buckets = {}
+    user_age = parse_age(document.get("user_age"))
+    user_gender = document.get("user_gender")
+    for call in document.get("calls") or []:
+        raw_start_time = call.get("call_start_time")
+        if not isinstance(raw_start_time, str) or raw_start_time < since:
+            continue
+        call_start_time = parse_call_start_time(raw_start_time)
+        if call_start_time is None:
+            continue
+        add_call_buckets(buckets, call, call_start_time, user_gender, user_age)
+    return buckets
+
+
+class LiveCounters:
+    """
+    Buckets en memoria de las llamadas de la ventana en vivo. Se guarda la
+    contribución de cada documento de usuario: cuando el documento cambia se
+    resta la anterior y se suma la nueva, así que aplicar el mismo documento dos
+    veces (carga inicial y evento del change stream) no cuenta doble.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.documents = {}
+        self.buckets = {}
+        self.version = 0
+
+    def _add(self, contribution, sign):
+        for bucket_id, (key, totals) in contribution.items():
+            if bucket_id not in self.buckets:
+                self.buckets[bucket_id] = (key, {})
+            bucket_totals = self.buckets[bucket_id][1]
+            for name, value in totals.items():
+                bucket_totals[name] = bucket_totals.get(name, 0) + sign * value
+            if not bucket_totals.get("calls") and not bucket_totals.get("topic_calls"):
+                del self.buckets[bucket_id]
+
+    def apply_document(self, document_id, document, since):
+        """
+        Reemplaza la contribución de un documento (None si se borró).
+        """
+        contribution = document_buckets(document, since) if document is not None else {}
+        with self.lock:
+            previous = self.documents.pop(document_id, {})
+            if not previous and not contribution:
+                return
+            self._add(previous, -1)
+            self._add(contribution, 1)
+            if contribution:
+                self.documents[document_id] = contribution
+            self.version += 1
+
+    def prune(self, since):
+        """
+        Descarta los buckets de llamadas que ya salieron de la ventana.
+        """
+        day, hour = since[:10], int(since[11:13])
+        with self.lock:
+            changed = False
+            for document_id in list(self.documents):
+                contribution = self.documents[document_id]
+                expired = {
+                    bucket_id: bucket for bucket_id, bucket in contribution.items()
+                    if (bucket[0]["day"], bucket[0]["hour"]) < (day, hour)
+                }
+                if not expired:
+                    continue
+                self._add(expired, -1)
+                for bucket_id in expired:
+                    del contribution[bucket_id]
+                if not contribution:
+                    del self.documents[document_id]
+                changed = True
+            if changed:
+                self.version += 1
+
+    def reset(self):
+        with self.lock:
+            self.documents.clear()
+            self.buckets.clear()
+            self.version += 1
+
+    def bucket_documents(self):
+        with self.lock:
+            return [
+                {
+                    "_id": key,
+                    **{name: totals.get(name, 0) for name in CALL_MEASURES + TOPIC_MEASURES},
+                    # Los rangos de duración se suman como medidas `<medida>.<rango>`
+                    **{
+                        measure: {
+                            name[len(measure) + 1:]: count for name, count in totals.items()
+                            if name.startswith(f"{measure}.")
+                        }
+                        for measure in BIN_MEASURES
+                    },
+                }
+                for key, totals in self.buckets.values()
+            ]
+
+
+counters = LiveCounters()
+_status = {"state": "stopped", "error": None, "last_event": None, "events": 0}
+
+
+def window_pipeline(since):
+    return [
+        {"$match": {"calls.call_start_time": {"$gte": since}}},
+        trimmed_calls_stage(LIVE_PROJECTION, [{"$gte": ["$$call.call_start_time", since]}]),
+    ]
+
+
+def load_window(since):
+    """
+    Carga inicial de los contadores: solo las llamadas de la ventana de cada
+    usuario que tuvo llamadas en ella.
+    """
+    for record in get_collection().aggregate(window_pipeline(since)):
+        counters.apply_document(record["_id"], record, since)
+
+
+def apply_change(change):
+    if change["operationType"] == "delete":
+        document = None
+    else:
+        document = change.get("fullDocument")
+        if document is None:
+            # El documento se borró antes de leerlo (`updateLookup`); llegará su evento de borrado
+            return
+    counters.apply_document(change["documentKey"]["_id"], document, window_start())
+    _status["events"] += 1
+    _status["last_event"] = datetime.now(timezone.utc)
+
+
+def watch_calls():
+    """
+    Aplica los cambios de `call_information` a los contadores en vivo. El change
+    stream se abre antes de la carga inicial, así que ningún cambio se pierde
+    entre ambas; los que se apliquen dos veces no cuentan doble.
+    """
+    resume_token = None
+    last_prune = time.monotonic()
+    while True:
+        try:
+            pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+            with get_collection().watch(
+                pipeline, full_document="updateLookup", resume_after=resume_token, max_await_time_ms=1000
+            ) as stream:
+                if resume_token is None:
+                    with track_operation("live_metrics.load_window"):
+                        counters.reset()
+                        load_window(window_start())
+                _status["state"] = "live"
+                _status["error"] = None
+                while stream.alive:
+                    change = stream.try_next()
+                    # El punto de reanudación avanza antes de aplicar el cambio: uno que no
+                    # se puede aplicar se omite al reconectar en lugar de fallar otra vez
+                    resume_token = stream.resume_token
+                    if change is not None:
+                        apply_change(change)
+                    if time.monotonic() - last_prune > LIVE_PRUNE_SECONDS:
+                        counters.prune(window_start())
+                        last_prune = time.monotonic()
+        except OperationFailure as e:
+            if e.code == CHANGE_STREAM_UNSUPPORTED:
+                _status["state"] = "unsupported"
+                _status["error"] = str(e)
+                return
+            if e.code == CHANGE_STREAM_HISTORY_LOST:
+                # El oplog ya no tiene el punto de reanudación: se vuelve a cargar la ventana
+                resume_token = None
+            _status["state"] = "error"
+            _status["error"] = str(e)
+            record_error("live_metrics.watch_calls", e)
+        except Exception as e:
+            # Errores de red y también documentos con una forma inesperada: el hilo sigue
+            # reintentando, y las páginas muestran el estado en lugar de datos que no avanzan
+            _status["state"] = "error"
+            _status["error"] = str(e)
+            record_error("live_metrics.watch_calls", e)
+        time.sleep(LIVE_RETRY_SECONDS)
+
+
+def start_live_metrics():
+    """
+    Inicia (una sola vez por proceso) el hilo que escucha el change stream. Todas
+    las sesiones leen los mismos contadores, sin consultar MongoDB.
+    """
+    global _watch_thread
+    with _watch_lock:
+        if _watch_thread is None or not _watch_thread.is_alive():
+            if _status["state"] == "unsupported":
+                return
+            _status["state"] = "starting"
+            _watch_thread = threading.Thread(target=watch_calls, name="live-metrics", daemon=True)
+            _watch_thread.start()
+
+
+def get_live_status():
+    return dict(_status)
+
+
+def get_live_data(filters=None):
+    """
+    Buckets de la ventana en vivo en el formato de `rollups.get_rollup_data`,
+    para calcular las métricas con las funciones `rollup_*`. Se guarda un solo
+    DataFrame por combinación de filtros, el de la última versión de los
+    contadores: mientras no llegue un cambio todas las sesiones lo reutilizan, y
+    uno nuevo reemplaza al anterior en lugar de ocupar el caché compartido.
+    """
+    key = make_key(get_live_data, (filters,), {})
+    version = counters.version
+    with _frames_lock:
+        slot = _frames.get(key)
+        if slot is not None and slot[0] == version:
+            _frames.move_to_end(key)
+            return slot[1].copy(deep=False)
+
+    frame = rollup_frame(counters.bucket_documents(), filters)
+    with _frames_lock:
+        _frames[key] = (version, frame)
+        _frames.move_to_end(key)
+        while len(_frames) > LIVE_FRAME_SLOTS:
+            _frames.popitem(last=False)
+    # Copia superficial, igual que el caché: los cambios de una sesión no afectan a las demás
+    return frame.copy(deep=False)
@@ -1,42 +1,26 @@
-import streamlit as st
 import pandas as pd
 import numpy as np
-from pymongo import MongoClient
-from datetime import datetime, timedelta
-
-# Configuración de MongoDB
-MONGODB_URI = st.secrets["MONGODB_URI"]
-DATABASE_NAME = st.secrets["MONGODB_DATABASE"]
-client = MongoClient(MONGODB_URI)
-db = client[DATABASE_NAME]
-collection = db["call_information"]
-
-def get_outbound_calls_by_week():
-    outbound_calls = collection.find(
-        {"calls.type_call": "outbound"},
-        {"calls": 1}
-    )
-
-    data = []
-    for record in outbound_calls:
-        for call in record.get("calls", []):
-            if call.get("type_call") == "outbound":
-                call_start_time = call.get("call_start_time")
-                if call_start_time:
-                    try:
-                        call_start_time = datetime.fromisoformat(call_start_time.split(".")[0])
-                        week_start = call_start_time - timedelta(days=call_start_time.weekday())
-                        week_end = week_start + timedelta(days=6)
-                        week_interval = f"{week_start.strftime('%d/%m/%y')} - {week_end.strftime('%d/%m/%y')}"
-                        data.append({"week_interval": week_interval})
-                    except Exception as e:
-                        pass
-
-    if not data:
+from call_data import has_value
+from cache import cached
+from histograms import DurationHistogram
+
+@cached
+def get_outbound_calls_by_week(calls_df):
+    outbound_calls = calls_df[
+        (calls_df["type_call"] == "outbound") & calls_df["call_start_time"].notna()
+    ]
+
+    if outbound_calls.empty:
         return pd.Series(dtype=int)
 
-    df = pd.DataFrame(data)
-   
+    # Intervalo lunes-domingo de la semana de cada llamada
+    call_start_time = outbound_calls["call_start_time"]
+    week_start = call_start_time - pd.to_timedelta(call_start_time.dt.weekday, unit="D")
+    week_end = week_start + pd.Timedelta(days=6)
+    df = pd.DataFrame({
+        "week_interval": week_start.dt.strftime("%d/%m/%y") + " - " + week_end.dt.strftime("%d/%m/%y")
+    })
+
     # Agrupa las llamadas por intervalo semanal
     weekly_calls = df.groupby("week_interval").value_counts()
 
@@ -45,90 +29,51 @@ def get_outbound_calls_by_week():
 
     return weekly_calls
 
-def get_outbound_calls_by_duration():
-    outbound_calls = collection.find(
-        {"calls.type_call": "outbound"}, 
-        {"calls": 1}  # Incluye solo los campos necesarios
-    )
-    
-    data = []
-    for record in outbound_calls:
-        for call in record.get("calls", []):
-            if call.get("type_call") == "outbound":
-                duration_seconds = call.get("call_duration", {}).get("original_total_time")  # Duración en segundos
-                if duration_seconds is not None:
-                    # Convierte la duración a minutos
-                    duration_minutes = duration_seconds / 60
-                    data.append({"call_duration": duration_minutes})
-
-    if not data:
+@cached
+def get_outbound_calls_by_duration(calls_df):
+    # Solo la columna de duración, sin copiar el resto del DataFrame
+    durations = calls_df.loc[
+        (calls_df["type_call"] == "outbound") & calls_df["duration"].notna(), "duration"
+    ]
+
+    if durations.empty:
         # Si no hay datos, retorna una serie vacía
         return pd.Series(dtype=int)
 
-    # Convierte los datos a un DataFrame
-    df = pd.DataFrame(data)
-
-    # Define los intervalos en minutos (rango de 5 minutos)
-    max_duration = df["call_duration"].max()
-    bins = np.arange(0, max_duration + 5, 5)
-    # Incrementar el último límite para incluir valores exactos al máximo
-    bins[-1] += 0.1  # Asegura que el límite superior sea inclusivo
-    df["duration_range"] = pd.cut(df["call_duration"], bins=bins, right=False, include_lowest=True)
-
-
-    # Asegura el orden correcto de los intervalos y convierte a strings para el eje X
-    ordered_intervals = pd.IntervalIndex([pd.Interval(bins[i], bins[i + 1], closed='left') for i in range(len(bins) - 1)])
-
-    # Asegura que los datos respeten este orden
-    df["duration_range_str"] = pd.Categorical(
-        df["duration_range"].astype(str),
-        categories=[str(interval) for interval in ordered_intervals],
-        ordered=True
-    )
-
-    # Cuenta las llamadas por rango de duración
-    grouped_data = df["duration_range_str"].value_counts().sort_index()
-    
-    return grouped_data
-
-def get_outbound_calls_by_age():
-    outbound_calls = collection.find(
-        {"calls.type_call": "outbound"}, 
-        {"user_age": 1, "user_id": 1}
-    )
-
-    data = []
-    for record in outbound_calls:
-        age = record.get("user_age")
-        if age and age.isdigit() and int(age) >= 60:
-            data.append({"user_id": record["user_id"], "age": int(age)})
-
-    if not data:
+    # Cuenta por rangos de 5 minutos sin crear una etiqueta por llamada
+    histogram = DurationHistogram()
+    histogram.add_series(durations / 60)  # Convierte la duración (en segundos) a minutos
+    return histogram.to_series()
+
+@cached
+def get_outbound_calls_by_age(calls_df):
+    # Un registro por usuario con al menos una llamada outbound
+    outbound_users = calls_df[calls_df["type_call"] == "outbound"].drop_duplicates("user_id")
+    outbound_users = outbound_users[outbound_users["user_age"] >= 60]
+
+    if outbound_users.empty:
         return pd.Series(dtype=int)
 
-    df = pd.DataFrame(data)
+    df = pd.DataFrame({
+        "user_id": outbound_users["user_id"],
+        "age": outbound_users["user_age"].astype(int)
+    })
     bins = np.arange(60, df["age"].max() + 5, 5)
-    df["age_range"] = pd.cut(df["age"], bins=bins)
-    df["age_range_str"] = df["age_range"].astype(str)
+    labels = [str(interval) for interval in pd.IntervalIndex.from_breaks(bins)]
+    df["age_range_str"] = pd.cut(df["age"], bins=bins, labels=labels)
 
-    grouped_data = df.groupby("age_range_str")["user_id"].nunique()
+    grouped_data = df.groupby("age_range_str", observed=True)["user_id"].nunique()
     return grouped_data.sort_index()
 
-def get_outbound_calls_by_gender():
-    outbound_calls = collection.find(
-        {"calls.type_call": "outbound"}, 
-        {"user_gender": 1, "user_id": 1}
-    )
-
-    data = []
-    for record in outbound_calls:
-        gender = record.get("user_gender")
-        if gender:
-            data.append({"user_id": record["user_id"], "gender": gender})
+@cached
+def get_outbound_calls_by_gender(calls_df):
+    # Un registro por usuario con al menos una llamada outbound
+    outbound_users = calls_df[calls_df["type_call"] == "outbound"].drop_duplicates("user_id")
+    outbound_users = outbound_users[has_value(outbound_users["user_gender"])]
 
-    if not data:
+    if outbound_users.empty:
         return pd.Series(dtype=int)
 
-    df = pd.DataFrame(data)
+    df = pd.DataFrame({"user_id": outbound_users["user_id"], "gender": outbound_users["user_gender"]})
     grouped_data = df.groupby("gender")["user_id"].nunique()
     return grouped_data
\ No newline at end of file
@@ -0,0 +1,74 @@
+import streamlit as st
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import pymongo
+from pymongo.errors import PyMongoError
+
+# Consultas simultáneas por proceso (conviene que no supere MONGODB_MAX_POOL_SIZE)
+QUERY_WORKERS = st.secrets.get("QUERY_WORKERS", 8)
+
+# Segundos que una página espera cada consulta antes de darla por no disponible
+QUERY_TIMEOUT = st.secrets.get("QUERY_TIMEOUT", 30)
+
+# Compartido por todas las sesiones del proceso
+_executor = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="page-query")
+
+
+def _run_before(func, deadline):
+    """
+    Corre una consulta con el tiempo que le queda hasta `deadline`. Dentro de
+    `pymongo.timeout` cada comando (también los getMore del cursor) se envía con
+    maxTimeMS, así que MongoDB corta la consulta y el hilo queda libre en lugar de
+    seguir ocupado después de que la página dejó de esperarla.
+    """
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        # Esperó en la cola más que el tiempo de la página: ya nadie usaría el resultado
+        raise TimeoutError()
+    with pymongo.timeout(remaining):
+        return func()
+
+
+def submit(func, timeout=QUERY_TIMEOUT):
+    """
+    Lanza una consulta sin esperarla, con el mismo límite de tiempo que las de
+    `run_queries`. Regresa el Future.
+    """
+    return _executor.submit(_run_before, func, time.monotonic() + timeout)
+
+
+def _timeout_error(timeout, cause):
+    error = TimeoutError(f"sin respuesta después de {timeout} s")
+    error.__cause__ = cause
+    return error
+
+
+def run_queries(queries, timeout=QUERY_TIMEOUT):
+    """
+    Ejecuta al mismo tiempo las consultas independientes de una página
+    (`nombre -> función sin argumentos`) y espera cada una a lo más `timeout`
+    segundos contados desde que se lanzaron todas.
+
+    Regresa (resultados, fallidas): las consultas que lanzan una excepción o no
+    terminan a tiempo solo aparecen en `fallidas`, con su excepción (TimeoutError
+    si no terminaron a tiempo, también cuando MongoDB la cortó). Los comandos
+    de MongoDB de cada consulta llevan el mismo límite de tiempo, de modo que
+    una consulta que se pasa del tiempo también se cancela en el servidor.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    futures = {name: _executor.submit(_run_before, func, deadline) for name, func in queries.items()}
+
+    results = {}
+    failed = {}
+    for name, future in futures.items():
+        remaining = max(0, deadline - time.monotonic())
+        try:
+            results[name] = future.result(timeout=remaining)
+        except TimeoutError as e:
+            failed[name] = _timeout_error(timeout, e)
+        except PyMongoError as e:
+            failed[name] = _timeout_error(timeout, e) if e.timeout else e
+        except Exception as e:
+            failed[name] = e
+    return results, failed
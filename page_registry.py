@@ -0,0 +1,75 @@
+import importlib
+import sys
+import threading
+import time
+from instrumentation import record_operation
+
+# Módulo de datos de cada página del menú, en el orden en que se muestran
+PAGES = {
+    "Llamadas Inbound": "inbound",
+    "Llamadas Outbound": "outbound",
+    "Tiempos de llamadas": "duration_calls",
+    "Tiempos por temas": "topics",
+}
+
+_lock = threading.Lock()
+# Tiempo de importación de cada módulo de página y de la primera carga del proceso
+_import_times = {}
+_cold_start = None
+
+
+def _record(name, duration):
+    record_operation({
+        "name": name,
+        "cached": False,
+        "started_at": time.time() - duration,
+        "commands": 0,
+        "duration": duration,
+        "mongo_time": 0.0,
+        "python_time": duration,
+        "documents_returned": 0,
+        "response_bytes": 0,
+        "rows": None,
+    })
+
+
+def load_page_module(page):
+    """
+    Módulo de datos de la página. Se importa la primera vez que se elige la
+    página y queda en memoria para el resto de las sesiones del proceso, así que
+    una sesión que solo abre una página no paga la importación de las demás.
+    """
+    module_name = PAGES[page]
+    with _lock:
+        # Un módulo aparece en sys.modules antes de terminar de ejecutarse: import_module
+        # espera a que otro hilo termine de importarlo en lugar de regresarlo a medias
+        imported = module_name in sys.modules
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        duration = time.perf_counter() - start
+        if not imported and module_name not in _import_times:
+            _import_times[module_name] = duration
+            _record(f"import {module_name}", duration)
+    return module
+
+
+def record_script_run(page, duration):
+    """
+    Registra la duración de una ejecución del script de la página. La primera
+    ejecución del proceso es el arranque en frío: incluye importar pandas, los
+    módulos compartidos y el de la página elegida.
+    """
+    global _cold_start
+    with _lock:
+        if _cold_start is not None:
+            return
+        _cold_start = {"page": page, "duration": duration}
+    _record("startup", duration)
+
+
+def get_startup_stats():
+    with _lock:
+        return {
+            "cold_start": dict(_cold_start) if _cold_start else None,
+            "import_times": dict(_import_times),
+        }
@@ -0,0 +1,87 @@
+import streamlit as st
+import numpy as np
+
+# Error relativo máximo de los cuantiles (0.01 -> cada cuantil a ±1 % de su valor).
+# Los rollups guardan los rangos con esta precisión: si se cambia hay que
+# reconstruirlos con `rollups.rebuild_rollups`.
+QUANTILE_ACCURACY = st.secrets.get("QUANTILE_ACCURACY", 0.01)
+
+# Cuantiles que se muestran y nombre de su columna
+QUANTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+
+# Rango de las duraciones de 0 o menos (no tienen logaritmo)
+ZERO_KEY = "z"
+
+
+def sketch_gamma(accuracy=QUANTILE_ACCURACY):
+    # Razón entre los límites de rangos consecutivos
+    return (1 + accuracy) / (1 - accuracy)
+
+
+def duration_key(duration, accuracy=QUANTILE_ACCURACY):
+    """
+    Rango de una duración como texto, el nombre del campo en `call_rollups`: el
+    rango i cubre (gamma^(i-1), gamma^i].
+    """
+    if duration <= 0:
+        return ZERO_KEY
+    return str(int(np.ceil(np.log(duration) / np.log(sketch_gamma(accuracy)))))
+
+
+class DurationSketch:
+    """
+    Sketch de cuantiles de duraciones con error relativo acotado: cada duración
+    cuenta en un rango logarítmico y el cuantil se responde con el centro de su
+    rango. Dos sketches se mezclan sumando los conteos de cada rango (en MongoDB,
+    con $inc), y el número de rangos solo depende del intervalo de duraciones
+    (~500 de 1 segundo a 10 horas con 1 %), no del número de llamadas.
+    """
+
+    def __init__(self, accuracy=QUANTILE_ACCURACY):
+        self.gamma = sketch_gamma(accuracy)
+        self.counts = {}
+        self.zero_count = 0
+
+    def add(self, durations):
+        """
+        Agrega un lote de duraciones (se ignoran los valores vacíos).
+        """
+        values = np.asarray(durations, dtype=float)
+        values = values[~np.isnan(values)]
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        keys, counts = np.unique(np.ceil(np.log(positive) / np.log(self.gamma)).astype(np.int64), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.counts[key] = self.counts.get(key, 0) + count
+
+    def add_bins(self, bins):
+        """
+        Agrega rangos ya contados: pares (rango, conteo) con los nombres de `duration_key`.
+        """
+        for key, count in bins or ():
+            if key == ZERO_KEY:
+                self.zero_count += count
+            else:
+                self.counts[int(key)] = self.counts.get(int(key), 0) + count
+
+    def merge(self, other):
+        self.zero_count += other.zero_count
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+
+    def count(self):
+        return self.zero_count + sum(self.counts.values())
+
+    def quantile(self, q):
+        total = self.count()
+        if not total:
+            return np.nan
+        rank = q * (total - 1)
+        if rank < self.zero_count:
+            return 0.0
+        cumulative = self.zero_count
+        for key in sorted(self.counts):
+            cumulative += self.counts[key]
+            if cumulative > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.counts) / (self.gamma + 1)
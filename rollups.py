@@ -0,0 +1,820 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pymongo import ReplaceOne, DeleteOne
+from call_data import parse_age, parse_call_start_time, has_value, date_bounds, filter_calls, trimmed_calls_stage, LOCAL_TIMEZONE
+from cache import cached, clear_cache
+from db import get_collection
+from columnar import ColumnBuilder
+from instrumentation import track_operation, record_error, error_logger
+from hll import HyperLogLog, user_register
+from quantiles import DurationSketch, duration_key, QUANTILES
+from histograms import DurationHistogram, duration_bucket, BUCKET_MINUTES
+
+# Colecciones de los rollups y de su estado (marca de agua y reserva)
+ROLLUP_COLLECTION = "call_rollups"
+STATE_COLLECTION = "rollup_state"
+
+ROLLUP_REFRESH_INTERVAL = st.secrets.get("ROLLUP_REFRESH_INTERVAL", 300)  # Segundos entre actualizaciones
+ROLLUP_LEASE_SECONDS = 600  # Tiempo máximo que un proceso puede retener la actualización
+# Horas antes de la marca de agua que se vuelven a recorrer en cada actualización, para
+# incluir las llamadas que se guardan tarde o con la misma fecha que la marca de agua
+ROLLUP_LOOKBACK_HOURS = st.secrets.get("ROLLUP_LOOKBACK_HOURS", 48)
+# Diferencia de reloj tolerada: las llamadas con fecha posterior a ahora más este
+# margen no entran en los rollups hasta que llegue su fecha
+ROLLUP_CLOCK_SKEW = timedelta(minutes=5)
+
+ROLLUP_STATE_ID = "call_rollups"
+
+# Medidas acumuladas por bucket de llamadas y por bucket de temas
+CALL_MEASURES = ["calls", "duration_sum", "duration_count", "human_percentage_sum", "bot_percentage_sum", "talk_count"]
+TOPIC_MEASURES = ["bot_time", "persona_time", "topic_calls"]
+ROLLUP_KEYS = ["day", "hour", "type_call", "user_gender", "user_age", "topic"]
+# Sketch HyperLogLog de los usuarios de cada bucket de llamadas (ver `hll.py`)
+USERS_SKETCH = "users_hll"
+# Conteo de llamadas por rango logarítmico de duración de cada bucket (ver `quantiles.py`)
+DURATION_SKETCH = "duration_sketch"
+# Conteo de llamadas por rango de 5 minutos, y de las que caen justo en el límite
+# inferior del rango, para armar los histogramas de duración (ver `histograms.py`)
+DURATION_BINS = "duration_bins"
+DURATION_EDGES = "duration_edges"
+# Medidas que se guardan como subdocumento {rango: llamadas}
+BIN_MEASURES = [DURATION_SKETCH, DURATION_BINS, DURATION_EDGES]
+# Rangos de edad de las métricas de duración, los mismos de `duration_calls`
+AGE_BINS = np.arange(60, 95, 5)
+AGE_LABELS = [str(interval) for interval in pd.IntervalIndex.from_breaks(AGE_BINS)]
+
+_refresh_thread = None
+_refresh_lock = threading.Lock()
+
+
+def rollup_key(call_start_time, type_call, user_gender, user_age, topic=None):
+    """
+    Clave del bucket: día y hora en UTC (la hora local se calcula al leer), tipo de
+    llamada, género, edad y tema (None para las medidas por llamada).
+    """
+    return {
+        "day": call_start_time.strftime("%Y-%m-%d"),
+        "hour": call_start_time.hour,
+        "type_call": type_call,
+        "user_gender": user_gender,
+        "user_age": user_age,
+        "topic": topic,
+    }
+
+
+def add_measures(buckets, key, measures):
+    bucket_id = tuple(key.values())
+    if bucket_id not in buckets:
+        buckets[bucket_id] = (key, {})
+    totals = buckets[bucket_id][1]
+    for name, value in measures.items():
+        totals[name] = totals.get(name, 0) + value
+
+
+def add_call_buckets(buckets, call, call_start_time, user_gender, user_age):
+    """
+    Suma las medidas de una llamada a su bucket y, por cada tema con tiempo,
+    al bucket del tema.
+    """
+    type_call = call.get("type_call")
+    call_duration = call.get("call_duration") or {}
+    duration = call_duration.get("original_total_time")
+    human_time = call_duration.get("human", 0)
+    bot_time = call_duration.get("bot", 0)
+    total_time = human_time + bot_time
+
+    measures = {"calls": 1}
+    if duration is not None:
+        measures["duration_sum"] = duration
+        measures["duration_count"] = 1
+        measures[f"{DURATION_SKETCH}.{duration_key(duration)}"] = 1
+        minutes = duration / 60
+        if minutes >= 0:
+            bucket = duration_bucket(minutes)
+            measures[f"{DURATION_BINS}.{bucket}"] = 1
+            if minutes == bucket * BUCKET_MINUTES:
+                measures[f"{DURATION_EDGES}.{bucket}"] = 1
+    if total_time > 0:
+        measures["human_percentage_sum"] = (human_time / total_time) * 100
+        measures["bot_percentage_sum"] = (bot_time / total_time) * 100
+        measures["talk_count"] = 1
+    add_measures(buckets, rollup_key(call_start_time, type_call, user_gender, user_age), measures)
+
+    times_by_subject = (call.get("analysis") or {}).get("times_by_subject") or {}
+    for topic, times in times_by_subject.items():
+        topic_bot_time = times.get("bot", 0)
+        persona_time = times.get("persona", 0)
+        if topic_bot_time + persona_time > 0:
+            add_measures(
+                buckets,
+                rollup_key(call_start_time, type_call, user_gender, user_age, topic),
+                {"bot_time": topic_bot_time, "persona_time": persona_time, "topic_calls": 1}
+            )
+
+
+def bucket_document(key, totals, registers=None):
+    """
+    Documento completo de un bucket para `call_rollups`. Las medidas con punto
+    (rangos del sketch de duraciones) se guardan como subdocumento.
+    """
+    document = {"_id": key}
+    for name, value in totals.items():
+        target = document
+        *parents, field = name.split(".")
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[field] = value
+    if registers:
+        document[USERS_SKETCH] = registers
+    return document
+
+
+def lookback_start(watermark):
+    """
+    Primer día UTC (texto "AAAA-MM-DD") que se recalcula: el de la marca de agua
+    menos ROLLUP_LOOKBACK_HOURS. Sin marca de agua válida se recalcula todo ("").
+    """
+    watermark = parse_call_start_time(watermark)
+    if watermark is None:
+        return ""
+    return (watermark - timedelta(hours=ROLLUP_LOOKBACK_HOURS)).strftime("%Y-%m-%d")
+
+
+def acquire_lease():
+    """
+    Reserva la actualización de rollups para este proceso. Regresa el estado
+    (con la marca de agua) o None si otro proceso la está ejecutando.
+    """
+    now = datetime.now(timezone.utc)
+    get_collection(STATE_COLLECTION).update_one(
+        {"_id": ROLLUP_STATE_ID},
+        {"$setOnInsert": {"watermark": ""}},
+        upsert=True
+    )
+    return get_collection(STATE_COLLECTION).find_one_and_update(
+        {"_id": ROLLUP_STATE_ID, "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]},
+        {"$set": {"lease_until": now + timedelta(seconds=ROLLUP_LEASE_SECONDS)}}
+    )
+
+
+def refresh_pipeline(start_day):
+    # Solo se envían las llamadas de la ventana, no todas las del usuario
+    return [
+        {"$match": {"calls.call_start_time": {"$gte": start_day}}},
+        trimmed_calls_stage(
+            {
+                "_id": 0,
+                "user_id": 1,
+                "user_age": 1,
+                "user_gender": 1,
+                "calls.type_call": 1,
+                "calls.call_start_time": 1,
+                "calls.call_duration.original_total_time": 1,
+                "calls.call_duration.bot": 1,
+                "calls.call_duration.human": 1,
+                "calls.analysis.times_by_subject": 1,
+            },
+            [{"$gte": ["$$call.call_start_time", start_day]}]
+        ),
+    ]
+
+
+def window_bucket_query(start_day):
+    # Buckets guardados de la ventana que se recalcula
+    return {"_id.day": {"$gte": start_day}}
+
+
+def refresh_rollups():
+    """
+    Recalcula desde cero los buckets de los días a partir de `lookback_start` y
+    los reemplaza en `call_rollups`. Regresa el número de llamadas procesadas, o
+    None si otro proceso tiene la actualización en curso.
+
+    Como cada bucket se reemplaza completo, repetir una actualización (por
+    ejemplo después de un error a la mitad) da el mismo resultado. Las llamadas
+    sin fecha válida no entran en los rollups, y las que se guarden con una fecha
+    anterior a la ventana de ROLLUP_LOOKBACK_HOURS requieren `rebuild_rollups`.
+
+    Las llamadas con fecha futura (más allá de ROLLUP_CLOCK_SKEW) se omiten y se
+    reportan, y la marca de agua nunca pasa de la hora actual: una fecha mal
+    escrita un año adelante dejaría la ventana después de todas las llamadas.
+    """
+    state = acquire_lease()
+    if state is None:
+        return None
+
+    watermark = state.get("watermark", "")
+    start_day = lookback_start(watermark)
+    new_watermark = parse_call_start_time(watermark)
+    # `call_start_time` es UTC sin zona horaria
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    if new_watermark is not None and new_watermark > now:
+        # Marca de agua adelantada por una versión anterior: se recalcula desde ahora
+        new_watermark = now
+        start_day = lookback_start(now.isoformat())
+    processed = 0
+    future_calls = 0
+    buckets = {}
+    # Registros del sketch de usuarios por bucket: {bucket: {"índice": rango}}
+    user_registers = {}
+    try:
+        records = get_collection().aggregate(refresh_pipeline(start_day))
+        for record in records:
+            user_age = parse_age(record.get("user_age"))
+            user_gender = record.get("user_gender")
+            user_id = record.get("user_id")
+            register = user_register(user_id) if user_id is not None else None
+            for call in record.get("calls", []):
+                call_start_time = parse_call_start_time(call.get("call_start_time"))
+                # Un texto puede quedar dentro de la ventana sin que su fecha lo esté
+                if call_start_time is None or call_start_time.strftime("%Y-%m-%d") < start_day:
+                    continue
+                if call_start_time > now + ROLLUP_CLOCK_SKEW:
+                    future_calls += 1
+                    continue
+
+                add_call_buckets(buckets, call, call_start_time, user_gender, user_age)
+                if register is not None:
+                    key = rollup_key(call_start_time, call.get("type_call"), user_gender, user_age)
+                    registers = user_registers.setdefault(tuple(key.values()), {})
+                    index, rank = register
+                    registers[str(index)] = max(registers.get(str(index), 0), rank)
+                processed += 1
+                new_watermark = max(new_watermark or call_start_time, call_start_time)
+        if new_watermark is not None:
+            new_watermark = min(new_watermark, now)
+
+        rollup_collection = get_collection(ROLLUP_COLLECTION)
+        stored = {
+            tuple(bucket["_id"].get(column) for column in ROLLUP_KEYS): bucket
+            for bucket in rollup_collection.find(window_bucket_query(start_day))
+        }
+        # Solo se escriben los buckets que cambiaron, y se borran los de la ventana
+        # que ya no tienen llamadas (por ejemplo, si se borraron)
+        operations = []
+        for bucket_id, (key, totals) in buckets.items():
+            document = bucket_document(key, totals, user_registers.get(bucket_id))
+            if stored.get(bucket_id) != document:
+                operations.append(ReplaceOne({"_id": key}, document, upsert=True))
+        for bucket_id, bucket in stored.items():
+            if bucket_id not in buckets:
+                operations.append(DeleteOne({"_id": bucket["_id"]}))
+        if operations:
+            rollup_collection.bulk_write(operations, ordered=False)
+        # La marca de agua solo avanza si los buckets se guardaron
+        get_collection(STATE_COLLECTION).update_one(
+            {"_id": ROLLUP_STATE_ID},
+            {"$set": {"watermark": new_watermark.isoformat() if new_watermark else ""}}
+        )
+    finally:
+        get_collection(STATE_COLLECTION).update_one({"_id": ROLLUP_STATE_ID}, {"$set": {"lease_until": None}})
+
+    if future_calls:
+        error_logger.warning("rollups.refresh_rollups: %d llamadas con fecha futura omitidas", future_calls)
+    if operations:
+        clear_cache(get_rollup_data)
+    return processed
+
+
+def rebuild_rollups():
+    """
+    Borra los rollups y los recalcula desde el inicio de la historia.
+    """
+    get_collection(ROLLUP_COLLECTION).delete_many({})
+    get_collection(STATE_COLLECTION).update_one(
+        {"_id": ROLLUP_STATE_ID},
+        {"$set": {"watermark": "", "lease_until": None}},
+        upsert=True
+    )
+    return refresh_rollups()
+
+
+def _refresh_loop():
+    while True:
+        try:
+            with track_operation("rollups.refresh_rollups"):
+                refresh_rollups()
+        except Exception as e:
+            record_error("rollups.refresh_rollups", e)
+        time.sleep(ROLLUP_REFRESH_INTERVAL)
+
+
+def start_background_refresh():
+    """
+    Inicia (una sola vez por proceso) el hilo que actualiza los rollups cada
+    ROLLUP_REFRESH_INTERVAL segundos. Si los rollups nunca se han construido,
+    la primera construcción se hace antes de regresar.
+    """
+    global _refresh_thread
+    with _refresh_lock:
+        if _refresh_thread is None or not _refresh_thread.is_alive():
+            if get_collection(STATE_COLLECTION).find_one({"_id": ROLLUP_STATE_ID}) is None:
+                refresh_rollups()
+            _refresh_thread = threading.Thread(target=_refresh_loop, name="rollup-refresh", daemon=True)
+            _refresh_thread.start()
+
+
+def rollup_query(filters):
+    """
+    Consulta de los buckets que pueden cumplir los filtros. El rango de fechas se
+    aplica por día UTC; las horas de los extremos se recortan en `filter_calls`.
+    """
+    query = {}
+    bounds = date_bounds(filters)
+    if bounds:
+        query["_id.day"] = {"$gte": bounds[0][:10], "$lte": bounds[1][:10]}
+    if filters and filters.get("type_call"):
+        query["_id.type_call"] = filters["type_call"]
+    if filters and filters.get("user_gender"):
+        query["_id.user_gender"] = filters["user_gender"]
+    if filters and filters.get("age_range"):
+        query["_id.user_age"] = {"$gte": filters["age_range"][0], "$lte": filters["age_range"][1]}
+    return query
+
+
+@cached
+def get_rollup_data(filters=None):
+    """
+    Lee los buckets de `call_rollups` que cumplen los filtros en un DataFrame. Su
+    tamaño depende del número de buckets, no del número de llamadas.
+    """
+    return rollup_frame(get_collection(ROLLUP_COLLECTION).find(rollup_query(filters)), filters)
+
+
+def rollup_frame(bucket_documents, filters=None):
+    """
+    DataFrame de buckets con el formato de `call_rollups` ({"_id": clave, medidas...}),
+    el que reciben todas las funciones `rollup_*`.
+    """
+    data = ColumnBuilder({
+        "day": "code",
+        "hour": "int",
+        "type_call": "code",
+        "user_gender": "code",
+        "user_age": "float",
+        "topic": "code",
+        **{column: "float" for column in CALL_MEASURES + TOPIC_MEASURES},
+        USERS_SKETCH: "object",
+        **{column: "object" for column in BIN_MEASURES},
+    })
+    add_key = [(column, data.appender(column)) for column in ROLLUP_KEYS]
+    add_measure = [(column, data.appender(column)) for column in CALL_MEASURES + TOPIC_MEASURES]
+    add_sketch = data.appender(USERS_SKETCH)
+    add_bins = [(column, data.appender(column)) for column in BIN_MEASURES]
+    for bucket in bucket_documents:
+        for column, append in add_key:
+            append(bucket["_id"].get(column))
+        for column, append in add_measure:
+            append(bucket.get(column, 0))
+        registers = bucket.get(USERS_SKETCH)
+        # Pares (registro, rango) en lugar del diccionario, para que el DataFrame se pueda hashear
+        add_sketch(tuple((int(index), rank) for index, rank in registers.items()) if registers is not None else None)
+        for column, append in add_bins:
+            bins = bucket.get(column)
+            append(tuple((key, count) for key, count in bins.items() if count) if bins is not None else None)
+
+    df = pd.DataFrame({
+        "day": pd.to_datetime(pd.Series(data.column("day"), dtype=object)),
+        "hour": data.column("hour"),
+        "type_call": pd.Series(data.column("type_call"), dtype=object),
+        "user_gender": pd.Series(data.column("user_gender"), dtype=object),
+        "user_age": data.column("user_age"),
+        "topic": pd.Series(data.column("topic"), dtype=object),
+        **{column: data.column(column) for column in CALL_MEASURES + TOPIC_MEASURES},
+        USERS_SKETCH: data.column(USERS_SKETCH),
+        **{column: data.column(column) for column in BIN_MEASURES},
+    })
+    # Hora de inicio del bucket en UTC
+    df["call_start_time"] = df["day"] + pd.to_timedelta(df["hour"], unit="h")
+    return filter_calls(df, filters)
+
+
+def call_buckets(rollup_df, type_call=None):
+    buckets = rollup_df[rollup_df["topic"].isna()]
+    if type_call is not None:
+        buckets = buckets[buckets["type_call"] == type_call]
+    return buckets
+
+
+def local_hour(call_start_time):
+    # Hora local de México a partir de la hora UTC del bucket
+    return call_start_time.dt.tz_localize("UTC").dt.tz_convert(LOCAL_TIMEZONE).dt.hour
+
+
+def weighted_mean(buckets, by, total, count):
+    grouped = buckets.groupby(by, observed=True)[[total, count]].sum()
+    return grouped[total] / grouped[count]
+
+
+@cached
+def rollup_inbound_calls_by_day(rollup_df):
+    from inbound import day_translation
+
+    buckets = call_buckets(rollup_df, "inbound")
+    if buckets.empty:
+        return pd.Series(dtype=int)
+
+    days = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+    inbound_calls_by_day = (
+        buckets.groupby(buckets["call_start_time"].dt.day_name().map(day_translation))["calls"]
+        .sum()
+        .astype(int)
+        .reindex(days, fill_value=0)
+        .rename("count")
+    )
+    inbound_calls_by_day.index = pd.CategoricalIndex(
+        inbound_calls_by_day.index, categories=days, ordered=True, name="day_of_week"
+    )
+    return inbound_calls_by_day.sort_index()
+
+
+def calls_by_hour(rollup_df, type_call):
+    buckets = call_buckets(rollup_df, type_call)
+    if buckets.empty:
+        return pd.Series(dtype=int)
+
+    return (
+        buckets.groupby(local_hour(buckets["call_start_time"]))["calls"]
+        .sum()
+        .astype(int)
+        .reindex(range(24), fill_value=0)
+        .rename("count")
+        .rename_axis("hour_of_day")
+    )
+
+
+@cached
+def rollup_inbound_calls_by_hour(rollup_df):
+    return calls_by_hour(rollup_df, "inbound")
+
+
+@cached
+def rollup_outbound_calls_by_hour(rollup_df):
+    return calls_by_hour(rollup_df, "outbound")
+
+
+@cached
+def rollup_inbound_calls_by_gender(rollup_df):
+    buckets = call_buckets(rollup_df, "inbound")
+    buckets = buckets[has_value(buckets["user_gender"])]
+    if buckets.empty:
+        return pd.Series(dtype=int)
+
+    return (
+        buckets.groupby("user_gender")["calls"]
+        .sum()
+        .astype(int)
+        .sort_values(ascending=False)
+        .rename("count")
+        .rename_axis("gender")
+    )
+
+
+@cached
+def rollup_inbound_calls_by_age(rollup_df):
+    buckets = call_buckets(rollup_df, "inbound")
+    buckets = buckets[buckets["user_age"] >= 60]
+    if buckets.empty:
+        return pd.Series(dtype=int)
+
+    bins = np.arange(60, int(buckets["user_age"].max()) + 5, 5)
+    labels = [str(interval) for interval in pd.IntervalIndex.from_breaks(bins)]
+    age_range = pd.cut(buckets["user_age"].astype(int), bins=bins, labels=labels).rename("age_range_str")
+    return buckets.groupby(age_range, observed=False)["calls"].sum().astype(int)
+
+
+def has_duration_bins(rollup_df, type_call):
+    """
+    Si todos los buckets con duraciones tienen sus rangos de 5 minutos (los rollups
+    construidos antes de guardarlos necesitan `rebuild_rollups`).
+    """
+    buckets = call_buckets(rollup_df, type_call)
+    return bool(buckets.loc[buckets["duration_count"] > 0, DURATION_BINS].notna().all())
+
+
+def calls_by_duration(rollup_df, type_call):
+    """
+    Histograma de duración en rangos de 5 minutos con los mismos intervalos que
+    `inbound.get_inbound_calls_by_duration`, sumando los rangos de los buckets.
+    """
+    counts = {}
+    edges = {}
+    buckets = call_buckets(rollup_df, type_call)
+    for column, totals in ((DURATION_BINS, counts), (DURATION_EDGES, edges)):
+        for bins in buckets[column].dropna():
+            for bucket, count in bins:
+                totals[int(bucket)] = totals.get(int(bucket), 0) + int(count)
+
+    histogram = DurationHistogram()
+    histogram.add_bins(counts, edges)
+    return histogram.to_series()
+
+
+@cached
+def rollup_inbound_calls_by_duration(rollup_df):
+    return calls_by_duration(rollup_df, "inbound")
+
+
+@cached
+def rollup_outbound_calls_by_duration(rollup_df):
+    return calls_by_duration(rollup_df, "outbound")
+
+
+@cached
+def rollup_outbound_calls_by_week(rollup_df):
+    buckets = call_buckets(rollup_df, "outbound")
+    if buckets.empty:
+        return pd.Series(dtype=int)
+
+    week_start = buckets["day"] - pd.to_timedelta(buckets["day"].dt.weekday, unit="D")
+    week_end = week_start + pd.Timedelta(days=6)
+    week_interval = week_start.dt.strftime("%d/%m/%y") + " - " + week_end.dt.strftime("%d/%m/%y")
+
+    weekly_calls = buckets.groupby(week_interval.rename("week_interval"))["calls"].sum().astype(int).rename("count")
+    return weekly_calls.sort_index(key=lambda x: pd.to_datetime([interval.split(" - ")[0] for interval in x]))
+
+
+def distinct_users(buckets, by):
+    """
+    Usuarios distintos aproximados por grupo, mezclando los sketches de sus buckets
+    en lugar de volver a leer los documentos de los usuarios.
+    """
+    counts = {}
+    for group, sketches in buckets.groupby(by)[USERS_SKETCH]:
+        sketch = HyperLogLog()
+        for registers in sketches:
+            sketch.add_registers(registers)
+        counts[group] = round(sketch.count())
+    return pd.Series(counts, dtype=int, name="user_id").rename_axis(by.name)
+
+
+def has_user_sketches(rollup_df):
+    """
+    Si todos los buckets outbound tienen sketch de usuarios. Los rollups construidos
+    antes de guardar sketches necesitan `rebuild_rollups`; mientras tanto se usa
+    el conteo exacto.
+    """
+    return bool(call_buckets(rollup_df, "outbound")[USERS_SKETCH].notna().all())
+
+
+@cached
+def rollup_outbound_users_by_age(rollup_df):
+    """
+    Versión aproximada de `outbound.get_outbound_calls_by_age`: usuarios distintos
+    con llamadas outbound por rango de 5 años desde 60.
+    """
+    buckets = call_buckets(rollup_df, "outbound")
+    buckets = buckets[buckets["user_age"] >= 60]
+    if buckets.empty:
+        return pd.Series(dtype=int)
+
+    age = buckets["user_age"].astype(int)
+    bins = np.arange(60, age.max() + 5, 5)
+    labels = [str(interval) for interval in pd.IntervalIndex.from_breaks(bins)]
+    age_range = pd.cut(age, bins=bins, labels=labels).rename("age_range_str")
+    return distinct_users(buckets, age_range)
+
+
+@cached
+def rollup_outbound_users_by_gender(rollup_df):
+    """
+    Versión aproximada de `outbound.get_outbound_calls_by_gender`.
+    """
+    buckets = call_buckets(rollup_df, "outbound")
+    buckets = buckets[has_value(buckets["user_gender"])]
+    if buckets.empty:
+        return pd.Series(dtype=int)
+
+    return distinct_users(buckets, buckets["user_gender"].rename("gender"))
+
+
+def check_distinct_counts(calls_df, rollup_df):
+    """
+    Compara los conteos aproximados contra el cálculo exacto en pandas (`calls_df`
+    debe haberse extraído con los mismos filtros). Regresa el mayor error relativo
+    de cada métrica.
+    """
+    from outbound import get_outbound_calls_by_age, get_outbound_calls_by_gender
+
+    pairs = {
+        "outbound_users_by_age": (rollup_outbound_users_by_age, get_outbound_calls_by_age),
+        "outbound_users_by_gender": (rollup_outbound_users_by_gender, get_outbound_calls_by_gender),
+    }
+    errors = {}
+    for name, (approximate, exact) in pairs.items():
+        expected = exact(calls_df)
+        result = approximate(rollup_df).reindex(expected.index, fill_value=0)
+        errors[name] = float(((result - expected).abs() / expected).max()) if len(expected) else 0.0
+    return errors
+
+
+@cached
+def rollup_average_call_duration(rollup_df):
+    buckets = call_buckets(rollup_df)
+    if buckets["duration_count"].sum() == 0:
+        return 0
+
+    return round(buckets["duration_sum"].sum() / buckets["duration_count"].sum() / 60, 2)  # Convertir a minutos
+
+
+@cached
+def rollup_average_call_duration_by_gender(rollup_df):
+    buckets = call_buckets(rollup_df)
+    buckets = buckets[(buckets["duration_count"] > 0) & has_value(buckets["user_gender"])]
+    if buckets.empty:
+        return pd.Series(dtype=float)
+
+    return (weighted_mean(buckets, "user_gender", "duration_sum", "duration_count") / 60).rename_axis("gender")
+
+
+@cached
+def rollup_average_call_duration_by_age(rollup_df):
+    buckets = call_buckets(rollup_df)
+    buckets = buckets[(buckets["duration_count"] > 0) & (buckets["user_age"] >= 60)]
+    if buckets.empty:
+        return pd.Series(dtype=float)
+
+    age_range = pd.cut(buckets["user_age"].astype(int), bins=AGE_BINS, labels=AGE_LABELS)
+    return (weighted_mean(buckets, age_range.rename("age_range_str"), "duration_sum", "duration_count") / 60)
+
+
+@cached
+def rollup_average_call_duration_by_day_of_week(rollup_df):
+    buckets = call_buckets(rollup_df)
+    buckets = buckets[buckets["duration_count"] > 0]
+    if buckets.empty:
+        return pd.Series(dtype=float)
+
+    day_of_week = pd.Categorical(
+        buckets["call_start_time"].dt.day_name(),
+        categories=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"],
+        ordered=True
+    )
+    return weighted_mean(buckets, pd.Series(day_of_week, index=buckets.index, name="day_of_week"), "duration_sum", "duration_count") / 60
+
+
+@cached
+def rollup_average_call_duration_by_hour_of_day(rollup_df):
+    buckets = call_buckets(rollup_df)
+    buckets = buckets[buckets["duration_count"] > 0]
+    if buckets.empty:
+        return pd.Series(dtype=float)
+
+    hour_of_day = local_hour(buckets["call_start_time"]).rename("hour_of_day")
+    return (weighted_mean(buckets, hour_of_day, "duration_sum", "duration_count") / 60).reindex(range(24), fill_value=0)
+
+
+def duration_quantiles(buckets, by):
+    """
+    Cuantiles de duración (en minutos) por grupo, mezclando los sketches de sus
+    buckets: la memoria depende del número de rangos, no del de llamadas.
+    """
+    rows = {}
+    for group, sketches in buckets.groupby(by, observed=True)[DURATION_SKETCH]:
+        sketch = DurationSketch()
+        for bins in sketches:
+            sketch.add_bins(bins)
+        rows[group] = [sketch.quantile(q) / 60 for q in QUANTILES.values()]
+    return pd.DataFrame.from_dict(rows, orient="index", columns=list(QUANTILES)).rename_axis(by.name)
+
+
+def has_duration_sketches(rollup_df):
+    """
+    Si todos los buckets con duraciones tienen su sketch (los rollups construidos
+    antes de guardarlos necesitan `rebuild_rollups`).
+    """
+    buckets = call_buckets(rollup_df)
+    return bool(buckets.loc[buckets["duration_count"] > 0, DURATION_SKETCH].notna().all())
+
+
+@cached
+def rollup_call_duration_quantiles_by_gender(rollup_df):
+    buckets = call_buckets(rollup_df)
+    buckets = buckets[(buckets["duration_count"] > 0) & has_value(buckets["user_gender"])]
+    if buckets.empty:
+        return pd.DataFrame(columns=list(QUANTILES))
+
+    return duration_quantiles(buckets, buckets["user_gender"].rename("gender"))
+
+
+@cached
+def rollup_call_duration_quantiles_by_age(rollup_df):
+    buckets = call_buckets(rollup_df)
+    buckets = buckets[(buckets["duration_count"] > 0) & (buckets["user_age"] >= 60)]
+    if buckets.empty:
+        return pd.DataFrame(columns=list(QUANTILES))
+
+    age_range = pd.cut(buckets["user_age"].astype(int), bins=AGE_BINS, labels=AGE_LABELS)
+    return duration_quantiles(buckets, age_range.rename("age_range_str"))
+
+
+@cached
+def rollup_call_duration_quantiles_by_day_of_week(rollup_df):
+    buckets = call_buckets(rollup_df)
+    buckets = buckets[buckets["duration_count"] > 0]
+    if buckets.empty:
+        return pd.DataFrame(columns=list(QUANTILES))
+
+    day_of_week = pd.Categorical(
+        buckets["call_start_time"].dt.day_name(),
+        categories=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"],
+        ordered=True
+    )
+    return duration_quantiles(buckets, pd.Series(day_of_week, index=buckets.index, name="day_of_week"))
+
+
+@cached
+def rollup_call_duration_quantiles_by_hour_of_day(rollup_df):
+    buckets = call_buckets(rollup_df)
+    buckets = buckets[buckets["duration_count"] > 0]
+    if buckets.empty:
+        return pd.DataFrame(columns=list(QUANTILES))
+
+    hour_of_day = local_hour(buckets["call_start_time"]).rename("hour_of_day")
+    # Las horas sin llamadas quedan sin cuantiles (NaN), no en 0 minutos
+    return duration_quantiles(buckets, hour_of_day).reindex(range(24)).rename_axis("hour_of_day")
+
+
+def check_duration_quantiles(calls_df, rollup_df):
+    """
+    Compara los cuantiles de los sketches contra los exactos de pandas (`calls_df`
+    debe haberse extraído con los mismos filtros). Regresa el mayor error relativo
+    de cada vista; debería ser cercano a QUANTILE_ACCURACY.
+    """
+    from duration_calls import (
+        get_call_duration_quantiles_by_gender,
+        get_call_duration_quantiles_by_age,
+        get_call_duration_quantiles_by_day_of_week,
+        get_call_duration_quantiles_by_hour_of_day,
+    )
+
+    pairs = {
+        "by_gender": (rollup_call_duration_quantiles_by_gender, get_call_duration_quantiles_by_gender),
+        "by_age": (rollup_call_duration_quantiles_by_age, get_call_duration_quantiles_by_age),
+        "by_day_of_week": (rollup_call_duration_quantiles_by_day_of_week, get_call_duration_quantiles_by_day_of_week),
+        "by_hour_of_day": (rollup_call_duration_quantiles_by_hour_of_day, get_call_duration_quantiles_by_hour_of_day),
+    }
+    errors = {}
+    for name, (approximate, exact) in pairs.items():
+        expected = exact(calls_df)
+        result = approximate(rollup_df).reindex(expected.index)
+        relative = ((result - expected).abs() / expected).replace([np.inf], np.nan)
+        errors[name] = float(relative.max().max()) if relative.notna().any().any() else 0.0
+    return errors
+
+
+@cached
+def rollup_chatbot_vs_human_percentage_by_gender(rollup_df):
+    buckets = call_buckets(rollup_df)
+    buckets = buckets[(buckets["talk_count"] > 0) & has_value(buckets["user_gender"])]
+    if buckets.empty:
+        return pd.DataFrame(columns=["gender", "human_percentage", "bot_percentage"])
+
+    return pd.DataFrame({
+        "human_percentage": weighted_mean(buckets, "user_gender", "human_percentage_sum", "talk_count"),
+        "bot_percentage": weighted_mean(buckets, "user_gender", "bot_percentage_sum", "talk_count"),
+    }).rename_axis("gender")
+
+
+@cached
+def rollup_chatbot_vs_human_percentage_by_age(rollup_df):
+    buckets = call_buckets(rollup_df)
+    buckets = buckets[(buckets["talk_count"] > 0) & (buckets["user_age"] >= 60)]
+    if buckets.empty:
+        return pd.DataFrame(columns=["age_range", "human_percentage", "bot_percentage"])
+
+    age_range = pd.cut(buckets["user_age"].astype(int), bins=AGE_BINS, labels=AGE_LABELS).rename("age_range_str")
+    return pd.DataFrame({
+        "human_percentage": weighted_mean(buckets, age_range, "human_percentage_sum", "talk_count"),
+        "bot_percentage": weighted_mean(buckets, age_range, "bot_percentage_sum", "talk_count"),
+    }).sort_index()
+
+
+
+@cached
+def rollup_topic_cube(rollup_df):
+    """
+    Cubo de tiempos por tema (ver `topics.get_topic_cube`) a partir de los
+    buckets de temas, solo para usuarios de 60 años o más.
+    """
+    from topics import sum_topic_cube, cube_month
+
+    buckets = rollup_df[rollup_df["topic"].notna() & (rollup_df["user_age"] >= 60)]
+    return sum_topic_cube(pd.DataFrame({
+        "topic": buckets["topic"],
+        "user_age": buckets["user_age"].astype(int),
+        "user_gender": buckets["user_gender"],
+        "month": cube_month(buckets["call_start_time"]),
+        "bot_time": buckets["bot_time"],
+        "persona_time": buckets["persona_time"],
+        "total_time": buckets["bot_time"] + buckets["persona_time"],
+        "calls": buckets["topic_calls"].astype(int),
+    }))
+
+
+if __name__ == "__main__":
+    print(f"Llamadas procesadas: {refresh_rollups()}")
@@ -0,0 +1,213 @@
+import streamlit as st
+import pandas as pd
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime
+from cache import cached
+from db import get_collection
+from call_data import build_calls_frame, build_calls_frame_from_columns, call_columns_pipeline, date_bounds
+from call_data import CALLS_QUERY, CALLS_PROJECTION, CALL_FIELDS, COLUMNAR_FETCH
+
+# Directorio de los snapshots columnares (un archivo Arrow por mes)
+SNAPSHOT_DIR = st.secrets.get("SNAPSHOT_DIR", "snapshots")
+
+# Nodo del que se lee la exportación; un secundario evita cargar al primario
+SNAPSHOT_READ_PREFERENCE = st.secrets.get("SNAPSHOT_READ_PREFERENCE", "secondaryPreferred")
+
+# Partición de las llamadas sin fecha válida
+NO_DATE_PARTITION = "sin-fecha"
+TEMP_SUFFIX = ".tmp"
+
+
+def month_partition(call_start_time):
+    return call_start_time.dt.strftime("%Y-%m").fillna(NO_DATE_PARTITION)
+
+
+def replace_file(path, write):
+    """
+    Escribe con `write(archivo)` a un archivo temporal propio en el mismo
+    directorio y luego lo reemplaza: un lector nunca ve un archivo a medias, y
+    dos exportaciones al mismo tiempo no escriben sobre el temporal de la otra.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=TEMP_SUFFIX)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def write_partition(df, path):
+    """
+    Escribe un DataFrame como archivo Arrow IPC sin compresión, que se puede leer
+    con memory-map.
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    replace_file(path, lambda f: feather.write_feather(table, f, compression="uncompressed"))
+
+
+def export_snapshot(directory=SNAPSHOT_DIR):
+    """
+    Exporta `call_information` a archivos columnares por mes:
+    `<directorio>/calls/AAAA-MM.arrow` y `<directorio>/topics/AAAA-MM.arrow`.
+    """
+    from topics import build_topic_frame, build_topic_frame_from_columns, TOPICS_QUERY, TOPICS_PROJECTION, TOPIC_FIELDS
+
+    collection = get_collection(read_preference=SNAPSHOT_READ_PREFERENCE)
+
+    if COLUMNAR_FETCH:
+        frames = {
+            "calls": build_calls_frame_from_columns(
+                collection.aggregate(call_columns_pipeline(CALLS_QUERY, CALLS_PROJECTION, CALL_FIELDS))
+            ),
+            "topics": build_topic_frame_from_columns(
+                collection.aggregate(call_columns_pipeline(TOPICS_QUERY, TOPICS_PROJECTION, TOPIC_FIELDS))
+            ),
+        }
+    else:
+        frames = {
+            "calls": build_calls_frame(collection.find(CALLS_QUERY, CALLS_PROJECTION)),
+            "topics": build_topic_frame(collection.find(TOPICS_QUERY, TOPICS_PROJECTION)),
+        }
+
+    months = set()
+    written = {}
+    for dataset, df in frames.items():
+        os.makedirs(os.path.join(directory, dataset), exist_ok=True)
+        written[dataset] = set()
+        if df.empty:
+            continue
+        for month, partition in df.groupby(month_partition(df["call_start_time"])):
+            write_partition(partition, os.path.join(directory, dataset, f"{month}.arrow"))
+            written[dataset].add(month)
+        months |= written[dataset]
+
+    manifest = {
+        "exported_at": datetime.utcnow().isoformat(),
+        "months": sorted(months),
+        "malformed_call_start_time": frames["calls"].attrs.get("malformed_call_start_time", 0),
+    }
+    replace_file(os.path.join(directory, "manifest.json"), lambda f: f.write(json.dumps(manifest).encode()))
+
+    # Los meses que ya no tienen llamadas se borran después de publicar el manifiesto nuevo
+    for dataset, dataset_months in written.items():
+        for name in os.listdir(os.path.join(directory, dataset)):
+            month, extension = os.path.splitext(name)
+            if extension == ".arrow" and month not in dataset_months:
+                os.remove(os.path.join(directory, dataset, name))
+    return manifest
+
+
+def read_manifest(directory=SNAPSHOT_DIR):
+    path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def snapshot_available(directory=SNAPSHOT_DIR):
+    return read_manifest(directory) is not None
+
+
+def list_snapshot_months(directory=SNAPSHOT_DIR):
+    manifest = read_manifest(directory)
+    return manifest["months"] if manifest else []
+
+
+def filter_table(table, filters):
+    """
+    Aplica a una tabla de Arrow las mismas condiciones que `call_data.filter_calls`,
+    para convertir a pandas solo las filas que cumplen los filtros. Las filas con
+    valores nulos en una columna filtrada se descartan, igual que en pandas.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if not filters or table.num_rows == 0:
+        return table
+
+    conditions = []
+    bounds = date_bounds(filters)
+    if bounds:
+        column_type = table.schema.field("call_start_time").type
+        start, end = (pd.Timestamp(bound, tz="UTC") for bound in bounds)
+        if column_type.tz is None:
+            start, end = start.tz_localize(None), end.tz_localize(None)
+        conditions.append(pc.greater_equal(table["call_start_time"], pa.scalar(start, type=column_type)))
+        conditions.append(pc.less(table["call_start_time"], pa.scalar(end, type=column_type)))
+    if filters.get("type_call"):
+        conditions.append(pc.equal(table["type_call"], filters["type_call"]))
+    if filters.get("user_gender"):
+        conditions.append(pc.equal(table["user_gender"], filters["user_gender"]))
+    if filters.get("age_range"):
+        min_age, max_age = filters["age_range"]
+        conditions.append(pc.greater_equal(table["user_age"], min_age))
+        conditions.append(pc.less_equal(table["user_age"], max_age))
+
+    mask = conditions[0]
+    for condition in conditions[1:]:
+        mask = pc.and_(mask, condition)
+    return table.filter(mask)
+
+
+def read_dataset(dataset, months, directory=SNAPSHOT_DIR, filters=None):
+    """
+    Lee los meses indicados de un dataset usando memory-map: los datos se leen
+    directamente del archivo, sin cargarlo completo en memoria primero. Los
+    filtros se aplican sobre las tablas de Arrow, y solo las filas que los
+    cumplen se convierten a pandas, columna por columna.
+    """
+    import pyarrow as pa
+
+    tables = []
+    for month in months:
+        path = os.path.join(directory, dataset, f"{month}.arrow")
+        if os.path.exists(path):
+            with pa.memory_map(path, "r") as source:
+                tables.append(filter_table(pa.ipc.open_file(source).read_all(), filters))
+
+    if not tables:
+        return pd.DataFrame()
+    table = pa.concat_tables(tables, promote_options="default")
+    del tables
+    # Sin consolidar bloques, las columnas numéricas sin nulos de un solo archivo
+    # quedan como vistas del memory-map; cada columna de Arrow se libera al convertirse
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+# Ya se leen de disco, y la marca de agua del caché en disco no cubre una nueva exportación
+@cached(persist=False)
+def get_snapshot_calls_data(months, filters=None):
+    """
+    Equivalente a `call_data.get_calls_data` leyendo del snapshot en disco.
+    """
+    calls_df = read_dataset("calls", months, filters=filters)
+    if calls_df.empty:
+        # Mismas columnas que la extracción de MongoDB
+        calls_df = build_calls_frame([])
+    manifest = read_manifest() or {}
+    calls_df.attrs["malformed_call_start_time"] = (
+        manifest.get("malformed_call_start_time", 0) if NO_DATE_PARTITION in months else 0
+    )
+    return calls_df
+
+
+@cached(persist=False)
+def get_snapshot_topic_data(months, filters=None):
+    """
+    Equivalente a `topics.get_data_by_topic` leyendo del snapshot en disco.
+    """
+    return read_dataset("topics", months, filters=filters)
+
+
+if __name__ == "__main__":
+    manifest = export_snapshot(sys.argv[1] if len(sys.argv) > 1 else SNAPSHOT_DIR)
+    print(f"Snapshot exportado: {len(manifest['months'])} meses")
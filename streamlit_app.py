@@ -1,24 +1,269 @@
+import time
+# Inicio de esta ejecución del script; la primera del proceso es el arranque en frío
+run_start = time.perf_counter()
 import streamlit as st
-from inbound import *
-from outbound import *
-from duration_calls import *
-from topics import *
-import altair as alt
+import pandas as pd
+from datetime import datetime, timedelta
+from concurrent.futures import Future
+from functools import partial
+from zoneinfo import ZoneInfo
+from call_data import get_calls_data, get_gender_options, build_filters, LOCAL_TIMEZONE
+import page_executor
+import instrumentation
+import page_registry
+from cache import clear_cache, get_cache_stats, start_warm_start
+from db import get_pool_stats
+
+# Valores iniciales de las opciones del menú lateral. Los módulos de cada modo
+# (aggregations, rollups, live_metrics, hll, quantiles) se importan solo si se usan
+USE_AGGREGATION = st.secrets.get("USE_AGGREGATION", False)  # Histogramas calculados en MongoDB
+USE_ROLLUPS = st.secrets.get("USE_ROLLUPS", False)  # Métricas leídas de los rollups
+USE_LIVE_METRICS = st.secrets.get("USE_LIVE_METRICS", False)  # Métricas en vivo de las últimas horas
+LIVE_REFRESH_SECONDS = st.secrets.get("LIVE_REFRESH_SECONDS", 10)  # Cada cuánto se redibujan las sesiones abiertas
 
 # Crear menú de selección de páginas
-menu_options = ["Llamadas Inbound", "Llamadas Outbound", "Tiempos de llamadas", "Tiempos por temas"]
+menu_options = list(page_registry.PAGES)
 page_selection = st.sidebar.selectbox("Seleccione una página", menu_options)
 
+# Operaciones registradas antes de esta carga de la página (ver el panel de diagnóstico)
+diagnostics_start = instrumentation.current_sequence()
+instrumentation.start_metrics_server()
+
+# Con el caché en disco, los resultados del arranque anterior se cargan a memoria en segundo plano
+start_warm_start()
+
+# Fuente de datos: MongoDB o el snapshot columnar exportado a disco (`python snapshot.py`)
+import snapshot
+use_snapshot = False
+if snapshot.snapshot_available():
+    data_source = st.sidebar.selectbox("Fuente de datos", ["MongoDB", "Snapshot en disco"])
+    use_snapshot = data_source == "Snapshot en disco"
+
+if use_snapshot:
+    available_months = snapshot.list_snapshot_months()
+    snapshot_months = tuple(st.sidebar.multiselect("Meses", available_months, default=available_months))
+    use_aggregation = False
+    use_rollups = False
+    use_live_metrics = False
+else:
+    # Histogramas calculados en MongoDB (aggregate) o en pandas, para comparar resultados
+    use_aggregation = st.sidebar.checkbox("Calcular histogramas en MongoDB", value=USE_AGGREGATION)
+
+    # Métricas leídas de los rollups precalculados (se actualizan en segundo plano)
+    use_rollups = st.sidebar.checkbox("Usar rollups precalculados", value=USE_ROLLUPS)
+    if use_rollups:
+        import rollups
+        rollups.start_background_refresh()
+
+    # Contadores de las últimas horas que se actualizan con el change stream de MongoDB
+    use_live_metrics = st.sidebar.checkbox("Métricas en vivo", value=USE_LIVE_METRICS)
+    if use_live_metrics:
+        import live_metrics
+        live_metrics.start_live_metrics()
+
+# Con los rollups, lo que les falta se calcula en MongoDB
+if use_aggregation or use_rollups:
+    import aggregations
+
+# Filtros de las métricas: se aplican en la consulta a MongoDB
+period_options = ["Todo el historial", "Últimos 7 días", "Últimos 30 días", "Rango personalizado"]
+period = st.sidebar.selectbox("Periodo", period_options)
+today = datetime.now(ZoneInfo(LOCAL_TIMEZONE)).date()
+date_range = None
+if period == "Últimos 7 días":
+    date_range = (today - timedelta(days=6), today)
+elif period == "Últimos 30 días":
+    date_range = (today - timedelta(days=29), today)
+elif period == "Rango personalizado":
+    selected_dates = st.sidebar.date_input("Fechas", value=(today - timedelta(days=6), today))
+    # Mientras solo se ha elegido la fecha inicial, no se filtra por fecha
+    if len(selected_dates) == 2:
+        date_range = tuple(selected_dates)
+
+type_call_option = st.sidebar.selectbox("Tipo de llamada", ["Todas", "inbound", "outbound"])
+
+# Las opciones de género se consultan mientras se carga la página; el filtro usa la
+# selección guardada en la sesión y el selector se dibuja en este lugar al final
+gender_slot = st.sidebar.empty()
+if use_snapshot:
+    snapshot_genders = snapshot.get_snapshot_calls_data(snapshot_months)["user_gender"]
+    gender_options = sorted(gender for gender in snapshot_genders.dropna().unique() if gender)
+else:
+    gender_options = page_executor.submit(get_gender_options)
+gender_option = st.session_state.get("gender_option", "Todos")
+gender_filter_shown = False
+
+age_range = st.sidebar.slider("Edad", 0, 120, (0, 120))
+
+filters = build_filters(
+    date_range=date_range,
+    type_call=None if type_call_option == "Todas" else type_call_option,
+    user_gender=None if gender_option == "Todos" else gender_option,
+    age_range=None if age_range == (0, 120) else age_range,
+)
+
+# Las métricas se guardan en caché; este botón fuerza a consultar MongoDB de nuevo
+if st.sidebar.button("Actualizar datos"):
+    clear_cache()
+
+show_diagnostics = st.sidebar.checkbox("Mostrar diagnóstico")
+# Validar las métricas aproximadas de los rollups extrae todas las llamadas de la página: solo a pedido
+validate_approximations = show_diagnostics and st.sidebar.checkbox("Validar contra el conteo exacto")
+
+
+def show_gender_filter():
+    # Dibuja el selector de género una vez por ejecución; espera las opciones si aún no llegan
+    global gender_options, gender_filter_shown
+    if gender_filter_shown:
+        return
+    gender_filter_shown = True
+    if isinstance(gender_options, Future):
+        try:
+            gender_options = gender_options.result()
+        except Exception as e:
+            instrumentation.record_error("call_data.get_gender_options", e)
+            gender_options = []
+    gender_slot.selectbox("Género", ["Todos"] + gender_options, key="gender_option")
+
+
+def load_calls_data():
+    if use_snapshot:
+        return snapshot.get_snapshot_calls_data(snapshot_months, filters)
+    return get_calls_data(filters)
+
+
+def load_topic_data():
+    if use_snapshot:
+        return snapshot.get_snapshot_topic_data(snapshot_months, filters)
+    return topics.get_data_by_topic(filters)
+
+
+def show_malformed_call_start_times(calls_df):
+    # Un solo aviso por página en lugar de uno por llamada con fecha inválida
+    malformed = calls_df.attrs.get("malformed_call_start_time", 0)
+    if malformed:
+        st.caption(f"Se omitieron {malformed} llamadas con fecha de inicio inválida en las métricas por fecha y hora.")
+
+
+def fetch_page_data(queries, required=("calls_df",)):
+    """
+    Lanza en paralelo las consultas a MongoDB de la página. Si falla una de las
+    consultas `required` la página no se puede mostrar; las demás tienen un
+    cálculo equivalente en pandas que se usa en su lugar.
+    """
+    results, failed = page_executor.run_queries(queries)
+    for name, error in failed.items():
+        instrumentation.record_error(name, error)
+    if any(name in failed for name in required):
+        show_gender_filter()
+        st.error("No se pudieron obtener los datos de llamadas. Intente de nuevo en unos momentos.")
+        st.stop()
+    if failed:
+        details = "; ".join(f"{name}: {error}" for name, error in failed.items())
+        st.warning(
+            "Algunas consultas fallaron o no terminaron a tiempo; esas métricas se calcularon "
+            f"a partir de los datos de llamadas ({details})."
+        )
+    return results
+
+
+def page_calls_data(results):
+    # Las llamadas solo se extraen cuando una métrica no se pudo obtener de otra forma
+    if "calls_df" not in results:
+        results["calls_df"] = fetch_page_data({"calls_df": load_calls_data})["calls_df"]
+    return results["calls_df"]
+
+
+def metric(results, name, getter):
+    # Resultado de la consulta si terminó; si no, el cálculo equivalente en pandas
+    if name in results:
+        return results[name]
+    return getter(page_calls_data(results))
+
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def show_live_metrics(page):
+    """
+    Métricas de las últimas horas leídas de los contadores en vivo, sin consultar
+    MongoDB. Solo esta sección se vuelve a dibujar cada LIVE_REFRESH_SECONDS segundos.
+    """
+    import live_metrics
+    import rollups
+
+    st.header(f"En vivo: últimas {live_metrics.LIVE_WINDOW_HOURS} horas")
+    status = live_metrics.get_live_status()
+    if status["state"] == "unsupported":
+        st.warning("Las métricas en vivo requieren que MongoDB sea un replica set (change streams).")
+        return
+    if status["state"] == "error":
+        st.warning(f"Se perdió la conexión con el change stream; se muestran los últimos datos recibidos. ({status['error']})")
+    elif status["state"] != "live":
+        st.caption("Cargando las llamadas de la ventana en vivo...")
+        return
+
+    # Los contadores cambian con cada evento: estas métricas no pasan por el caché (`__wrapped__`)
+    live_df = live_metrics.get_live_data(filters)
+    if page == "Llamadas Inbound":
+        st.subheader("Llamadas inbound por hora del día")
+        st.bar_chart(rollups.rollup_inbound_calls_by_hour.__wrapped__(live_df))
+    elif page == "Llamadas Outbound":
+        st.subheader("Llamadas outbound por hora del día")
+        st.bar_chart(rollups.rollup_outbound_calls_by_hour.__wrapped__(live_df))
+    else:
+        average_call_duration = rollups.rollup_average_call_duration.__wrapped__(live_df)
+        st.subheader(f"Duración de llamada promedio: {average_call_duration} minutos")
+        st.bar_chart(rollups.rollup_average_call_duration_by_hour_of_day.__wrapped__(live_df))
+    if status["last_event"]:
+        st.caption(f"Último cambio recibido: {status['last_event']:%Y-%m-%d %H:%M:%S} UTC ({status['events']} cambios)")
+
+
 # Configurar el contenido basado en la página seleccionada
 if page_selection == "Llamadas Inbound":
-    st.title("Métricas de Usuarios Inbound")
+    inbound = page_registry.load_page_module(page_selection)
 
-    inbound_users_by_day = get_inbound_calls_by_day()
-    inbound_users_by_hour = get_inbound_calls_by_hour()
-    inbound_users_by_gender = get_inbound_calls_by_gender()
-    inbound_users_by_call_duration = get_inbound_calls_by_duration()
-    inbound_users_by_age = get_inbound_calls_by_age()
-    call_distribution_table = get_calls_distribution()
+    st.title("Métricas de Usuarios Inbound")
+    if use_live_metrics:
+        show_live_metrics(page_selection)
+
+    # Consultas a MongoDB de la página, en paralelo. Con los rollups o los histogramas
+    # en MongoDB no se extraen las llamadas, salvo que falle alguna consulta
+    queries = {} if use_aggregation or use_rollups else {"calls_df": load_calls_data}
+    if use_rollups:
+        queries["rollup_df"] = partial(rollups.get_rollup_data, filters)
+    if use_aggregation or use_rollups:
+        # Los rollups no guardan llamadas por usuario: la tabla de distribución se calcula en MongoDB
+        queries["calls_distribution_counts"] = partial(aggregations.aggregate_calls_distribution_counts, filters)
+    if use_aggregation and not use_rollups:
+        queries["inbound_users_by_call_duration"] = partial(aggregations.aggregate_inbound_calls_by_duration, filters)
+        queries["inbound_users_by_day"] = partial(aggregations.aggregate_inbound_calls_by_day, filters)
+        queries["inbound_users_by_hour"] = partial(aggregations.aggregate_inbound_calls_by_hour, filters)
+        queries["inbound_users_by_gender"] = partial(aggregations.aggregate_inbound_calls_by_gender, filters)
+        queries["inbound_users_by_age"] = partial(aggregations.aggregate_inbound_calls_by_age, filters)
+    results = fetch_page_data(queries)
+
+    if "rollup_df" in results:
+        rollup_df = results["rollup_df"]
+        inbound_users_by_day = rollups.rollup_inbound_calls_by_day(rollup_df)
+        inbound_users_by_hour = rollups.rollup_inbound_calls_by_hour(rollup_df)
+        inbound_users_by_gender = rollups.rollup_inbound_calls_by_gender(rollup_df)
+        inbound_users_by_age = rollups.rollup_inbound_calls_by_age(rollup_df)
+        if rollups.has_duration_bins(rollup_df, "inbound"):
+            inbound_users_by_call_duration = rollups.rollup_inbound_calls_by_duration(rollup_df)
+        else:
+            # Rollups construidos antes de guardar los rangos de duración: se calcula en MongoDB
+            inbound_users_by_call_duration = aggregations.aggregate_inbound_calls_by_duration(filters)
+    else:
+        inbound_users_by_day = metric(results, "inbound_users_by_day", inbound.get_inbound_calls_by_day)
+        inbound_users_by_hour = metric(results, "inbound_users_by_hour", inbound.get_inbound_calls_by_hour)
+        inbound_users_by_gender = metric(results, "inbound_users_by_gender", inbound.get_inbound_calls_by_gender)
+        inbound_users_by_age = metric(results, "inbound_users_by_age", inbound.get_inbound_calls_by_age)
+        inbound_users_by_call_duration = metric(
+            results, "inbound_users_by_call_duration", inbound.get_inbound_calls_by_duration
+        )
+    calls_distribution_counts = metric(results, "calls_distribution_counts", inbound.get_calls_distribution_counts)
+    call_distribution_table = inbound.get_calls_distribution(calls_distribution_counts)
+    if "calls_df" in results:
+        show_malformed_call_start_times(results["calls_df"])
 
     st.header("Número de llamadas inbound por día de la semana")
     if inbound_users_by_day.empty:
@@ -54,17 +299,61 @@ if page_selection == "Llamadas Inbound":
     if call_distribution_table.empty:
         st.warning("No hay datos disponibles para mostrar en la tabla.")
     else:
-        st.dataframe(call_distribution_table.style.set_caption("Distribución por género y rangos de edad"))
+        st.dataframe(inbound.get_calls_distribution_styler(call_distribution_table))
+        st.download_button(
+            "Descargar tabla (CSV)",
+            calls_distribution_counts.to_csv(),
+            file_name="distribucion_llamadas_inbound.csv",
+            mime="text/csv"
+        )
 
 elif page_selection == "Llamadas Outbound":
-    # Obtener métricas
-    outbound_users_percentage_by_week = get_outbound_calls_by_week()
-    outbound_calls_by_duration = get_outbound_calls_by_duration()
-    outbound_calls_by_age = get_outbound_calls_by_age()
-    outbound_calls_by_gender = get_outbound_calls_by_gender()
+    outbound = page_registry.load_page_module(page_selection)
+
+    # Obtener métricas (consultas a MongoDB en paralelo). Con los rollups o los
+    # histogramas en MongoDB no se extraen las llamadas, salvo que falle alguna consulta
+    queries = {} if use_aggregation or use_rollups else {"calls_df": load_calls_data}
+    if use_rollups:
+        queries["rollup_df"] = partial(rollups.get_rollup_data, filters)
+    if use_aggregation and not use_rollups:
+        queries["outbound_calls_by_duration"] = partial(aggregations.aggregate_outbound_calls_by_duration, filters)
+        queries["outbound_users_by_age"] = partial(aggregations.aggregate_outbound_users_by_age, filters)
+        queries["outbound_users_by_gender"] = partial(aggregations.aggregate_outbound_users_by_gender, filters)
+        queries["outbound_users_percentage_by_week"] = partial(aggregations.aggregate_outbound_calls_by_week, filters)
+    results = fetch_page_data(queries)
+
+    if "rollup_df" in results:
+        rollup_df = results["rollup_df"]
+        outbound_users_percentage_by_week = rollups.rollup_outbound_calls_by_week(rollup_df)
+        if rollups.has_duration_bins(rollup_df, "outbound"):
+            outbound_calls_by_duration = rollups.rollup_outbound_calls_by_duration(rollup_df)
+        else:
+            # Rollups construidos antes de guardar los rangos de duración: se calcula en MongoDB
+            outbound_calls_by_duration = aggregations.aggregate_outbound_calls_by_duration(filters)
+    else:
+        outbound_users_percentage_by_week = metric(
+            results, "outbound_users_percentage_by_week", outbound.get_outbound_calls_by_week
+        )
+        outbound_calls_by_duration = metric(results, "outbound_calls_by_duration", outbound.get_outbound_calls_by_duration)
+    # Usuarios distintos: con rollups se mezclan sus sketches HyperLogLog (conteo aproximado)
+    approximate_users = "rollup_df" in results and rollups.has_user_sketches(results["rollup_df"])
+    if approximate_users:
+        outbound_calls_by_age = rollups.rollup_outbound_users_by_age(results["rollup_df"])
+        outbound_calls_by_gender = rollups.rollup_outbound_users_by_gender(results["rollup_df"])
+    elif "rollup_df" in results:
+        # Rollups construidos antes de guardar los sketches: conteo exacto en MongoDB
+        outbound_calls_by_age = aggregations.aggregate_outbound_users_by_age(filters)
+        outbound_calls_by_gender = aggregations.aggregate_outbound_users_by_gender(filters)
+    else:
+        outbound_calls_by_age = metric(results, "outbound_users_by_age", outbound.get_outbound_calls_by_age)
+        outbound_calls_by_gender = metric(results, "outbound_users_by_gender", outbound.get_outbound_calls_by_gender)
+    if "calls_df" in results:
+        show_malformed_call_start_times(results["calls_df"])
 
     # Visualización en Streamlit
     st.title("Métricas de Usuarios Outbound")
+    if use_live_metrics:
+        show_live_metrics(page_selection)
 
     st.header("Número de llamadas contactados outbound por semana")
     if outbound_users_percentage_by_week.empty:
@@ -90,15 +379,73 @@ elif page_selection == "Llamadas Outbound":
     else:
         st.bar_chart(outbound_calls_by_gender)
 
+    if approximate_users:
+        import hll
+        st.caption(
+            f"Usuarios distintos por edad y género aproximados con HyperLogLog "
+            f"(error estándar ±{hll.relative_error():.1%})."
+        )
+        if validate_approximations:
+            # Validación contra el conteo exacto con las llamadas de la página
+            distinct_errors = rollups.check_distinct_counts(page_calls_data(results), results["rollup_df"])
+            st.caption("Error observado contra el conteo exacto: " + ", ".join(
+                f"{name} {error:.1%}" for name, error in distinct_errors.items()
+            ))
+
 elif page_selection == "Tiempos de llamadas":
+    duration_calls = page_registry.load_page_module(page_selection)
+
     # Visualización en Streamlit
     st.title("Métricas de Llamadas")
+    if use_live_metrics:
+        show_live_metrics(page_selection)
+
+    results = fetch_page_data({"rollup_df": partial(rollups.get_rollup_data, filters)}, required=()) if use_rollups else {}
+    if "rollup_df" in results:
+        rollup_df = results["rollup_df"]
+        average_call_duration = rollups.rollup_average_call_duration(rollup_df)
+        average_call_duration_by_gender = rollups.rollup_average_call_duration_by_gender(rollup_df)
+        average_duration_by_age = rollups.rollup_average_call_duration_by_age(rollup_df)
+        average_duration_by_day = rollups.rollup_average_call_duration_by_day_of_week(rollup_df)
+        average_duration_by_hour = rollups.rollup_average_call_duration_by_hour_of_day(rollup_df)
+        chatbot_vs_human_by_gender = rollups.rollup_chatbot_vs_human_percentage_by_gender(rollup_df)
+        chatbot_vs_human_by_age = rollups.rollup_chatbot_vs_human_percentage_by_age(rollup_df)
+    else:
+        rollup_df = None
+        # Una sola consulta a MongoDB para todas las métricas de la página
+        calls_df = fetch_page_data({"calls_df": load_calls_data})["calls_df"]
+        show_malformed_call_start_times(calls_df)
+        average_call_duration = duration_calls.get_average_call_duration(calls_df)
+        average_call_duration_by_gender = duration_calls.get_average_call_duration_by_gender(calls_df)
+        average_duration_by_age = duration_calls.get_average_call_duration_by_age(calls_df)
+        average_duration_by_day = duration_calls.get_average_call_duration_by_day_of_week(calls_df)
+        average_duration_by_hour = duration_calls.get_average_call_duration_by_hour_of_day(calls_df)
+        chatbot_vs_human_by_gender = duration_calls.get_chatbot_vs_human_percentage_by_gender(calls_df)
+        chatbot_vs_human_by_age = duration_calls.get_chatbot_vs_human_percentage_by_age(calls_df)
+
+    # Percentiles: con rollups se mezclan sus sketches de duraciones (cuantiles aproximados)
+    approximate_quantiles = rollup_df is not None and rollups.has_duration_sketches(rollup_df)
+    if approximate_quantiles:
+        duration_quantiles = {
+            "Género": rollups.rollup_call_duration_quantiles_by_gender(rollup_df),
+            "Edad": rollups.rollup_call_duration_quantiles_by_age(rollup_df),
+            "Día de la semana": rollups.rollup_call_duration_quantiles_by_day_of_week(rollup_df),
+            "Hora del día": rollups.rollup_call_duration_quantiles_by_hour_of_day(rollup_df),
+        }
+    else:
+        if rollup_df is not None:
+            # Rollups construidos antes de guardar los sketches: se calculan con las llamadas
+            calls_df = fetch_page_data({"calls_df": load_calls_data})["calls_df"]
+        duration_quantiles = {
+            "Género": duration_calls.get_call_duration_quantiles_by_gender(calls_df),
+            "Edad": duration_calls.get_call_duration_quantiles_by_age(calls_df),
+            "Día de la semana": duration_calls.get_call_duration_quantiles_by_day_of_week(calls_df),
+            "Hora del día": duration_calls.get_call_duration_quantiles_by_hour_of_day(calls_df),
+        }
 
     # Encabezados
-    average_call_duration = get_average_call_duration()
     st.subheader(f"Duración de llamada promedio total: {average_call_duration} minutos")
 
-    average_call_duration_by_gender = get_average_call_duration_by_gender()
     if average_call_duration_by_gender.empty:
         st.warning("No hay datos disponibles para la duración promedio por género.")
     else:
@@ -108,53 +455,80 @@ elif page_selection == "Tiempos de llamadas":
 
     # Gráficas
     st.header("Duración promedio por edad (rangos de 5 años)")
-    average_duration_by_age = get_average_call_duration_by_age()
     if average_duration_by_age.empty:
         st.warning("No hay datos disponibles para la duración promedio por edad.")
     else:
         st.bar_chart(average_duration_by_age)
 
     st.header("Duración promedio por día de la semana")
-    average_duration_by_day = get_average_call_duration_by_day_of_week()
     if average_duration_by_day.empty:
         st.warning("No hay datos disponibles para la duración promedio por día de la semana.")
     else:
         st.bar_chart(average_duration_by_day)
 
     st.header("Duración promedio por hora del día")
-    average_duration_by_hour = get_average_call_duration_by_hour_of_day()
     if average_duration_by_hour.empty:
         st.warning("No hay datos disponibles para la duración promedio por hora del día.")
     else:
         st.bar_chart(average_duration_by_hour)
 
     st.header("Porcentaje de conversación promedio: Chatbot vs Cliente por género")
-    chatbot_vs_human_by_gender = get_chatbot_vs_human_percentage_by_gender()
     if chatbot_vs_human_by_gender.empty:
         st.warning("No hay datos disponibles para el porcentaje de conversación por género.")
     else:
         st.bar_chart(chatbot_vs_human_by_gender)
 
     st.header("Porcentaje de conversación promedio: Chatbot vs Cliente por edad")
-    chatbot_vs_human_by_age = get_chatbot_vs_human_percentage_by_age()
     if chatbot_vs_human_by_age.empty:
         st.warning("No hay datos disponibles para el porcentaje de conversación por edad.")
     else:
         st.bar_chart(chatbot_vs_human_by_age)
 
+    st.header("Percentiles de duración (p50, p90, p99)")
+    quantile_segment = st.selectbox("Segmento", list(duration_quantiles))
+    if duration_quantiles[quantile_segment].empty:
+        st.warning("No hay datos disponibles para los percentiles de duración.")
+    else:
+        st.bar_chart(duration_quantiles[quantile_segment], stack=False)
+    if approximate_quantiles:
+        import quantiles
+        st.caption(f"Percentiles aproximados con sketches de duraciones (error relativo ±{quantiles.QUANTILE_ACCURACY:.0%}).")
+        if validate_approximations:
+            # Validación contra los percentiles exactos de las llamadas de la página
+            calls_df = fetch_page_data({"calls_df": load_calls_data})["calls_df"]
+            quantile_errors = rollups.check_duration_quantiles(calls_df, rollup_df)
+            st.caption("Error observado contra los percentiles exactos: " + ", ".join(
+                f"{name} {error:.1%}" for name, error in quantile_errors.items()
+            ))
+
 elif page_selection == "Tiempos por temas":
+    topics = page_registry.load_page_module(page_selection)
+    import altair as alt
+
     # Main Streamlit Visualization
     st.title("Análisis de Conversación por Tema")
 
-    # Fetch data
-    df = get_data_by_topic()
+    # Cubo de tiempos por tema: de los rollups, calculado en MongoDB o agrupando las filas de temas
+    queries = {}
+    if use_rollups:
+        queries["rollup_df"] = partial(rollups.get_rollup_data, filters)
+    elif use_aggregation:
+        queries["topic_cube"] = partial(aggregations.aggregate_topic_cube, filters)
+    results = fetch_page_data(queries, required=()) if queries else {}
+    if "rollup_df" in results:
+        topic_cube = rollups.rollup_topic_cube(results["rollup_df"])
+    elif "topic_cube" in results:
+        topic_cube = results["topic_cube"]
+    else:
+        df = fetch_page_data({"df": load_topic_data}, required=("df",))["df"]
+        topic_cube = topics.get_topic_cube(df)
 
-    if df.empty:
+    if topic_cube.empty:
         st.warning("No hay datos disponibles para análisis.")
     else:
         # 1. Porcentaje de tiempo promedio del chatbot vs. cliente por tema
         st.header("Porcentaje de tiempo promedio del Chatbot vs Cliente por Tema")
-        percentage_by_topic = get_percentage_time_by_topic(df)
+        percentage_by_topic = topics.get_percentage_time_by_topic(topic_cube)
         # Resetear el índice para trabajar con Altair
         percentage_by_topic_reset = percentage_by_topic.reset_index()
 
@@ -183,10 +557,10 @@ elif page_selection == "Tiempos por temas":
 
         # Mostrar la gráfica de torta
         st.header("Porcentaje de tiempo por tema")
-        generate_pie_chart_by_topic(df)
+        topics.generate_pie_chart_by_topic(topic_cube)
 
         # Calcular los porcentajes por tema y rangos de edad
-        percentage_by_age_ranges = get_percentage_time_by_age_ranges(df)
+        percentage_by_age_ranges = topics.get_percentage_time_by_age_ranges(topic_cube)
 
         # Mostrar la tabla resultante
         st.header("Porcentaje de tiempo por tema y rangos de edad")
@@ -213,7 +587,7 @@ elif page_selection == "Tiempos por temas":
         #st.title("Análisis de tiempo por género")
 
         # Calcular los porcentajes por tema y género
-        percentage_by_gender = get_percentage_time_by_gender(df)
+        percentage_by_gender = topics.get_percentage_time_by_gender(topic_cube)
 
         # Generar gráfico si hay datos disponibles
         if not percentage_by_gender.empty:
@@ -233,4 +607,67 @@ elif page_selection == "Tiempos por temas":
             st.header("Porcentaje de tiempo por tema y género")
             st.altair_chart(chart, use_container_width=True)
         else:
-            st.warning("No hay datos disponibles para generar el gráfico.")
\ No newline at end of file
+            st.warning("No hay datos disponibles para generar el gráfico.")
+
+show_gender_filter()
+
+# Estado del caché de métricas
+cache_stats = get_cache_stats()
+st.sidebar.caption(
+    f"Caché: {cache_stats['hits']} aciertos, {cache_stats['misses']} fallos, "
+    f"{cache_stats['coalesced']} compartidos en curso, {cache_stats['entries']} resultados guardados "
+    f"({cache_stats['bytes'] / 1024 / 1024:.1f} MB)"
+)
+if cache_stats["disk"] is not None:
+    st.sidebar.caption(
+        f"Caché en disco: {cache_stats['disk_hits']} resultados leídos, {cache_stats['warmed']} cargados al arrancar, "
+        f"{cache_stats['disk']['entries']} archivos ({cache_stats['disk']['bytes'] / 1024 / 1024:.1f} MB)"
+    )
+
+# Uso del pool de conexiones a MongoDB
+pool_stats = get_pool_stats()
+if pool_stats["connected"]:
+    st.sidebar.caption(
+        f"Conexiones MongoDB: {pool_stats['in_use']} en uso, {pool_stats['open_connections']} abiertas "
+        f"(máximo {pool_stats['max_pool_size']}), {pool_stats['checkout_failures']} esperas fallidas"
+    )
+
+# Duración de esta ejecución del script; la primera del proceso queda como arranque en frío
+page_registry.record_script_run(page_selection, time.perf_counter() - run_start)
+
+# Funciones de datos y comandos de MongoDB ejecutados durante esta carga de la página
+if show_diagnostics:
+    operations = instrumentation.get_recent_operations(since=diagnostics_start)
+    with st.sidebar.expander("Diagnóstico", expanded=True):
+        if operations:
+            diagnostics_df = pd.DataFrame(operations).rename(columns={
+                "name": "función",
+                "cached": "caché",
+                "duration": "total (s)",
+                "mongo_time": "MongoDB (s)",
+                "python_time": "Python (s)",
+                "commands": "comandos",
+                "documents_returned": "documentos",
+                "response_bytes": "bytes",
+                "rows": "filas",
+            })
+            st.dataframe(diagnostics_df[[
+                "función", "caché", "total (s)", "MongoDB (s)", "Python (s)", "comandos", "documentos", "bytes", "filas"
+            ]], hide_index=True)
+        else:
+            st.caption("No se ejecutaron funciones de datos en esta carga.")
+        startup_stats = page_registry.get_startup_stats()
+        if startup_stats["cold_start"]:
+            import_times = ", ".join(
+                f"{module} {duration:.2f} s" for module, duration in startup_stats["import_times"].items()
+            )
+            st.caption(
+                f"Arranque en frío: {startup_stats['cold_start']['duration']:.2f} s "
+                f"({startup_stats['cold_start']['page']}). Módulos de página importados: {import_times or 'ninguno'}"
+            )
+        st.download_button(
+            "Descargar métricas (Prometheus)",
+            instrumentation.prometheus_metrics(),
+            file_name="kuidalos_metrics.prom",
+            mime="text/plain"
+        )
@@ -0,0 +1,110 @@
+import streamlit as st
+import random
+import sys
+from datetime import datetime, timedelta
+
+# Base de datos donde se cargan los datos sintéticos (nunca la del dashboard)
+BENCHMARK_DATABASE = st.secrets.get("BENCHMARK_DATABASE", "kuidalos_benchmark")
+
+DEFAULT_TOPICS = ["Salud", "Familia", "Clima", "Deportes", "Noticias", "Recuerdos", "Otros"]
+
+# Valores mal formados que aparecen en los datos reales
+MALFORMED_AGES = ["", "abc", "sesenta", None]
+MALFORMED_TIMESTAMPS = ["", "sin fecha", "05/03/2024 13:22"]
+
+
+def generate_documents(
+    users,
+    calls_per_user=10,
+    topics=DEFAULT_TOPICS,
+    start=datetime(2024, 1, 1),
+    days=365,
+    malformed_age_rate=0.05,
+    malformed_timestamp_rate=0.01,
+    seed=0
+):
+    """
+    Genera documentos de `call_information` con la misma forma que los reales:
+    un documento por usuario con su lista de llamadas. El número de llamadas por
+    usuario varía entre 0 y el doble de `calls_per_user`, y las fechas se reparten
+    en `days` días a partir de `start`. Con la misma semilla se generan los
+    mismos documentos, así que se puede recorrer más de una vez sin guardarlos.
+    """
+    rng = random.Random(seed)
+    seconds = days * 24 * 60 * 60
+    for user in range(users):
+        if rng.random() < malformed_age_rate:
+            user_age = rng.choice(MALFORMED_AGES)
+        else:
+            user_age = str(rng.choice([rng.randint(60, 95), rng.randint(60, 95), rng.randint(40, 59)]))
+
+        calls = []
+        for number in range(rng.randint(0, 2 * calls_per_user)):
+            if rng.random() < malformed_timestamp_rate:
+                call_start_time = rng.choice(MALFORMED_TIMESTAMPS)
+            else:
+                moment = start + timedelta(seconds=rng.randrange(seconds))
+                call_start_time = f"{moment.isoformat()}.{rng.randrange(1000000):06d}"
+
+            call = {
+                "call_id": f"call-{user}-{number}",
+                "type_call": "inbound" if rng.random() < 0.6 else "outbound",
+                "call_start_time": call_start_time,
+            }
+            if rng.random() < 0.97:
+                total_time = rng.lognormvariate(5.5, 0.8)
+                bot_share = rng.uniform(0.3, 0.7)
+                call["call_duration"] = {
+                    "original_total_time": total_time,
+                    "bot": total_time * bot_share,
+                    "human": total_time * (1 - bot_share),
+                }
+            if rng.random() < 0.7:
+                call["analysis"] = {"times_by_subject": {
+                    topic: {"bot": rng.uniform(0, 120), "persona": rng.uniform(0, 120)}
+                    for topic in rng.sample(topics, rng.randint(1, min(3, len(topics))))
+                }}
+            calls.append(call)
+
+        document = {
+            "user_id": f"user-{user}",
+            "user_gender": rng.choice(["Female", "Male", "Female", "Male", None]),
+            "calls": calls,
+        }
+        if user_age is not None:
+            document["user_age"] = user_age
+        yield document
+
+
+def load_documents(collection, documents, batch_size=1000):
+    """
+    Inserta los documentos en lotes. Regresa el número de documentos insertados.
+    """
+    inserted = 0
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == batch_size:
+            collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
+
+
+def get_benchmark_collection():
+    from db import get_client
+
+    return get_client()[BENCHMARK_DATABASE]["call_information"]
+
+
+if __name__ == "__main__":
+    # Uso: python synthetic_data.py <usuarios> [llamadas_por_usuario]
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    calls_per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    collection = get_benchmark_collection()
+    collection.drop()
+    inserted = load_documents(collection, generate_documents(users, calls_per_user))
+    print(f"{inserted} usuarios cargados en {BENCHMARK_DATABASE}.call_information")
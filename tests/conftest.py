@@ -0,0 +1,114 @@
+import os
+import sys
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+import pytest
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache
+import db
+from synthetic_data import generate_documents, load_documents
+
+# Sin estas variables las pruebas usan mongomock y se omiten las marcadas `mongod` y `replica_set`
+TEST_MONGODB_URI = os.environ.get("KUIDALOS_TEST_MONGODB_URI")
+TEST_REPLICA_SET_URI = os.environ.get("KUIDALOS_TEST_REPLICA_SET_URI")
+TEST_DATABASE = "kuidalos_test"
+
+
+def pytest_collection_modifyitems(config, items):
+    for item in items:
+        if "mongod" in item.keywords and not (TEST_MONGODB_URI or TEST_REPLICA_SET_URI):
+            item.add_marker(pytest.mark.skip(reason="sin KUIDALOS_TEST_MONGODB_URI"))
+        if "replica_set" in item.keywords and not TEST_REPLICA_SET_URI:
+            item.add_marker(pytest.mark.skip(reason="sin KUIDALOS_TEST_REPLICA_SET_URI"))
+
+
+def _mongomock_bulk_write(self, requests, ordered=True, **kwargs):
+    # mongomock 4.3 no acepta las operaciones de pymongo >= 4.9 en bulk_write: se aplican una por una
+    for request in requests:
+        if isinstance(request, InsertOne):
+            self.insert_one(request._doc)
+        elif isinstance(request, UpdateOne):
+            self.update_one(request._filter, request._doc, upsert=request._upsert)
+        elif isinstance(request, UpdateMany):
+            self.update_many(request._filter, request._doc, upsert=request._upsert)
+        elif isinstance(request, ReplaceOne):
+            self.replace_one(request._filter, request._doc, upsert=request._upsert)
+        elif isinstance(request, DeleteOne):
+            self.delete_one(request._filter)
+        elif isinstance(request, DeleteMany):
+            self.delete_many(request._filter)
+        else:
+            raise NotImplementedError(type(request).__name__)
+
+
+def _mongomock_date_from_string(handle_date_operator):
+    """
+    mongomock 4.3 no implementa $dateFromString. Se evalúa como el servidor para
+    los textos ISO 8601 que guarda `call_start_time`: la fecha se interpreta en
+    `timezone` (UTC por omisión) y se regresa en UTC sin zona horaria, con
+    `onNull` si el texto falta y `onError` si no es una fecha.
+    """
+    def handle(self, operator, values):
+        if operator != "$dateFromString":
+            return handle_date_operator(self, operator, values)
+        try:
+            date_string = self.parse(values["dateString"])
+        except KeyError:
+            date_string = None
+        if date_string is None:
+            return self.parse(values.get("onNull"))
+        try:
+            moment = datetime.fromisoformat(date_string)
+        except (TypeError, ValueError):
+            if "onError" in values:
+                return self.parse(values["onError"])
+            raise
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=ZoneInfo(values.get("timezone", "UTC")))
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return handle
+
+
+def _client(uri):
+    if uri:
+        from pymongo import MongoClient
+
+        return MongoClient(uri)
+    import mongomock
+    import mongomock.aggregate as mongomock_aggregate
+
+    mongomock.collection.Collection.bulk_write = _mongomock_bulk_write
+    parser = mongomock_aggregate._Parser
+    if not getattr(parser._handle_date_operator, "date_from_string", False):
+        parser._handle_date_operator = _mongomock_date_from_string(parser._handle_date_operator)
+        parser._handle_date_operator.date_from_string = True
+    return mongomock.MongoClient()
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """
+    Base de datos vacía para la prueba: un mongod real si se configuró la URI,
+    o mongomock. Las funciones de datos la usan a través de `db.get_collection`.
+    """
+    uri = TEST_REPLICA_SET_URI or TEST_MONGODB_URI
+    client = _client(uri)
+    client.drop_database(TEST_DATABASE)
+    monkeypatch.setattr(db, "get_database", lambda: client[TEST_DATABASE])
+    cache.clear_cache()
+    yield client[TEST_DATABASE]
+    cache.clear_cache()
+    client.drop_database(TEST_DATABASE)
+    client.close()
+
+
+@pytest.fixture
+def calls_collection(database):
+    # Documentos sintéticos con la forma de `call_information`, incluidos valores mal formados
+    collection = database["call_information"]
+    load_documents(collection, generate_documents(300, calls_per_user=6, malformed_timestamp_rate=0.03))
+    return collection
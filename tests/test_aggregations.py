@@ -0,0 +1,93 @@
+from datetime import date
+
+import pytest
+
+import aggregations
+import inbound
+import outbound
+from call_data import build_filters, get_calls_data
+
+FILTERS = [
+    None,
+    build_filters(type_call="inbound"),
+    build_filters(user_gender="Female", age_range=(65, 80)),
+    build_filters(date_range=(date(2024, 3, 1), date(2024, 6, 30))),
+]
+
+
+def assert_same_counts(result, expected):
+    assert list(result.index.astype(str)) == list(expected.index.astype(str))
+    assert list(result.values) == list(expected.values)
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_histograms_without_dates_match_pandas(calls_collection, filters):
+    calls_df = get_calls_data(filters)
+    assert_same_counts(aggregations.aggregate_inbound_calls_by_gender(filters), inbound.get_inbound_calls_by_gender(calls_df))
+    assert_same_counts(aggregations.aggregate_inbound_calls_by_duration(filters), inbound.get_inbound_calls_by_duration(calls_df))
+    assert_same_counts(aggregations.aggregate_outbound_calls_by_duration(filters), outbound.get_outbound_calls_by_duration(calls_df))
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_all_pipelines_match_pandas(calls_collection, filters):
+    # Con mongomock, $dateFromString lo evalúa conftest; con un mongod, el servidor
+    parity = aggregations.check_aggregation_parity(get_calls_data(filters), filters)
+    assert parity == {name: True for name in parity}
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_user_metrics_match_pandas(calls_collection, filters):
+    calls_df = get_calls_data(filters)
+    assert_same_counts(aggregations.aggregate_inbound_calls_by_age(filters), inbound.get_inbound_calls_by_age(calls_df))
+    assert_same_counts(aggregations.aggregate_outbound_users_by_age(filters), outbound.get_outbound_calls_by_age(calls_df))
+    assert_same_counts(aggregations.aggregate_outbound_users_by_gender(filters), outbound.get_outbound_calls_by_gender(calls_df))
+    assert aggregations.aggregate_calls_distribution_counts(filters).equals(inbound.get_calls_distribution_counts(calls_df))
+
+
+# Llamadas en los límites de hora, día y semana: (call_start_time, tipo)
+BOUNDARY_CALLS = [
+    ("2024-03-10T23:59:59.999999", "inbound"),  # domingo UTC, 17:59 en México
+    ("2024-03-11T00:00:00", "inbound"),  # lunes UTC, todavía domingo 18:00 en México
+    ("2024-03-11T05:59:59.5", "inbound"),  # 23:59 del domingo en México
+    ("2024-03-11T06:00:00", "inbound"),  # medianoche del lunes en México
+    ("2024-03-17T23:59:59", "outbound"),  # último segundo de la semana del 11/03
+    ("2024-03-18T00:00:00", "outbound"),  # primer segundo de la semana del 18/03
+    ("2024-12-31T23:30:00", "outbound"),  # semana que cruza el año
+    ("sin fecha", "inbound"),
+    ("", "outbound"),
+]
+
+
+@pytest.fixture
+def boundary_collection(database):
+    collection = database["call_information"]
+    collection.insert_one({
+        "user_id": "limites",
+        "user_gender": "Female",
+        "user_age": "70",
+        "calls": [
+            {
+                "call_id": f"limite-{index}",
+                "type_call": type_call,
+                "call_start_time": call_start_time,
+                "call_duration": {"original_total_time": 60.0, "bot": 30.0, "human": 30.0},
+            }
+            for index, (call_start_time, type_call) in enumerate(BOUNDARY_CALLS)
+        ],
+    })
+    return collection
+
+
+def test_date_buckets_on_hour_day_and_week_boundaries(boundary_collection):
+    calls_df = get_calls_data()
+    by_hour = aggregations.aggregate_inbound_calls_by_hour()
+    by_day = aggregations.aggregate_inbound_calls_by_day()
+    by_week = aggregations.aggregate_outbound_calls_by_week()
+    assert_same_counts(by_hour, inbound.get_inbound_calls_by_hour(calls_df))
+    assert_same_counts(by_day, inbound.get_inbound_calls_by_day(calls_df))
+    assert_same_counts(by_week, outbound.get_outbound_calls_by_week(calls_df))
+
+    # La hora es la de México (UTC-6); el día y la semana, los de UTC
+    assert {hour: count for hour, count in by_hour.items() if count} == {17: 1, 18: 1, 23: 1, 0: 1}
+    assert {day: count for day, count in by_day.items() if count} == {"Domingo": 1, "Lunes": 3}
+    assert by_week.to_dict() == {"11/03/24 - 17/03/24": 1, "18/03/24 - 24/03/24": 1, "30/12/24 - 05/01/25": 1}
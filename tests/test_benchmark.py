@@ -0,0 +1,55 @@
+import json
+import os
+import benchmark
+import db
+from page_registry import PAGES
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "baseline.json")
+
+
+def results(source="mongomock", steps=("load_calls", "topic_cube"), startup=("startup.inbound",)):
+    measures = {"wall_time": 0.1, "peak_memory": 1024}
+    return {
+        "source": source,
+        "scales": {"10000": {"steps": {step: dict(measures) for step in steps}}},
+        "startup": {"steps": {step: dict(measures) for step in startup}},
+    }
+
+
+def test_same_benchmark_is_comparable():
+    assert benchmark.incompatibilities(results(), results()) == []
+    assert benchmark.compare(results(), results()) == []
+
+
+def test_baseline_from_another_source_or_step_set_is_rejected():
+    assert benchmark.incompatibilities(results(), results(source="memory")) == [
+        "fuente memory en la línea base y mongomock ahora"
+    ]
+    assert benchmark.incompatibilities(results(), results(steps=("load_calls", "load_topics"))) == [
+        "10000: paso nuevo topic_cube",
+        "10000: ya no se mide load_topics",
+    ]
+    assert benchmark.incompatibilities(results(), {**results(), "startup": None}) == ["startup: no está en la línea base"]
+    assert benchmark.incompatibilities(results(), {**results(), "scales": {}}) == ["10000: no está en la línea base"]
+
+
+def test_regressions_beyond_the_tolerance():
+    current = results()
+    current["scales"]["10000"]["steps"]["load_calls"]["wall_time"] = 1.0
+    assert benchmark.compare(current, results()) == [("10000", "load_calls", "wall_time", 0.1, 1.0)]
+
+
+def test_committed_baseline_measures_the_current_steps(monkeypatch):
+    # `benchmark_collection` reemplaza db.get_database; monkeypatch lo restaura al terminar
+    monkeypatch.setattr(db, "get_database", db.get_database)
+    with open(BASELINE_PATH) as f:
+        baseline = json.load(f)
+    # Los pasos no dependen de la escala: basta una pequeña
+    scale = benchmark.run_scale(100, repeat=1)
+    current = {
+        "source": "mongomock",
+        "scales": {total_calls: scale for total_calls in baseline["scales"]},
+        "startup": {"steps": {f"startup.{module_name}": {} for module_name in PAGES.values()}},
+    }
+    # Si falla, regenerar con: python benchmark.py --output benchmarks/baseline.json
+    assert benchmark.incompatibilities(current, baseline) == []
@@ -0,0 +1,191 @@
+import gc
+import threading
+import time
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import cache
+from call_data import build_filters
+
+
+def example(*args, **kwargs):
+    pass
+
+
+def test_key_ignores_dict_insertion_order():
+    first = {"type_call": "inbound", "age_range": (65, 80)}
+    second = {"age_range": (65, 80), "type_call": "inbound"}
+    assert cache.make_key(example, (first,), {}) == cache.make_key(example, (second,), {})
+
+
+def test_key_normalises_nested_values():
+    filters = build_filters(date_range=(date(2024, 3, 1), date(2024, 6, 30)), user_gender="Female")
+    same = {"user_gender": "Female", "date_range": [date(2024, 3, 1), date(2024, 6, 30)]}
+    assert cache.make_key(example, (), {"filters": filters}) == cache.make_key(example, (), {"filters": dict(filters)})
+    # Una lista y una tupla con los mismos valores no se confunden
+    assert cache.make_key(example, (filters,), {}) != cache.make_key(example, (same,), {})
+    assert cache.make_key(example, ({"a", "b"},), {}) == cache.make_key(example, ({"b", "a"},), {})
+
+
+def test_key_distinguishes_different_values():
+    assert cache.make_key(example, ([1, 2],), {}) != cache.make_key(example, ([2, 1],), {})
+    assert cache.make_key(example, ({"age_range": (65, 80)},), {}) != cache.make_key(example, ({"age_range": (65, 81)},), {})
+
+
+def test_key_rejects_unhashable_objects():
+    class Unhashable:
+        __hash__ = None
+
+    with pytest.raises(TypeError):
+        cache.make_key(example, (Unhashable(),), {})
+
+
+def test_disk_key_is_stable_for_equal_filters():
+    first = cache.disk_key(example, ({"b": [1, 2], "a": None},), {})
+    second = cache.disk_key(example, ({"a": None, "b": [1, 2]},), {})
+    assert first == second
+
+
+
+def test_data_version_belongs_to_the_stamped_frame_only():
+    df = pd.DataFrame({"calls": [1, 2, 3]})
+    cache.set_data_version(df, 42, "huella")
+    assert (cache.data_version(df), cache.data_fingerprint(df)) == (42, "huella")
+    # Copias y filtros no heredan la marca: se identifican por su contenido
+    derived = [df.copy(), df[df["calls"] > 1], df.copy(deep=False)]
+    for frame in derived:
+        assert cache.data_version(frame) == int(pd.util.hash_pandas_object(frame, index=True).sum())
+
+
+def test_data_version_is_forgotten_with_the_frame():
+    df = pd.DataFrame({"calls": [1]})
+    key = id(df)
+    cache.set_data_version(df, 1)
+    cache.set_data_version(df, 2)
+    assert cache.data_version(df) == 2
+    del df
+    gc.collect()
+    # Un DataFrame nuevo con el mismo id no recibe la versión del anterior
+    assert key not in cache._data_versions
+
+
+class Gate:
+    """
+    Función para `cached` que se detiene hasta que la prueba la libera, para
+    tener varias llamadas en curso al mismo tiempo.
+    """
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.error = error
+
+    def run(self, value):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return [value]
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    cache.clear_cache()
+    yield
+    cache.clear_cache()
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def call_in_threads(func, count):
+    outcomes = [None] * count
+
+    def run(index):
+        try:
+            outcomes[index] = func("a")
+        except Exception as e:
+            outcomes[index] = e
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def test_concurrent_misses_run_the_function_once():
+    gate = Gate()
+    func = cache.cached(gate.run)
+    coalesced = cache.get_cache_stats()["coalesced"]
+    threads, outcomes = call_in_threads(func, 8)
+    # Todas las llamadas esperan al mismo cálculo antes de liberarlo
+    wait_for(lambda: cache.get_cache_stats()["coalesced"] - coalesced == 7)
+    gate.release.set()
+    for thread in threads:
+        thread.join()
+    assert gate.calls == 1
+    assert outcomes == [["a"]] * 8
+    assert func("a") == ["a"]
+    assert gate.calls == 1
+
+
+def test_the_leader_error_reaches_the_waiters():
+    gate = Gate(error=ValueError("sin datos"))
+    func = cache.cached(gate.run)
+    coalesced = cache.get_cache_stats()["coalesced"]
+    threads, outcomes = call_in_threads(func, 4)
+    wait_for(lambda: cache.get_cache_stats()["coalesced"] - coalesced == 3)
+    gate.release.set()
+    for thread in threads:
+        thread.join()
+    assert gate.calls == 1
+    assert all(outcome is gate.error for outcome in outcomes)
+
+    # El error no se guarda: la siguiente llamada vuelve a calcular
+    gate.error = None
+    assert func("a") == ["a"]
+    assert gate.calls == 2
+
+
+def test_clear_during_a_flight_keeps_the_result_out_of_the_cache():
+    gate = Gate()
+    func = cache.cached(gate.run)
+    threads, outcomes = call_in_threads(func, 1)
+    assert gate.started.wait(5)
+    cache.clear_cache(func)
+    gate.release.set()
+    threads[0].join()
+    # Quien lo pidió recibe el resultado, pero no queda guardado
+    assert outcomes == [["a"]]
+    assert cache.get_cache_stats()["entries"] == 0
+    assert func("a") == ["a"]
+    assert gate.calls == 2
+
+
+def test_max_bytes_evicts_the_least_recently_used(monkeypatch):
+    def build(value):
+        calls.append(value)
+        return "x" * 1000
+
+    calls = []
+    func = cache.cached(build)
+    size = cache.estimate_bytes("x" * 1000)
+    monkeypatch.setattr(cache, "CACHE_MAX_BYTES", 2 * size)
+    func(1)
+    func(2)
+    func(1)  # 1 pasa a ser el más reciente
+    func(3)  # excede el límite: sale 2
+    assert cache.get_cache_stats()["bytes"] == 2 * size
+    func(1)
+    func(3)
+    assert calls == [1, 2, 3]
+    func(2)
+    assert calls == [1, 2, 3, 2]
@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+import call_data
+from datetime import date
+from call_data import (
+    build_calls_frame, build_filters, filter_calls, find_calls, get_calls_data, parse_call_start_time,
+    parse_call_start_times, CALLS_QUERY, CALLS_PROJECTION,
+)
+
+
+@pytest.fixture
+def documents_without_calls(database):
+    collection = database["call_information"]
+    collection.insert_many([
+        {"user_id": "sin-llamadas", "user_gender": "Female", "user_age": "70", "calls": []},
+        {"user_id": "llamadas-null", "user_gender": "Male", "user_age": "75", "calls": None},
+        {"user_id": "sin-campo", "user_gender": "Male", "user_age": "80"},
+        {"user_id": "con-llamada", "user_gender": "Female", "user_age": "65", "calls": [
+            {"call_id": "c1", "type_call": "inbound", "call_start_time": "2024-05-01T10:00:00.123456",
+             "call_duration": {"original_total_time": 90.0, "bot": 30.0, "human": 60.0}},
+        ]},
+    ])
+    return collection
+
+
+def test_calls_query_skips_documents_without_calls(documents_without_calls):
+    assert [document["user_id"] for document in documents_without_calls.find(CALLS_QUERY)] == ["con-llamada"]
+
+
+@pytest.mark.parametrize("columnar_fetch", [True, False])
+def test_calls_data_with_null_calls(documents_without_calls, monkeypatch, columnar_fetch):
+    monkeypatch.setattr(call_data, "COLUMNAR_FETCH", columnar_fetch)
+    calls_df = get_calls_data.__wrapped__()
+    assert list(calls_df["call_id"]) == ["c1"]
+    assert build_calls_frame(find_calls(CALLS_QUERY, CALLS_PROJECTION)).equals(calls_df)
+
+
+def test_column_parsing_matches_parsing_each_value(calls_collection):
+    values = [call.get("call_start_time") for document in calls_collection.find() for call in document.get("calls") or []]
+    values += [None, "2024-05-01T10:00:00", "2024-05-01T10:00:00.5"]
+    parsed, malformed = parse_call_start_times(values)
+    expected = [parse_call_start_time(value) for value in values]
+    assert [None if pd.isna(moment) else moment.tz_convert(None).to_pydatetime() for moment in parsed] == expected
+    # Los vacíos no cuentan como mal formados
+    assert malformed == sum(1 for value, moment in zip(values, expected) if value and moment is None) > 0
+
+
+TRIM_FILTERS = [
+    build_filters(type_call="outbound"),
+    build_filters(date_range=(date(2024, 3, 1), date(2024, 6, 30))),
+    build_filters(date_range=(date(2024, 1, 1), date(2024, 1, 31)), type_call="inbound", user_gender="Male"),
+    build_filters(age_range=(65, 80), type_call="inbound"),
+]
+
+
+@pytest.mark.parametrize("filters", TRIM_FILTERS)
+def test_trimmed_calls_match_the_client_side_filter(calls_collection, filters):
+    documents = list(find_calls(CALLS_QUERY, CALLS_PROJECTION, filters))
+    calls_df = build_calls_frame(find_calls(CALLS_QUERY, CALLS_PROJECTION))
+    expected = filter_calls(calls_df, filters)
+    assert 0 < len(expected) < len(calls_df)
+    # MongoDB deja solo las llamadas que cumplen los filtros, y solo los usuarios que tienen alguna
+    assert sorted(call["call_id"] for document in documents for call in document["calls"]) == sorted(expected["call_id"])
+    assert sorted(document["user_id"] for document in documents) == sorted(expected["user_id"].unique())
+    assert {
+        field for document in documents for call in document["calls"] for field in call
+    } <= {"call_id", "type_call", "call_start_time", "call_duration"}
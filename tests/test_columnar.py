@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from call_data import (
+    build_calls_frame, build_calls_frame_from_columns, find_call_columns, find_calls, parse_age,
+    parse_call_start_times, CALL_COLUMNS, CALL_FIELDS, CALLS_QUERY, CALLS_PROJECTION,
+)
+from columnar import ColumnBuilder
+
+KINDS = {"call_id": "object", "type_call": "code", "duration": "float", "calls": "int", "user": "index"}
+ROWS = [
+    ("c1", "inbound", 1.5, 3, 0),
+    ("c2", None, None, 4, 0),
+    ("c3", "outbound", 2.0, 5, 1),
+    ("c4", "inbound", 0.0, 6, 2),
+]
+
+
+def test_typed_buffers_match_python_lists():
+    builder = ColumnBuilder(KINDS)
+    appenders = [builder.appender(name) for name in KINDS]
+    for row in ROWS:
+        for append, value in zip(appenders, row):
+            append(value)
+
+    assert len(builder) == len(ROWS)
+    columns = dict(zip(KINDS, zip(*ROWS)))
+    assert list(builder.column("call_id")) == list(columns["call_id"])
+    assert list(builder.column("type_call")) == list(columns["type_call"])
+    np.testing.assert_array_equal(builder.column("duration"), [1.5, np.nan, 2.0, 0.0])
+    assert builder.column("calls").dtype == np.int64 and list(builder.column("calls")) == list(columns["calls"])
+    assert builder.column("user").dtype == np.int32 and list(builder.column("user")) == list(columns["user"])
+    # Cada valor repetido se guarda una vez: las filas apuntan al mismo objeto
+    type_call = builder.column("type_call")
+    assert type_call[0] is type_call[3]
+
+
+def test_extended_columns_match_appended_ones():
+    appended, extended = ColumnBuilder(KINDS), ColumnBuilder(KINDS)
+    rows = [row[:2] + (np.nan,) + row[3:] if row[2] is None else row for row in ROWS]
+    for name, values in zip(KINDS, zip(*rows)):
+        append = appended.appender(name)
+        for value in values:
+            append(value)
+        extend = extended.extender(name)
+        extend(list(values[:1]))
+        extend(list(values[1:]))
+    for name in KINDS:
+        np.testing.assert_array_equal(extended.column(name), appended.column(name))
+
+
+def calls_frame_from_dicts(records):
+    # Armado anterior: una lista con un diccionario por llamada
+    rows = []
+    for record in records:
+        for call in record.get("calls", []):
+            call_duration = call.get("call_duration") or {}
+            rows.append({
+                "user_id": record.get("user_id"),
+                "user_age": parse_age(record.get("user_age")),
+                "user_gender": record.get("user_gender"),
+                "call_id": call.get("call_id"),
+                "type_call": call.get("type_call"),
+                "call_start_time": call.get("call_start_time"),
+                "duration": call_duration.get("original_total_time"),
+                "bot_time": call_duration.get("bot", 0),
+                "human_time": call_duration.get("human", 0),
+            })
+    df = pd.DataFrame(rows, columns=CALL_COLUMNS, dtype=object)
+    numeric = ["user_age", "duration", "bot_time", "human_time"]
+    df[numeric] = df[numeric].astype(float)
+    df["call_start_time"] = parse_call_start_times(df["call_start_time"])[0]
+    return df
+
+
+@pytest.mark.parametrize("from_columns", [False, True])
+def test_calls_frame_matches_the_list_of_dicts(calls_collection, from_columns):
+    expected = calls_frame_from_dicts(find_calls(CALLS_QUERY, CALLS_PROJECTION))
+    if from_columns:
+        calls_df = build_calls_frame_from_columns(find_call_columns(CALLS_QUERY, CALLS_PROJECTION, CALL_FIELDS))
+    else:
+        calls_df = build_calls_frame(find_calls(CALLS_QUERY, CALLS_PROJECTION))
+    pd.testing.assert_frame_equal(calls_df, expected)
@@ -0,0 +1,61 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import mongomock
+import pytest
+
+import db
+
+SECRETS = {"MONGODB_URI": "mongodb://db.example:27017", "MONGODB_DATABASE": "kuidalos", "MONGODB_MAX_POOL_SIZE": 5}
+
+
+@pytest.fixture
+def created(monkeypatch):
+    # Clientes creados: (URI, opciones); cada uno es un cliente de mongomock
+    created = []
+
+    def client(uri, **options):
+        # Tarda un poco, para que los hilos que llegan a la vez se encuentren
+        time.sleep(0.05)
+        created.append((uri, options))
+        return mongomock.MongoClient()
+
+    monkeypatch.setattr(db, "st", SimpleNamespace(secrets=SECRETS))
+    monkeypatch.setattr(db, "MongoClient", client)
+    monkeypatch.setattr(db, "_client", None)
+    return created
+
+
+def test_one_pooled_client_is_shared_by_every_thread(created):
+    # Importar los módulos de datos no abre conexiones
+    assert created == [] and not db.get_pool_stats()["connected"]
+
+    barrier = threading.Barrier(8)
+    clients = []
+
+    def first_use():
+        barrier.wait()
+        clients.append(db.get_collection().database.client)
+
+    threads = [threading.Thread(target=first_use) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1 and len({id(client) for client in clients}) == 1
+    uri, options = created[0]
+    assert uri == SECRETS["MONGODB_URI"]
+    assert options["maxPoolSize"] == 5
+    assert options["event_listeners"] == [db.pool_metrics, db.command_metrics]
+    assert db.get_pool_stats()["connected"]
+
+
+def test_collections_with_another_read_preference_use_the_same_client(created):
+    primary = db.get_collection("call_rollups")
+    secondary = db.get_collection("call_rollups", read_preference="secondaryPreferred")
+    assert secondary.database.client is primary.database.client is db.get_client()
+    assert secondary.full_name == "kuidalos.call_rollups"
+    assert secondary.read_preference.mongos_mode == "secondaryPreferred"
+    assert len(created) == 1
@@ -0,0 +1,196 @@
+import os
+import pickle
+import stat
+import time
+from collections import OrderedDict
+import pandas as pd
+import pytest
+import cache
+import disk_cache
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "disk_cache"
+    monkeypatch.setattr(disk_cache, "DISK_CACHE_DIR", str(directory))
+    disk_cache.reset_watermark()
+    yield directory
+    disk_cache.reset_watermark()
+
+
+@pytest.fixture
+def errors(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(disk_cache, "record_error", lambda name, error: recorded.append((name, type(error))))
+    return recorded
+
+
+def write(fingerprint, value, watermark="w1", memory_key=None):
+    # Escritura sin pasar por el hilo en segundo plano
+    metadata = {
+        "name": "prueba",
+        "fingerprint": fingerprint,
+        "watermark": watermark,
+        "created_at": time.time(),
+        "memory_key": memory_key,
+    }
+    disk_cache._write_entry(fingerprint, value, metadata, disk_cache._current_generation("prueba"))
+
+
+def forget_memory(monkeypatch):
+    # Un proceso nuevo: nada en memoria y la marca de agua se vuelve a leer
+    monkeypatch.setattr(cache, "_entries", OrderedDict())
+    monkeypatch.setattr(cache, "_total_bytes", 0)
+    disk_cache.reset_watermark()
+
+
+def stored_files(directory, suffix=disk_cache.ENTRY_SUFFIX):
+    return sorted(name for name in os.listdir(directory) if name.endswith(suffix))
+
+
+def test_round_trip_with_private_permissions(cache_dir):
+    df = pd.DataFrame(
+        {"calls": [3, 5], "duration": [1.5, None]},
+        index=pd.CategoricalIndex(["(60, 65]", "(65, 70]"], name="age_range_str"),
+    )
+    write("a", df)
+    metadata, value = disk_cache.read_entry("a")
+    pd.testing.assert_frame_equal(value, df)
+    assert metadata["watermark"] == "w1"
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(disk_cache.entry_path("a")).st_mode) == 0o600
+
+
+def test_existing_directory_is_made_private(cache_dir):
+    cache_dir.mkdir(mode=0o777)
+    os.chmod(cache_dir, 0o777)
+    write("a", [1, 2])
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+    assert disk_cache.read_entry("a")[1] == [1, 2]
+
+
+def test_files_others_can_write_are_not_unpickled(cache_dir, errors):
+    write("a", [1, 2])
+    os.chmod(disk_cache.entry_path("a"), 0o666)
+    assert disk_cache.read_entry("a") is None
+    assert errors == [("disk_cache.read_entry", PermissionError)]
+    assert stored_files(cache_dir) == []
+
+
+def test_directory_of_another_user_is_not_used(cache_dir, errors, monkeypatch):
+    write("a", [1, 2])
+    monkeypatch.setattr(disk_cache.os, "getuid", lambda: os.stat(cache_dir).st_uid + 1)
+    assert disk_cache.read_entry("a") is None
+    assert list(disk_cache.warm_entries("w1")) == []
+    assert [name for name, _ in errors] == ["disk_cache.read_entry", "disk_cache.warm_entries"]
+    # Nada se borra de un directorio ajeno
+    assert stored_files(cache_dir) == ["a.pkl"]
+
+
+def test_eviction_drops_the_least_recently_used(cache_dir, monkeypatch):
+    for fingerprint in ["a", "b", "c"]:
+        write(fingerprint, "x" * 1000)
+    for age, fingerprint in [(300, "a"), (200, "b"), (100, "c")]:
+        os.utime(disk_cache.entry_path(fingerprint), (time.time() - age,) * 2)
+    # Leer "a" lo vuelve el más reciente: sale "b", el menos usado
+    disk_cache.read_entry("a")
+    size = os.path.getsize(disk_cache.entry_path("a"))
+    monkeypatch.setattr(disk_cache, "DISK_CACHE_MAX_BYTES", 2 * size)
+    disk_cache.evict()
+    assert stored_files(cache_dir) == ["a.pkl", "c.pkl"]
+    assert disk_cache.get_disk_cache_stats()["bytes"] == 2 * size
+
+
+def test_writes_replace_the_entry_atomically(cache_dir, errors, monkeypatch):
+    write("a", "anterior")
+    replace = os.replace
+
+    def checked_replace(source, target):
+        # El archivo temporal ya está completo y el resultado anterior sigue intacto
+        with open(source, "rb") as f:
+            assert pickle.load(f)["fingerprint"] == "a"
+            assert pickle.load(f) == "nuevo"
+        assert disk_cache.read_entry("a")[1] == "anterior"
+        replace(source, target)
+
+    monkeypatch.setattr(disk_cache.os, "replace", checked_replace)
+    write("a", "nuevo")
+    assert disk_cache.read_entry("a")[1] == "nuevo"
+
+    def failed_replace(source, target):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(disk_cache.os, "replace", failed_replace)
+    write("a", "perdido")
+    assert disk_cache.read_entry("a")[1] == "nuevo"
+    assert errors == [("disk_cache.write_entry", OSError)]
+    assert stored_files(cache_dir, disk_cache.TEMP_SUFFIX) == []
+
+
+def test_a_new_watermark_invalidates_stored_results(cache_dir, monkeypatch):
+    watermark = {"value": "w1"}
+    monkeypatch.setattr(disk_cache, "USE_DISK_CACHE", True)
+    monkeypatch.setattr(disk_cache, "data_watermark", lambda: watermark["value"])
+    calls = []
+
+    def build(value):
+        calls.append(value)
+        return [value, watermark["value"]]
+
+    func = cache.cached(build)
+
+    def restart():
+        # Espera las escrituras en segundo plano y descarta la memoria, como un proceso nuevo
+        disk_cache._writer.submit(lambda: None).result()
+        forget_memory(monkeypatch)
+
+    assert func(1) == [1, "w1"]
+    restart()
+    assert func(1) == [1, "w1"]
+    assert calls == [1]
+
+    watermark["value"] = "w2"
+    restart()
+    assert func(1) == [1, "w2"]
+    assert calls == [1, 1]
+    restart()
+    assert len(stored_files(cache_dir)) == 2
+
+    # Al arrancar solo se cargan los de la marca de agua vigente; los demás se borran
+    warmed = [value for _, value in disk_cache.warm_entries("w2")]
+    assert warmed == [[1, "w2"]]
+    assert len(stored_files(cache_dir)) == 1
+
+
+def test_clearing_one_function_removes_only_its_stored_results(cache_dir, monkeypatch):
+    monkeypatch.setattr(disk_cache, "USE_DISK_CACHE", True)
+    monkeypatch.setattr(disk_cache, "data_watermark", lambda: "w1")
+    calls = []
+
+    def inbound(value):
+        calls.append(("inbound", value))
+        return value
+
+    def outbound(value):
+        calls.append(("outbound", value))
+        return value
+
+    inbound, outbound = cache.cached(inbound), cache.cached(outbound)
+    assert (inbound(1), outbound(1)) == (1, 1)
+    disk_cache._writer.submit(lambda: None).result()
+    assert len(stored_files(cache_dir)) == 2
+
+    cache.clear_cache(inbound)
+    assert len(stored_files(cache_dir)) == 1
+    forget_memory(monkeypatch)
+    # Al volver a cargar, solo la función limpiada consulta de nuevo
+    assert (inbound(1), outbound(1)) == (1, 1)
+    assert calls == [("inbound", 1), ("outbound", 1), ("inbound", 1)]
+
+
+def test_pending_writes_of_a_cleared_function_are_dropped(cache_dir):
+    pending = disk_cache._current_generation("prueba")
+    disk_cache.remove_entries("prueba")
+    metadata = {"name": "prueba", "fingerprint": "a", "watermark": "w1", "created_at": time.time(), "memory_key": None}
+    disk_cache._write_entry("a", [1, 2], metadata, pending)
+    assert stored_files(cache_dir) == []
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from histograms import DurationHistogram, duration_bucket, BUCKET_MINUTES
+
+# Duraciones en segundos en los límites de los rangos, justo antes y justo después
+EDGE_DURATIONS = [
+    [0.0, 300.0, 600.0, 600.0, 899.99, 900.0],
+    [1.0, 299.999, 300.0, 300.001, 1500.0],
+    [60 * 4.9, 60 * 5.1, 60 * 0.1 * 3 * 100],
+    [0.0],
+    [3600.0],
+]
+
+
+def pandas_histogram(durations):
+    # El cálculo original de los getters de duración: intervalos cerrados a la izquierda
+    # y el último límite incrementado para incluir el máximo
+    minutes = pd.Series(durations, dtype=float) / 60
+    bins = np.arange(0, minutes.max() + BUCKET_MINUTES, BUCKET_MINUTES)
+    bins[-1] += 0.1
+    ranges = pd.cut(minutes, bins=bins, right=False, include_lowest=True)
+    labels = [str(pd.Interval(bins[i], bins[i + 1], closed="left")) for i in range(len(bins) - 1)]
+    return pd.Categorical(ranges.astype(str), categories=labels, ordered=True).value_counts().sort_index()
+
+
+def assert_same_histogram(result, expected):
+    assert list(result.index.astype(str)) == list(expected.index.astype(str))
+    assert list(result.values) == list(expected.values)
+
+
+@pytest.mark.parametrize("durations", EDGE_DURATIONS)
+def test_batches_match_pd_cut_at_the_edges(durations):
+    histogram = DurationHistogram()
+    histogram.add_series(pd.Series(durations) / 60, batch_size=2)
+    assert_same_histogram(histogram.to_series(), pandas_histogram(durations))
+
+
+@pytest.mark.parametrize("durations", EDGE_DURATIONS)
+def test_bins_counted_elsewhere_match_pd_cut(durations):
+    # Conteos y duraciones en el límite inferior de cada rango, como los guardan los rollups
+    counts, edges = {}, {}
+    for seconds in durations:
+        minutes = seconds / 60
+        bucket = duration_bucket(minutes)
+        counts[bucket] = counts.get(bucket, 0) + 1
+        if minutes == bucket * BUCKET_MINUTES:
+            edges[bucket] = edges.get(bucket, 0) + 1
+
+    histogram = DurationHistogram()
+    histogram.add_bins(counts, edges)
+    assert_same_histogram(histogram.to_series(), pandas_histogram(durations))
+
+
+def test_empty_and_negative_durations():
+    histogram = DurationHistogram()
+    histogram.add([np.nan])
+    assert histogram.to_series().empty
+    histogram.add([-60.0, 7.0])
+    assert histogram.to_series().sum() == 1
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+import rollups
+from call_data import get_calls_data, parse_age, parse_call_start_time
+from hll import HyperLogLog, relative_error, user_register
+from synthetic_data import generate_documents, load_documents
+
+
+@pytest.fixture
+def calls_collection(database):
+    # Pocos usuarios, como en test_rollups: mongomock recorre la colección por cada bucket
+    collection = database["call_information"]
+    load_documents(collection, generate_documents(60, calls_per_user=4))
+    return collection
+
+
+def sketch_of(user_ids):
+    sketch = HyperLogLog()
+    for user_id in user_ids:
+        sketch.add(user_id)
+    return sketch
+
+
+@pytest.mark.parametrize("users", [50, 2000, 50000])
+def test_estimate_is_within_the_standard_error(users):
+    user_ids = [f"user-{index}" for index in range(users)]
+    # Cada usuario aparece varias veces, como en sus llamadas
+    estimate = sketch_of(user_ids * 3).count()
+    assert abs(estimate - users) / users < 3 * relative_error()
+
+
+def test_sparse_registers_rebuild_the_dense_sketch():
+    user_ids = [f"user-{index}" for index in range(3000)]
+    # Mismo cálculo que `rollups.refresh_rollups`: el mayor rango de cada registro
+    sparse = {}
+    for user_id in user_ids:
+        index, rank = user_register(user_id)
+        sparse[str(index)] = max(sparse.get(str(index), 0), rank)
+
+    sketch = HyperLogLog()
+    pairs = [(int(index), rank) for index, rank in sparse.items()]
+    # Registros repetidos con rango menor, como al mezclar varios buckets, no bajan el máximo
+    sketch.add_registers(pairs + [(index, 1) for index, _ in pairs])
+    assert len(sparse) < len(sketch.registers)
+    np.testing.assert_array_equal(sketch.registers, sketch_of(user_ids).registers)
+
+
+def test_merge_counts_the_union_once():
+    first = [f"user-{index}" for index in range(0, 6000)]
+    second = [f"user-{index}" for index in range(4000, 10000)]
+    merged = sketch_of(first)
+    merged.merge(sketch_of(second))
+    np.testing.assert_array_equal(merged.registers, sketch_of(first + second).registers)
+    assert abs(merged.count() - 10000) / 10000 < 3 * relative_error()
+
+
+def test_rollup_sketches_match_exact_distinct_users(calls_collection, database):
+    rollups.rebuild_rollups()
+    rollup_df = rollups.get_rollup_data()
+    assert rollups.has_user_sketches(rollup_df)
+    errors = rollups.check_distinct_counts(get_calls_data(), rollup_df)
+    assert errors and all(error < 3 * relative_error() for error in errors.values())
+
+    # Cada bucket guarda el mayor rango por registro de los usuarios con llamadas en él
+    expected = {}
+    for document in calls_collection.find():
+        index, rank = user_register(document["user_id"])
+        for call in document["calls"]:
+            call_start_time = parse_call_start_time(call.get("call_start_time"))
+            if call_start_time is None:
+                continue
+            key = rollups.rollup_key(
+                call_start_time, call.get("type_call"), document.get("user_gender"), parse_age(document.get("user_age"))
+            )
+            registers = expected.setdefault(tuple(key.values()), {})
+            registers[str(index)] = max(registers.get(str(index), 0), rank)
+    stored = {
+        tuple(bucket["_id"].get(column) for column in rollups.ROLLUP_KEYS): bucket[rollups.USERS_SKETCH]
+        for bucket in database[rollups.ROLLUP_COLLECTION].find({"_id.topic": None})
+    }
+    assert stored == expected
@@ -0,0 +1,12 @@
+import inbound
+from call_data import get_calls_data
+
+
+def test_distribution_styler_is_built_per_render(calls_collection):
+    table = inbound.get_calls_distribution(inbound.get_calls_distribution_counts(get_calls_data()))
+    first = inbound.get_calls_distribution_styler(table)
+    second = inbound.get_calls_distribution_styler(inbound.get_calls_distribution(inbound.get_calls_distribution_counts(get_calls_data())))
+    # La tabla viene del caché, pero cada render recibe su propio Styler
+    assert first is not second
+    first.set_caption("otra")
+    assert second.caption == "Distribución por género y rangos de edad"
@@ -0,0 +1,73 @@
+import pytest
+
+import call_data
+import indexes
+import topics
+from call_data import build_filters, get_calls_data
+from topics import get_data_by_topic
+
+
+class RecordingCollection:
+    """
+    Colección que registra las consultas que recibe y las pasa a la colección real.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.requests = []
+
+    def find(self, query, projection=None):
+        self.requests.append({"kind": "find", "query": query, "projection": projection})
+        return self.collection.find(query, projection)
+
+    def aggregate(self, pipeline):
+        self.requests.append({"kind": "aggregate", "pipeline": pipeline})
+        return self.collection.aggregate(pipeline)
+
+
+def shape_request(shape):
+    return {key: value for key, value in shape.items() if key not in ("name", "collection", "expect_index")}
+
+
+@pytest.mark.parametrize("columnar_fetch", [True, False])
+def test_shapes_are_the_queries_the_pages_send(calls_collection, monkeypatch, columnar_fetch):
+    monkeypatch.setattr(call_data, "COLUMNAR_FETCH", columnar_fetch)
+    monkeypatch.setattr(topics, "COLUMNAR_FETCH", columnar_fetch)
+    recording = RecordingCollection(calls_collection)
+    monkeypatch.setattr(call_data, "get_collection", lambda: recording)
+
+    shapes = {shape["name"]: shape for shape in indexes.query_shapes()}
+    for label, filters in indexes.sample_filters().items():
+        recording.requests.clear()
+        get_calls_data.__wrapped__(filters)
+        get_data_by_topic.__wrapped__(filters)
+        assert recording.requests == [
+            shape_request(shapes[f"llamadas ({label})"]),
+            shape_request(shapes[f"temas ({label})"]),
+        ]
+
+
+def test_every_background_query_has_a_shape():
+    names = {shape["name"] for shape in indexes.query_shapes()}
+    for name in [
+        "aggregate distribución de llamadas (sin filtros)",
+        "aggregate usuarios outbound (sin filtros)",
+        "aggregate cubo de temas (sin filtros)",
+        "actualización de rollups (ventana)",
+        "rollups guardados de la ventana",
+        "marca de agua del caché en disco",
+        "carga inicial de métricas en vivo",
+    ]:
+        assert name in names
+
+
+def test_rollup_refresh_shape_uses_the_lookback_day():
+    (shape,) = [shape for shape in indexes.query_shapes() if shape["name"] == "actualización de rollups (ventana)"]
+    start_day = shape["pipeline"][0]["$match"]["calls.call_start_time"]["$gte"]
+    assert len(start_day) == len("AAAA-MM-DD")
+
+
+def test_filtered_shapes_trim_calls_in_an_aggregate():
+    filters = build_filters(type_call="inbound")
+    assert call_data.calls_request(call_data.CALLS_QUERY, call_data.CALLS_PROJECTION, filters)["kind"] == "aggregate"
+    assert call_data.calls_request(call_data.CALLS_QUERY, call_data.CALLS_PROJECTION)["kind"] == "find"
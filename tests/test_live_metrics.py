@@ -0,0 +1,230 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo.errors import AutoReconnect, OperationFailure
+
+import live_metrics
+from rollups import DURATION_BINS
+
+
+def recent(hours):
+    # `call_start_time` de hace `hours` horas, dentro de la ventana en vivo
+    return (datetime.now(timezone.utc) - timedelta(hours=hours)).strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+
+def user_document(user_id, *start_times, type_call="inbound"):
+    return {
+        "_id": user_id,
+        "user_id": user_id,
+        "user_gender": "Female",
+        "user_age": 70,
+        "calls": [
+            {
+                "call_id": f"{user_id}-{i}",
+                "type_call": type_call,
+                "call_start_time": start_time,
+                "call_duration": {"original_total_time": 420.0, "bot": 60.0, "human": 60.0},
+            }
+            for i, start_time in enumerate(start_times)
+        ],
+    }
+
+
+def change(operation_type, document_id, document=None):
+    return {"operationType": operation_type, "documentKey": {"_id": document_id}, "fullDocument": document}
+
+
+def total_calls(counters):
+    return sum(bucket["calls"] for bucket in counters.bucket_documents() if bucket["_id"]["topic"] is None)
+
+
+@pytest.fixture
+def counters(monkeypatch):
+    counters = live_metrics.LiveCounters()
+    monkeypatch.setattr(live_metrics, "counters", counters)
+    monkeypatch.setattr(live_metrics, "_status", {"state": "stopped", "error": None, "last_event": None, "events": 0})
+    monkeypatch.setattr(live_metrics, "_frames", live_metrics.OrderedDict())
+    return counters
+
+
+def test_insert_update_replace_and_delete(counters):
+    document = user_document("user-1", recent(2))
+    live_metrics.apply_change(change("insert", "user-1", document))
+    assert total_calls(counters) == 1
+
+    # El mismo documento otra vez (carga inicial y evento) no cuenta doble
+    live_metrics.apply_change(change("update", "user-1", document))
+    assert total_calls(counters) == 1
+
+    live_metrics.apply_change(change("update", "user-1", user_document("user-1", recent(2), recent(1))))
+    assert total_calls(counters) == 2
+
+    live_metrics.apply_change(change("replace", "user-1", user_document("user-1", recent(3))))
+    assert total_calls(counters) == 1
+
+    live_metrics.apply_change(change("delete", "user-1"))
+    assert total_calls(counters) == 0
+    assert counters.documents == {}
+
+
+def test_update_without_full_document_is_ignored(counters):
+    live_metrics.apply_change(change("insert", "user-1", user_document("user-1", recent(2))))
+    version = counters.version
+    live_metrics.apply_change(change("update", "user-1", None))
+    assert counters.version == version
+    assert total_calls(counters) == 1
+
+
+def test_calls_outside_the_window_are_not_counted(counters):
+    old = recent(live_metrics.LIVE_WINDOW_HOURS + 2)
+    live_metrics.apply_change(change("insert", "user-1", user_document("user-1", old, "sin fecha", recent(1))))
+    assert total_calls(counters) == 1
+
+
+def test_window_start_is_in_utc():
+    mexico = datetime(2024, 3, 11, 18, 30, tzinfo=timezone(timedelta(hours=-6)))
+    expected = datetime(2024, 3, 12, 0, 30) - timedelta(hours=live_metrics.LIVE_WINDOW_HOURS)
+    assert live_metrics.window_start(mexico) == expected.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def test_prune_drops_expired_buckets(counters):
+    live_metrics.apply_change(change("insert", "user-1", user_document("user-1", recent(5), recent(1))))
+    live_metrics.apply_change(change("insert", "user-2", user_document("user-2", recent(5))))
+    assert total_calls(counters) == 3
+
+    counters.prune(live_metrics.window_start(datetime.now(timezone.utc) + timedelta(hours=live_metrics.LIVE_WINDOW_HOURS - 3)))
+    assert total_calls(counters) == 1
+    assert list(counters.documents) == ["user-1"]
+
+    # La llamada que queda se resta bien cuando el documento se borra
+    live_metrics.apply_change(change("delete", "user-1"))
+    assert total_calls(counters) == 0
+
+
+def test_bucket_documents_include_duration_bins(counters):
+    live_metrics.apply_change(change("insert", "user-1", user_document("user-1", recent(1), recent(1))))
+    (bucket,) = [bucket for bucket in counters.bucket_documents() if bucket["_id"]["topic"] is None]
+    assert sum(bucket[DURATION_BINS].values()) == 2
+
+
+def test_live_data_is_rebuilt_only_when_the_counters_change(counters):
+    live_metrics.apply_change(change("insert", "user-1", user_document("user-1", recent(1))))
+    first = live_metrics.get_live_data()
+    assert live_metrics.get_live_data()["calls"].sum() == first["calls"].sum() == 1
+    assert len(live_metrics._frames) == 1
+
+    live_metrics.apply_change(change("insert", "user-2", user_document("user-2", recent(1))))
+    assert live_metrics.get_live_data()["calls"].sum() == 2
+    # Una versión nueva reemplaza a la anterior en lugar de agregar otra entrada
+    assert len(live_metrics._frames) == 1
+
+
+class FakeStream:
+    def __init__(self, changes, error=None):
+        self.changes = list(changes)
+        self.error = error
+        self.resume_token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def alive(self):
+        return bool(self.changes) or self.error is not None
+
+    def try_next(self):
+        if not self.changes:
+            error, self.error = self.error, None
+            raise error
+        change = self.changes.pop(0)
+        self.resume_token = {"_data": change["documentKey"]["_id"]}
+        return change
+
+
+class FakeCollection:
+    """
+    Colección con un change stream guionizado: cada llamada a `watch` toma el
+    siguiente elemento de `streams`, que es un FakeStream o la excepción al abrirlo.
+    """
+
+    def __init__(self, streams, window_documents):
+        self.streams = list(streams)
+        self.window_documents = window_documents
+        self.resume_tokens = []
+        self.loads = 0
+
+    def watch(self, pipeline, full_document=None, resume_after=None, max_await_time_ms=None):
+        self.resume_tokens.append(resume_after)
+        stream = self.streams.pop(0)
+        if isinstance(stream, Exception):
+            raise stream
+        return stream
+
+    def aggregate(self, pipeline):
+        self.loads += 1
+        return [dict(document) for document in self.window_documents]
+
+
+def test_watch_resumes_after_errors(counters, monkeypatch):
+    window = [user_document("user-1", recent(2))]
+    collection = FakeCollection([
+        FakeStream([change("insert", "user-2", user_document("user-2", recent(1)))], error=AutoReconnect("red")),
+        # Se reanuda desde el último evento; el oplog ya lo descartó
+        OperationFailure("historial perdido", code=live_metrics.CHANGE_STREAM_HISTORY_LOST),
+        FakeStream([]),
+        OperationFailure("sin replica set", code=live_metrics.CHANGE_STREAM_UNSUPPORTED),
+    ], window)
+    monkeypatch.setattr(live_metrics, "get_collection", lambda: collection)
+    monkeypatch.setattr(live_metrics, "LIVE_RETRY_SECONDS", 0)
+
+    live_metrics.watch_calls()
+
+    assert collection.resume_tokens == [None, {"_data": "user-2"}, None, None]
+    # Carga inicial y recarga después de perder el punto de reanudación
+    assert collection.loads == 2
+    # La recarga reinicia los contadores: el usuario 2 no está en la ventana falsa
+    assert total_calls(counters) == 1
+    assert live_metrics.get_live_status()["state"] == "unsupported"
+
+
+@pytest.mark.replica_set
+def test_watch_applies_inserted_calls(calls_collection, counters, monkeypatch):
+    monkeypatch.setattr(live_metrics, "_watch_thread", None)
+    live_metrics.start_live_metrics()
+    deadline = time.monotonic() + 30
+    while live_metrics.get_live_status()["state"] != "live" and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert live_metrics.get_live_status()["state"] == "live"
+
+    before = total_calls(counters)
+    calls_collection.insert_one(user_document("live-user", recent(1)))
+    while total_calls(counters) == before and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert total_calls(counters) == before + 1
+
+
+def test_watch_skips_a_change_that_cannot_be_applied(counters, monkeypatch):
+    bad_document = {**user_document("user-2", recent(1)), "calls": [None]}
+    collection = FakeCollection([
+        FakeStream([change("insert", "user-2", bad_document)]),
+        FakeStream([change("insert", "user-3", user_document("user-3", recent(1)))]),
+        OperationFailure("sin replica set", code=live_metrics.CHANGE_STREAM_UNSUPPORTED),
+    ], [user_document("user-1", recent(2))])
+    monkeypatch.setattr(live_metrics, "get_collection", lambda: collection)
+    monkeypatch.setattr(live_metrics, "LIVE_RETRY_SECONDS", 0)
+    errors = []
+    monkeypatch.setattr(live_metrics, "record_error", lambda name, error: errors.append(
+        (type(error), live_metrics.get_live_status()["state"])
+    ))
+
+    live_metrics.watch_calls()
+
+    # El hilo no termina con el error: marca el estado y reanuda después del cambio que falló
+    assert collection.resume_tokens == [None, {"_data": "user-2"}, {"_data": "user-3"}]
+    assert errors == [(AttributeError, "error")]
+    assert collection.loads == 1
+    assert total_calls(counters) == 2
@@ -0,0 +1,70 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pymongo
+from pymongo.errors import ExecutionTimeout
+
+import page_executor
+
+
+def unreachable_query():
+    # Sin el límite de la página, pymongo esperaría 30 s a encontrar el servidor
+    client = pymongo.MongoClient("mongodb://127.0.0.1:9", serverSelectionTimeoutMS=30000, connect=False)
+    try:
+        return client.admin.command("ping")
+    finally:
+        client.close()
+
+
+def test_queries_run_with_the_remaining_time():
+    start = time.monotonic()
+    results, failed = page_executor.run_queries({"ping": unreachable_query}, timeout=0.5)
+    # pymongo corta la consulta con el tiempo que le quedaba a la página
+    assert time.monotonic() - start < 5
+    assert isinstance(failed["ping"], TimeoutError)
+
+
+def test_server_timeouts_are_reported_as_timeouts():
+    def slow_query():
+        raise ExecutionTimeout("operation exceeded time limit", code=50)
+
+    results, failed = page_executor.run_queries({"slow": slow_query}, timeout=1)
+    assert results == {}
+    assert isinstance(failed["slow"], TimeoutError)
+    assert str(failed["slow"]) == "sin respuesta después de 1 s"
+    assert isinstance(failed["slow"].__cause__, ExecutionTimeout)
+
+
+def test_queued_queries_past_the_deadline_do_not_run(monkeypatch):
+    monkeypatch.setattr(page_executor, "_executor", ThreadPoolExecutor(max_workers=1))
+    started = threading.Event()
+    ran = []
+
+    def slow_query():
+        started.set()
+        time.sleep(0.3)
+
+    results, failed = page_executor.run_queries({"slow": slow_query, "queued": lambda: ran.append(True)}, timeout=0.1)
+    page_executor._executor.shutdown(wait=True)
+    assert started.is_set()
+    assert set(failed) == {"slow", "queued"}
+    assert ran == []
+
+
+def test_other_errors_are_returned_as_raised():
+    error = ValueError("sin conexión")
+
+    def broken_query():
+        raise error
+
+    results, failed = page_executor.run_queries({"broken": broken_query}, timeout=1)
+    assert failed == {"broken": error}
+
+
+def test_submitted_queries_run_with_the_query_timeout():
+    start = time.monotonic()
+    future = page_executor.submit(unreachable_query, timeout=0.5)
+    error = future.exception(timeout=10)
+    assert error.timeout
+    assert time.monotonic() - start < 5
@@ -0,0 +1,32 @@
+import sys
+import threading
+import types
+import page_registry
+
+SLOW_MODULE = """
+import time
+import slow_page_gate
+slow_page_gate.started.set()
+time.sleep(0.2)
+READY = True
+"""
+
+
+def test_concurrent_loads_wait_for_the_import(tmp_path, monkeypatch):
+    (tmp_path / "slow_page.py").write_text(SLOW_MODULE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setitem(page_registry.PAGES, "Página lenta", "slow_page")
+    monkeypatch.delitem(sys.modules, "slow_page", raising=False)
+    # El módulo avisa cuando ya está en sys.modules pero todavía no termina de ejecutarse
+    gate = types.ModuleType("slow_page_gate")
+    gate.started = threading.Event()
+    monkeypatch.setitem(sys.modules, "slow_page_gate", gate)
+
+    # Otro hilo (por ejemplo una consulta de la página) empieza a importar el módulo
+    importer = threading.Thread(target=__import__, args=("slow_page",))
+    importer.start()
+    assert gate.started.wait(timeout=5)
+    ready = getattr(page_registry.load_page_module("Página lenta"), "READY", False)
+    importer.join()
+    assert ready
+    sys.modules.pop("slow_page", None)
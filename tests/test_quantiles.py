@@ -0,0 +1,55 @@
+from collections import Counter
+import numpy as np
+import pytest
+from quantiles import DurationSketch, duration_key, QUANTILES, QUANTILE_ACCURACY
+
+
+def durations(size, seed=0):
+    # Duraciones en segundos con cola larga, y algunas llamadas de 0 segundos
+    rng = np.random.default_rng(seed)
+    values = rng.lognormal(mean=5, sigma=1.2, size=size)
+    values[rng.random(size) < 0.02] = 0
+    return values
+
+
+def sketch_of(values):
+    sketch = DurationSketch()
+    sketch.add(values)
+    return sketch
+
+
+@pytest.mark.parametrize("size", [1, 10, 1000, 100000])
+def test_quantiles_are_within_the_relative_error(size):
+    values = durations(size)
+    sketch = sketch_of(values)
+    for q in [0, 0.01, *QUANTILES.values(), 1]:
+        # El sketch responde con el valor en la posición del cuantil, sin interpolar
+        expected = np.quantile(values, q, method="lower")
+        assert sketch.quantile(q) == pytest.approx(expected, rel=QUANTILE_ACCURACY)
+
+
+def test_empty_values_are_ignored():
+    sketch = sketch_of([np.nan, 30.0, np.nan])
+    assert sketch.count() == 1
+    assert np.isnan(DurationSketch().quantile(0.5))
+
+
+def test_merge_equals_one_sketch_of_all_values():
+    first, second = durations(5000, seed=1), durations(3000, seed=2)
+    merged = sketch_of(first)
+    merged.merge(sketch_of(second))
+    combined = sketch_of(np.concatenate([first, second]))
+    assert (merged.counts, merged.zero_count) == (combined.counts, combined.zero_count)
+    for q in QUANTILES.values():
+        assert merged.quantile(q) == combined.quantile(q)
+
+
+def test_add_bins_matches_the_rollup_keys():
+    values = durations(5000)
+    # Rangos como los guarda `rollups.add_call_buckets`: {rango: llamadas}, en varios buckets
+    bins = Counter(duration_key(value) for value in values)
+    sketch = DurationSketch()
+    for bucket in [list(bins.items())[::2], list(bins.items())[1::2]]:
+        sketch.add_bins(bucket)
+    direct = sketch_of(values)
+    assert (sketch.counts, sketch.zero_count) == (direct.counts, direct.zero_count)
@@ -0,0 +1,168 @@
+import logging
+from datetime import datetime, timedelta, timezone
+import pytest
+import rollups
+from call_data import get_calls_data, LOCAL_TIMEZONE
+from quantiles import QUANTILE_ACCURACY
+from synthetic_data import generate_documents, load_documents
+
+
+@pytest.fixture
+def calls_collection(database):
+    # Menos usuarios que en conftest: mongomock busca cada bucket recorriendo la colección
+    collection = database["call_information"]
+    load_documents(collection, generate_documents(40, calls_per_user=4, malformed_timestamp_rate=0.05))
+    return collection
+
+
+def stored_buckets(database):
+    return sorted(
+        database[rollups.ROLLUP_COLLECTION].find(),
+        key=lambda bucket: tuple(str(bucket["_id"].get(column)) for column in rollups.ROLLUP_KEYS)
+    )
+
+
+def push_call(collection, call_start_time, user_id="user-0", type_call="inbound"):
+    collection.update_one({"user_id": user_id}, {"$push": {"calls": {
+        "call_id": f"late-{call_start_time}",
+        "type_call": type_call,
+        "call_start_time": call_start_time,
+        "call_duration": {"original_total_time": 120.0, "bot": 60.0, "human": 60.0},
+    }}})
+
+
+def rollup_calls(database):
+    return sum(bucket.get("calls", 0) for bucket in stored_buckets(database) if bucket["_id"]["topic"] is None)
+
+
+def test_rollups_count_every_valid_call(calls_collection, database):
+    rollups.rebuild_rollups()
+    calls_df = get_calls_data()
+    assert rollup_calls(database) == int(calls_df["call_start_time"].notna().sum())
+
+
+def test_refresh_is_idempotent(calls_collection, database):
+    rollups.rebuild_rollups()
+    before = stored_buckets(database)
+    rollups.refresh_rollups()
+    rollups.refresh_rollups()
+    assert stored_buckets(database) == before
+
+
+def test_refresh_repairs_a_partial_write(calls_collection, database):
+    rollups.rebuild_rollups()
+    before = stored_buckets(database)
+    watermark = database[rollups.STATE_COLLECTION].find_one({"_id": rollups.ROLLUP_STATE_ID})["watermark"]
+    # Un bucket de la ventana sumado dos veces, como tras un reintento con $inc
+    day = rollups.lookback_start(watermark)
+    bucket = database[rollups.ROLLUP_COLLECTION].find_one({"_id.day": {"$gte": day}, "_id.topic": None})
+    database[rollups.ROLLUP_COLLECTION].update_one({"_id": bucket["_id"]}, {"$inc": {"calls": bucket["calls"]}})
+    rollups.refresh_rollups()
+    assert stored_buckets(database) == before
+
+
+def test_refresh_includes_late_and_equal_timestamp_calls(calls_collection, database):
+    rollups.rebuild_rollups()
+    total = rollup_calls(database)
+    watermark = database[rollups.STATE_COLLECTION].find_one({"_id": rollups.ROLLUP_STATE_ID})["watermark"]
+    # Misma fecha que la marca de agua y una llamada anterior que se guarda después
+    push_call(calls_collection, watermark)
+    push_call(calls_collection, watermark[:10] + "T00:00:01.000000")
+    assert rollups.refresh_rollups() > 0
+    assert rollup_calls(database) == total + 2
+
+
+def test_malformed_timestamps_do_not_move_the_watermark(calls_collection, database):
+    rollups.rebuild_rollups()
+    push_call(calls_collection, "sin fecha")
+    rollups.refresh_rollups()
+    watermark = database[rollups.STATE_COLLECTION].find_one({"_id": rollups.ROLLUP_STATE_ID})["watermark"]
+    assert watermark.startswith("2024-") or watermark.startswith("2025-")
+    push_call(calls_collection, "2025-06-01T10:00:00")
+    rollups.refresh_rollups()
+    watermark = database[rollups.STATE_COLLECTION].find_one({"_id": rollups.ROLLUP_STATE_ID})["watermark"]
+    assert watermark == "2025-06-01T10:00:00"
+
+
+def test_duration_histograms_match_pandas(calls_collection, database):
+    import inbound
+    import outbound
+
+    rollups.rebuild_rollups()
+    # Mismo rango en el límite de un intervalo y como duración máxima
+    push_call(calls_collection, "2024-07-01T10:00:00")
+    calls_collection.update_one({"user_id": "user-1"}, {"$push": {"calls": {
+        "call_id": "edge", "type_call": "outbound", "call_start_time": "2024-07-01T11:00:00",
+        "call_duration": {"original_total_time": 60 * 60.0, "bot": 0, "human": 0},
+    }}})
+    rollups.rebuild_rollups()
+    rollup_df = rollups.get_rollup_data()
+    calls_df = get_calls_data()
+    # Los rollups solo incluyen las llamadas con fecha válida
+    valid = calls_df[calls_df["call_start_time"].notna()]
+    assert rollups.has_duration_bins(rollup_df, "inbound")
+    assert rollups.rollup_inbound_calls_by_duration(rollup_df).equals(inbound.get_inbound_calls_by_duration(valid))
+    assert rollups.rollup_outbound_calls_by_duration(rollup_df).equals(outbound.get_outbound_calls_by_duration(valid))
+
+
+def test_duration_views_by_age_and_hour_match_pandas(calls_collection, database):
+    import duration_calls
+
+    # Edades en el límite de los rangos y fuera de ellos
+    calls_collection.update_one({"user_id": "user-0"}, {"$set": {"user_age": "60"}})
+    calls_collection.update_one({"user_id": "user-1"}, {"$set": {"user_age": "93"}})
+    rollups.rebuild_rollups()
+    rollup_df = rollups.get_rollup_data()
+    calls_df = get_calls_data()
+    valid = calls_df[calls_df["call_start_time"].notna()]
+
+    views = [
+        (rollups.rollup_average_call_duration_by_age, duration_calls.get_average_call_duration_by_age),
+        (rollups.rollup_chatbot_vs_human_percentage_by_age, duration_calls.get_chatbot_vs_human_percentage_by_age),
+        (rollups.rollup_call_duration_quantiles_by_age, duration_calls.get_call_duration_quantiles_by_age),
+    ]
+    for approximate, exact in views:
+        expected = exact(valid)
+        # Solo rangos con etiqueta: ni "nan" ni "(60.0, 65.0]" por las edades fuera de rango
+        assert len(expected) and set(expected.index.astype(str)) <= set(rollups.AGE_LABELS)
+        assert list(approximate(rollup_df).index.astype(str)) == list(expected.index.astype(str))
+
+    # Las horas sin llamadas quedan sin cuantiles en lugar de 0 minutos
+    exact = duration_calls.get_call_duration_quantiles_by_hour_of_day(valid)
+    hours = set(valid.loc[valid["duration"].notna(), "call_start_time"].dt.tz_convert(LOCAL_TIMEZONE).dt.hour)
+    assert list(exact.index) == list(range(24))
+    assert (exact.notna().all(axis=1) == exact.index.isin(hours)).all()
+    assert rollups.rollup_call_duration_quantiles_by_hour_of_day(rollup_df).isna().equals(exact.isna())
+
+    errors = rollups.check_duration_quantiles(valid, rollup_df)
+    assert max(errors.values()) <= QUANTILE_ACCURACY * 1.01
+
+
+def test_future_dated_calls_do_not_move_the_watermark(calls_collection, database, caplog):
+    rollups.rebuild_rollups()
+    total = rollup_calls(database)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    push_call(calls_collection, (now + timedelta(days=365)).isoformat())
+    with caplog.at_level(logging.WARNING, logger="kuidalos.errors"):
+        rollups.refresh_rollups()
+    assert "1 llamadas con fecha futura omitidas" in caplog.text
+    state = database[rollups.STATE_COLLECTION].find_one({"_id": rollups.ROLLUP_STATE_ID})
+    assert datetime.fromisoformat(state["watermark"]) <= datetime.now(timezone.utc).replace(tzinfo=None)
+    assert rollup_calls(database) == total
+
+    # Las llamadas nuevas siguen entrando en los rollups
+    push_call(calls_collection, (now - timedelta(hours=1)).isoformat())
+    rollups.refresh_rollups()
+    assert rollup_calls(database) == total + 1
+
+
+def test_a_watermark_in_the_future_is_pulled_back(calls_collection, database):
+    rollups.rebuild_rollups()
+    total = rollup_calls(database)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    database[rollups.STATE_COLLECTION].update_one(
+        {"_id": rollups.ROLLUP_STATE_ID}, {"$set": {"watermark": (now + timedelta(days=365)).isoformat()}}
+    )
+    push_call(calls_collection, (now - timedelta(hours=1)).isoformat())
+    rollups.refresh_rollups()
+    assert rollup_calls(database) == total + 1
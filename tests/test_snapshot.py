@@ -0,0 +1,87 @@
+import os
+import threading
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+import snapshot
+from call_data import build_filters, filter_calls, get_calls_data
+
+FILTERS = [
+    None,
+    build_filters(type_call="inbound"),
+    build_filters(user_gender="Female", age_range=(65, 80)),
+    build_filters(date_range=(date(2024, 3, 1), date(2024, 6, 30))),
+]
+
+
+@pytest.fixture
+def snapshot_dir(calls_collection, tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", str(tmp_path))
+    snapshot.export_snapshot(str(tmp_path))
+    return tmp_path
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_filtered_reads_match_pandas(snapshot_dir, filters):
+    months = snapshot.list_snapshot_months(str(snapshot_dir))
+    expected = filter_calls(snapshot.read_dataset("calls", months, str(snapshot_dir)), filters)
+    result = snapshot.read_dataset("calls", months, str(snapshot_dir), filters=filters)
+    assert list(result["call_id"]) == list(expected["call_id"])
+    assert sorted(result["call_id"]) == sorted(filter_calls(get_calls_data(), filters)["call_id"])
+
+
+def test_reexport_removes_stale_months(snapshot_dir, calls_collection):
+    months = snapshot.list_snapshot_months(str(snapshot_dir))
+    # Un mes que solo tenía llamadas que después se borraron
+    calls_collection.update_many({}, {"$pull": {"calls": {"call_start_time": {"$regex": f"^{months[0]}"}}}})
+    manifest = snapshot.export_snapshot(str(snapshot_dir))
+    assert months[0] not in manifest["months"]
+    for dataset in ["calls", "topics"]:
+        assert {path.stem for path in (snapshot_dir / dataset).glob("*.arrow")} <= set(manifest["months"])
+        assert not (snapshot_dir / dataset / f"{months[0]}.arrow").exists()
+
+
+def test_concurrent_exports_do_not_share_temp_files(snapshot_dir, monkeypatch):
+    # Las dos exportaciones llegan a cada reemplazo antes de que alguna lo haga
+    barrier = threading.Barrier(2, timeout=10)
+    replace = os.replace
+
+    def paired_replace(source, target):
+        barrier.wait()
+        replace(source, target)
+
+    monkeypatch.setattr(snapshot.os, "replace", paired_replace)
+    # mongomock no es seguro entre hilos (recorre la proyección mientras la modifica):
+    # las lecturas de las dos exportaciones se hacen de una en una
+    read_lock = threading.Lock()
+    collection = snapshot.get_collection()
+
+    def one_at_a_time(read):
+        def locked_read(*args, **kwargs):
+            with read_lock:
+                return list(read(*args, **kwargs))
+        return locked_read
+
+    monkeypatch.setattr(snapshot, "get_collection", lambda **options: SimpleNamespace(
+        find=one_at_a_time(collection.find), aggregate=one_at_a_time(collection.aggregate)
+    ))
+    errors = []
+
+    def export():
+        try:
+            snapshot.export_snapshot(str(snapshot_dir))
+        except Exception as e:
+            errors.append(e)
+            barrier.abort()
+
+    threads = [threading.Thread(target=export) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    months = snapshot.list_snapshot_months(str(snapshot_dir))
+    assert len(snapshot.read_dataset("calls", months, str(snapshot_dir))) == len(get_calls_data())
+    assert list(snapshot_dir.rglob(f"*{snapshot.TEMP_SUFFIX}")) == []
@@ -0,0 +1,37 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from call_data import build_filters
+from topics import get_data_by_topic, get_percentage_time_by_topic, get_topic_cube, CUBE_KEYS, CUBE_MEASURES
+
+FILTERS = [
+    None,
+    build_filters(type_call="inbound"),
+    build_filters(user_gender="Female", age_range=(65, 80)),
+    build_filters(date_range=(date(2024, 3, 1), date(2024, 6, 30))),
+]
+
+
+def cube_totals(df, month):
+    # Medidas por las claves del cubo, con las claves vacías como un grupo más
+    return df.assign(month=month).groupby(CUBE_KEYS, dropna=False)[CUBE_MEASURES].sum().sort_index()
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_topic_cube_matches_the_topic_frame(calls_collection, filters):
+    topic_df = get_data_by_topic(filters)
+    cube = get_topic_cube(topic_df)
+    assert len(cube) < len(topic_df)
+    expected = cube_totals(topic_df.assign(calls=1), topic_df["call_start_time"].dt.strftime("%Y-%m"))
+    pd.testing.assert_frame_equal(cube_totals(cube, cube["month"]), expected, check_dtype=False)
+
+    grouped = topic_df.groupby("topic")[["bot_time", "total_time"]].sum()
+    percentages = get_percentage_time_by_topic(cube)
+    pd.testing.assert_series_equal(
+        percentages["bot_percentage"].sort_index(),
+        (grouped["bot_time"] / grouped["total_time"] * 100).sort_index(),
+        check_names=False,
+    )
+
@@ -1,56 +1,222 @@
 import pandas as pd
 import numpy as np
 import streamlit as st
-from datetime import datetime
-from pymongo import MongoClient
-import matplotlib.pyplot as plt
-
-# Conectar a MongoDB
-MONGODB_URI = st.secrets["MONGODB_URI"]
-DATABASE_NAME = st.secrets["MONGODB_DATABASE"]
-client = MongoClient(MONGODB_URI)
-db = client[DATABASE_NAME]
-collection = db["call_information"]
-
-def get_data_by_topic():
-    calls = collection.find(
-        {"calls.analysis.times_by_subject": {"$exists": True}},
-        {"user_age": 1, "user_gender": 1, "calls.analysis.times_by_subject": 1}
-    )
+from itertools import chain
+import altair as alt
+from cache import cached
+from columnar import ColumnBuilder
+from call_data import parse_call_start_times, calls_request, run_request, call_field, filter_calls, COLUMNAR_FETCH
+
+# Consulta y proyección de la extracción de tiempos por tema
+TOPICS_QUERY = {"calls.analysis.times_by_subject": {"$exists": True}}
+TOPICS_PROJECTION = {
+    "_id": 0,
+    "user_age": 1,
+    "user_gender": 1,
+    "calls.type_call": 1,
+    "calls.call_start_time": 1,
+    "calls.analysis.times_by_subject": 1
+}
+
+
+def subject_field(path, default=0):
+    # Por llamada, la lista con `path` de cada tema de `times_by_subject` (k: tema, v: tiempos)
+    return {"$map": {
+        "input": {"$objectToArray": {"$ifNull": ["$$call.analysis.times_by_subject", {}]}},
+        "as": "subject",
+        "in": {"$ifNull": [f"$$subject.{path}", default]},
+    }}
+
+
+# Columnas de temas que MongoDB entrega por usuario con COLUMNAR_FETCH: por cada
+# llamada, su tipo y fecha, y una lista con cada tema y sus tiempos
+TOPIC_FIELDS = {
+    "type_call": call_field("type_call"),
+    "call_start_time": call_field("call_start_time"),
+    "topic": subject_field("k", None),
+    "bot_time": subject_field("v.bot"),
+    "persona_time": subject_field("v.persona"),
+}
+
+
+def older_user_age(record):
+    # Edad del usuario si tiene 60 años o más; los temas solo se analizan para ellos
+    user_age = record.get("user_age")
+    if user_age and user_age.isdigit() and int(user_age) >= 60:
+        return int(user_age)
+    return None
+
+
+def assemble_topic_frame(columns):
+    """
+    Arma el DataFrame de temas a partir de las columnas como arreglos de numpy,
+    sin los temas en los que no se habló (tiempo total de 0).
+    """
+    total_time = columns["bot_time"] + columns["persona_time"]
+    spoken = total_time > 0
+    if not spoken.any():
+        return pd.DataFrame()
+
+    call_start_time, _ = parse_call_start_times(columns["call_start_time"][spoken])
+    return pd.DataFrame({
+        "topic": columns["topic"][spoken],
+        "user_age": columns["user_age"][spoken],
+        "user_gender": columns["user_gender"][spoken],
+        "bot_time": columns["bot_time"][spoken],
+        "persona_time": columns["persona_time"][spoken],
+        "total_time": total_time[spoken],
+        "type_call": columns["type_call"][spoken],
+        "call_start_time": call_start_time,
+    }, copy=False)
+
 
-    data = []
-    for record in calls:
-        user_age = record.get("user_age")
+def build_topic_frame(records):
+    """
+    Aplana los documentos de `call_information` en un DataFrame con una fila por
+    (llamada, tema) para usuarios de 60 años o más.
+    """
+    data = ColumnBuilder({
+        "topic": "code",
+        "user_age": "int",
+        "user_gender": "code",
+        "bot_time": "float",
+        "persona_time": "float",
+        "type_call": "code",
+        "call_start_time": "object",
+    })
+    add_topic = data.appender("topic")
+    add_user_age = data.appender("user_age")
+    add_user_gender = data.appender("user_gender")
+    add_bot_time = data.appender("bot_time")
+    add_persona_time = data.appender("persona_time")
+    add_type_call = data.appender("type_call")
+    add_call_start_time = data.appender("call_start_time")
+
+    for record in records:
+        user_age = older_user_age(record)
+        if user_age is None:
+            continue
         user_gender = record.get("user_gender")
         for call in record.get("calls", []):
             times_by_subject = call.get("analysis", {}).get("times_by_subject", {})
             for topic, times in times_by_subject.items():
-                bot_time = times.get("bot", 0)
-                persona_time = times.get("persona", 0)
-                total_time = bot_time + persona_time
-                if user_age and user_age.isdigit() and int(user_age) >= 60 and total_time > 0:
-                    data.append({
-                        "topic": topic,
-                        "user_age": int(user_age),
-                        "user_gender": user_gender,
-                        "bot_time": bot_time,
-                        "persona_time": persona_time,
-                        "total_time": total_time
-                    })
+                add_topic(topic)
+                add_user_age(user_age)
+                add_user_gender(user_gender)
+                add_bot_time(times.get("bot", 0))
+                add_persona_time(times.get("persona", 0))
+                add_type_call(call.get("type_call"))
+                add_call_start_time(call.get("call_start_time"))
+
+    return assemble_topic_frame({column: data.column(column) for column in data.kinds})
+
+
+def build_topic_frame_from_columns(records):
+    """
+    Igual que `build_topic_frame`, pero con documentos que traen las columnas de
+    TOPIC_FIELDS. Las listas de temas de cada usuario se concatenan y los datos
+    de la llamada y del usuario se repiten por tema con numpy, sin recorrer cada
+    llamada en Python.
+    """
+    users = ColumnBuilder({"user_age": "int", "user_gender": "code", "calls": "int"})
+    calls = ColumnBuilder({"type_call": "code", "call_start_time": "object", "topics": "int"})
+    topics = ColumnBuilder({"topic": "code", "bot_time": "float", "persona_time": "float"})
+    add_user_age = users.appender("user_age")
+    add_user_gender = users.appender("user_gender")
+    add_calls = users.appender("calls")
+    extend_type_call = calls.extender("type_call")
+    extend_call_start_time = calls.extender("call_start_time")
+    extend_topics = calls.extender("topics")
+    extend_topic = topics.extender("topic")
+    extend_bot_time = topics.extender("bot_time")
+    extend_persona_time = topics.extender("persona_time")
+
+    for record in records:
+        user_age = older_user_age(record)
+        if user_age is None:
+            continue
+        add_user_age(user_age)
+        add_user_gender(record.get("user_gender"))
+        add_calls(len(record["type_call"]))
+        extend_type_call(record["type_call"])
+        extend_call_start_time(record["call_start_time"])
+        extend_topics(map(len, record["topic"]))
+        extend_topic(chain.from_iterable(record["topic"]))
+        extend_bot_time(chain.from_iterable(record["bot_time"]))
+        extend_persona_time(chain.from_iterable(record["persona_time"]))
+
+    # Posición de la llamada de cada tema y del usuario de cada llamada
+    call_index = np.repeat(np.arange(len(calls)), calls.column("topics"))
+    user_index = np.repeat(np.arange(len(users)), users.column("calls"))[call_index]
+    return assemble_topic_frame({
+        "topic": topics.column("topic"),
+        "user_age": users.column("user_age")[user_index],
+        "user_gender": users.column("user_gender")[user_index],
+        "bot_time": topics.column("bot_time"),
+        "persona_time": topics.column("persona_time"),
+        "type_call": calls.column("type_call")[call_index],
+        "call_start_time": calls.column("call_start_time")[call_index],
+    })
+
+
+def topic_data_request(filters=None):
+    # Consulta de `get_data_by_topic`
+    return calls_request(TOPICS_QUERY, TOPICS_PROJECTION, filters, TOPIC_FIELDS if COLUMNAR_FETCH else None)
+
+
+@cached
+def get_data_by_topic(filters=None):
+    records = run_request(topic_data_request(filters))
+    if COLUMNAR_FETCH:
+        return filter_calls(build_topic_frame_from_columns(records), filters)
+    return filter_calls(build_topic_frame(records), filters)
 
-    return pd.DataFrame(data)
 
+# Claves y medidas del cubo de temas: sumas de tiempos y número de (llamada, tema)
+CUBE_KEYS = ["topic", "user_age", "user_gender", "month"]
+CUBE_MEASURES = ["bot_time", "persona_time", "total_time", "calls"]
 
-def get_percentage_time_by_topic(df):
+
+def cube_month(call_start_time):
+    # Mes en UTC, el mismo de las particiones de los snapshots (vacío si la fecha no es válida).
+    # `to_period` es mucho más rápido que `strftime` con muchas fechas.
+    months = call_start_time.dt.tz_localize(None).dt.to_period("M")
+    return months.astype(str).where(months.notna())
+
+
+def sum_topic_cube(df):
+    """
+    Suma las medidas por las claves del cubo. Las claves vacías (género o mes)
+    se conservan para que los totales por tema no cambien.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=CUBE_KEYS + CUBE_MEASURES)
+    return df.groupby(CUBE_KEYS, dropna=False)[CUBE_MEASURES].sum().reset_index()
+
+
+@cached
+def get_topic_cube(df):
+    """
+    Cubo de tiempos por (tema, edad, género, mes) a partir del DataFrame de
+    temas. Se arma una sola vez y todas las métricas de temas lo agrupan en
+    lugar de agrupar una fila por (llamada, tema).
+    """
+    if df.empty:
+        return sum_topic_cube(df)
+    return sum_topic_cube(df.assign(month=cube_month(df["call_start_time"]), calls=1))
+
+
+@cached
+def get_percentage_time_by_topic(topic_cube):
     """
     Calcula el porcentaje de tiempo promedio del chatbot y del cliente por tema,
     asegurando que el tema 'Otros' se muestre al final.
     """
-    if df.empty:
+    if topic_cube.empty:
         return pd.DataFrame(columns=["bot_percentage", "persona_percentage"])
 
     # Agrupación por tema y cálculo de totales
-    grouped = df.groupby("topic")[["bot_time", "persona_time"]].sum()
+    grouped = topic_cube.groupby("topic")[["bot_time", "persona_time"]].sum()
     grouped["total_time"] = grouped["bot_time"] + grouped["persona_time"]
 
     # Cálculo de porcentajes
@@ -67,44 +233,58 @@ def get_percentage_time_by_topic(df):
     return grouped[["bot_percentage", "persona_percentage"]]
 
 
-def generate_pie_chart_by_topic(df):
+@cached
+def get_pie_chart_spec_by_topic(topic_cube):
+    """
+    Especificación Vega-Lite de la gráfica de torta (arco) con el porcentaje de
+    tiempo total por tema. Es un diccionario pequeño que se guarda en el caché
+    por versión de los datos, en lugar de dibujar una imagen en cada recarga.
+    """
+    # Agrupar datos por tema y calcular el tiempo total por tema
+    grouped = topic_cube.groupby("topic")["total_time"].sum()
+    data = pd.DataFrame({
+        "topic": grouped.index,
+        "total_time": grouped.values,
+        "label": [f"{percentage:.1f}%" for percentage in grouped.values / grouped.sum() * 100],
+    })
+
+    base = alt.Chart(data).encode(
+        theta=alt.Theta("total_time:Q", stack=True),
+        color=alt.Color("topic:N", legend=alt.Legend(title="Temas")),
+        tooltip=[alt.Tooltip("topic:N", title="Tema"), alt.Tooltip("label:N", title="Porcentaje")]
+    )
+    pie = base.mark_arc(outerRadius=160)
+    labels = base.mark_text(radius=190).encode(text="label:N")
+    return (pie + labels).properties(height=420).to_dict()
+
+
+def generate_pie_chart_by_topic(topic_cube):
     """
     Genera una gráfica de torta para mostrar el porcentaje de tiempo total dedicado a cada tema.
     """
-    if df.empty:
+    if topic_cube.empty:
         st.warning("No hay datos disponibles para generar la gráfica.")
         return
 
-    # Agrupar datos por tema y calcular el tiempo total por tema
-    grouped = df.groupby("topic")["total_time"].sum()
-
-    # Configurar el gráfico de torta
-    plt.figure(figsize=(8, 8))
-    plt.pie(
-        grouped,
-        labels=grouped.index,
-        autopct='%1.1f%%',
-        startangle=140
-    )
-    #plt.title("Distribución de tiempo por tema")
-    plt.axis('equal')  # Asegurar que la gráfica sea circular
-    st.pyplot(plt)
+    st.vega_lite_chart(get_pie_chart_spec_by_topic(topic_cube), use_container_width=True)
+
 
-def get_percentage_time_by_age_ranges(df):
+@cached
+def get_percentage_time_by_age_ranges(topic_cube):
     """
     Calcula el porcentaje de tiempo por tema distribuidos en rangos de edades
     a partir de los 60 años en intervalos de 5 años.
     """
-    if df.empty:
+    if topic_cube.empty:
         return pd.DataFrame(columns=["topic", "age_range", "percentage"])
 
-    # Crear rangos de edad
-    df["age_range"] = pd.cut(
-        df["user_age"],
-        bins=list(range(60, df["user_age"].max() + 5, 5)),
+    # Crear rangos de edad (sin modificar el cubo recibido, que puede venir del caché)
+    df = topic_cube.assign(age_range=pd.cut(
+        topic_cube["user_age"],
+        bins=list(range(60, topic_cube["user_age"].max() + 5, 5)),
         right=False,
-        labels=[f"{i}-{i+4}" for i in range(60, df["user_age"].max(), 5)]
-    )
+        labels=[f"{i}-{i+4}" for i in range(60, topic_cube["user_age"].max(), 5)]
+    ))
 
     # Agrupación por tema y rango de edad
     grouped = df.groupby(["topic", "age_range"])["total_time"].sum().reset_index()
@@ -115,16 +295,17 @@ def get_percentage_time_by_age_ranges(df):
 
     return grouped[["topic", "age_range", "percentage"]]
 
-def get_percentage_time_by_gender(df):
+@cached
+def get_percentage_time_by_gender(topic_cube):
     """
     Calcula el porcentaje de tiempo por tema distribuido por género
     y genera un DataFrame en formato largo para la visualización con Altair.
     """
-    if df.empty:
+    if topic_cube.empty:
         return pd.DataFrame(columns=["topic", "user_gender", "percentage"])
 
     # Agrupación por tema y género
-    grouped = df.groupby(["topic", "user_gender"])["total_time"].sum().reset_index()
+    grouped = topic_cube.groupby(["topic", "user_gender"])["total_time"].sum().reset_index()
 
     # Cálculo del porcentaje de tiempo por género dentro de cada tema
     total_time_by_topic = grouped.groupby("topic")["total_time"].transform("sum")
@@ -133,11 +314,14 @@ def get_percentage_time_by_gender(df):
     return grouped
 
 
-def get_total_time_by_topic_age_gender(df):
-    grouped = df.groupby(["topic", "user_age", "user_gender"])["total_time"].sum().unstack()
+@cached
+def get_total_time_by_topic_age_gender(topic_cube):
+    grouped = topic_cube.groupby(["topic", "user_age", "user_gender"])["total_time"].sum().unstack()
     return grouped
 
 
-def get_average_time_per_call_by_topic_age_gender(df):
-    grouped = df.groupby(["topic", "user_age", "user_gender"])["total_time"].mean().unstack()
-    return grouped
\ No newline at end of file
+@cached
+def get_average_time_per_call_by_topic_age_gender(topic_cube):
+    # Promedio por (llamada, tema): tiempo total entre el número de llamadas del grupo
+    grouped = topic_cube.groupby(["topic", "user_age", "user_gender"])[["total_time", "calls"]].sum()
+    return (grouped["total_time"] / grouped["calls"]).unstack()
\ No newline at end of file